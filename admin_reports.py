@@ -0,0 +1,171 @@
+# admin_reports.py
+# گزارش‌های ادمین: خروجی CSV جدول‌های users و payments با cursor سمت سرور (named cursor)
+# که ردیف‌ها را در تکه‌های ثابت از دیتابیس می‌کشد و مستقیم در فایل موقت می‌نویسد (حافظهٔ ثابت)،
+# و آمار داشبورد (مشترکین فعال، درآمد ماهانه، تبدیل /start به پرداخت) از materialized viewها
+# که زمان‌بند دوره‌ای تازه‌شان می‌کند؛ نه اسکن جدول‌ها با هر درخواست.
+import logging
+import os
+import csv
+import tempfile
+from datetime import datetime
+
+import psycopg2
+import psycopg2.extensions
+from psycopg2.extras import DictCursor
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+EXPORT_CHUNK = int(os.getenv("EXPORT_CHUNK", "5000"))   # ردیف در هر رفت‌وبرگشت cursor
+SUBSCRIPTION_PRICE_SUN = int(float(os.getenv("SUBSCRIPTION_PRICE_TRX", "5")) * 1_000_000)
+
+# ستون‌های هر خروجی (ترتیب ستون‌های CSV)
+EXPORTS = {
+    "users": """
+        SELECT telegram_id, registered_at, subscription_expiry, last_free_use, notified_3day
+        FROM users ORDER BY id
+    """,
+    "payments": """
+        SELECT id, telegram_id, tx_hash, status, amount_sun, note, created_at, processed_at
+        FROM payments ORDER BY id
+    """,
+}
+
+# هر view یک ایندکس یکتا دارد تا REFRESH ... CONCURRENTLY خواندن‌ها را بلاک نکند
+VIEWS = {
+    "admin_subscription_stats": ("""
+        SELECT 1 AS id,
+               count(*) AS total_users,
+               count(*) FILTER (WHERE subscription_expiry > now()) AS active_subscribers,
+               count(*) FILTER (WHERE subscription_expiry > now()
+                                  AND subscription_expiry <= now() + interval '7 days') AS expiring_7d,
+               count(*) FILTER (WHERE registered_at > now() - interval '30 days') AS new_users_30d,
+               now() AS refreshed_at
+        FROM users
+    """, "id"),
+    "admin_revenue_monthly": (f"""
+        SELECT date_trunc('month', processed_at)::date AS month,
+               count(*) AS payments,
+               count(DISTINCT telegram_id) AS payers,
+               sum(COALESCE(amount_sun, {SUBSCRIPTION_PRICE_SUN})) / 1000000.0 AS revenue_trx
+        FROM payments
+        WHERE status = 'approved' AND processed_at IS NOT NULL
+        GROUP BY 1
+    """, "month"),
+    "admin_conversion_monthly": ("""
+        SELECT date_trunc('month', u.registered_at)::date AS cohort,
+               count(*) AS registered,
+               count(*) FILTER (WHERE EXISTS (
+                   SELECT 1 FROM payments p WHERE p.telegram_id = u.telegram_id AND p.status = 'approved'
+               )) AS paid
+        FROM users u
+        WHERE u.registered_at IS NOT NULL
+        GROUP BY 1
+    """, "cohort"),
+}
+
+
+def get_db_connection():
+    return psycopg2.connect(DATABASE_URL, cursor_factory=DictCursor)
+
+def init_report_views():
+    """ساخت materialized viewهای آمار (اگر نیستند)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    for name, (query, key) in VIEWS.items():
+        cur.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {query};")
+        cur.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({key});")
+    conn.commit()
+    cur.close()
+    conn.close()
+    logger.info("viewهای آمار ادمین آماده است.")
+
+
+def refresh_report_views():
+    """جاب زمان‌بند (در ترد): تازه‌سازی viewها بدون قفل کردن خواننده‌ها"""
+    try:
+        conn = get_db_connection()
+        conn.autocommit = True
+        cur = conn.cursor()
+        for name in VIEWS:
+            cur.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name};")
+        cur.close()
+        conn.close()
+    except Exception as e:
+        logger.error("خطا در تازه‌سازی viewهای آمار: %s", e, extra={"event": "reports.refresh_error"})
+
+
+# -------------------------
+# داشبورد
+# -------------------------
+def stats_text(months: int = 6) -> str:
+    """متن /stats فقط از viewها (هزینهٔ ثابت مستقل از اندازهٔ جدول‌ها)"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT * FROM admin_subscription_stats")
+    s = cur.fetchone()
+    cur.execute("SELECT * FROM admin_revenue_monthly ORDER BY month DESC LIMIT %s", (months,))
+    revenue = cur.fetchall()
+    cur.execute("SELECT * FROM admin_conversion_monthly ORDER BY cohort DESC LIMIT %s", (months,))
+    conversion = cur.fetchall()
+    cur.close()
+    conn.close()
+
+    if not s:
+        return "آمار هنوز آماده نیست."
+    lines = [
+        "<b>آمار ربات</b>",
+        f"کاربران: {s['total_users']:,} (۳۰ روز اخیر: {s['new_users_30d']:,})",
+        f"مشترکین فعال: {s['active_subscribers']:,} | انقضا تا ۷ روز: {s['expiring_7d']:,}",
+        "",
+        "<b>درآمد ماهانه</b>",
+    ]
+    lines += [f"{r['month']:%Y-%m}: {float(r['revenue_trx']):,.1f} TRX — {r['payments']} پرداخت، {r['payers']} پرداخت‌کننده"
+              for r in revenue] or ["-"]
+    lines += ["", "<b>تبدیل ثبت‌نام به پرداخت (بر اساس ماه ثبت‌نام)</b>"]
+    lines += [f"{r['cohort']:%Y-%m}: {r['paid']}/{r['registered']} ({r['paid'] / r['registered'] * 100:.1f}%)"
+              for r in conversion if r["registered"]] or ["-"]
+    lines += ["", f"به‌روزرسانی: {s['refreshed_at']:%Y-%m-%d %H:%M}"]
+    return "\n".join(lines)
+
+
+# -------------------------
+# خروجی CSV
+# -------------------------
+def export_csv(table: str) -> tuple:
+    """
+    (مسیر فایل موقت، تعداد ردیف). named cursor ردیف‌ها را EXPORT_CHUNK تا EXPORT_CHUNK از سرور می‌آورد،
+    پس حافظه مستقل از اندازهٔ جدول است. صدازننده باید فایل را بعد از ارسال پاک کند.
+    """
+    query = EXPORTS[table]
+    conn = get_db_connection()
+    fd, path = tempfile.mkstemp(prefix=f"{table}_", suffix=".csv")
+    rows = 0
+    try:
+        # cursor معمولی (tuple) — DictRow برای نوشتن CSV فقط سربار است
+        with conn.cursor(name=f"export_{table}", cursor_factory=psycopg2.extensions.cursor) as cur, \
+                os.fdopen(fd, "w", newline="", encoding="utf-8-sig") as f:
+            cur.itersize = EXPORT_CHUNK
+            cur.execute(query)
+            writer = csv.writer(f)
+            header_written = False
+            while True:
+                chunk = cur.fetchmany(EXPORT_CHUNK)
+                if not header_written:
+                    writer.writerow([col.name for col in cur.description])
+                    header_written = True
+                if not chunk:
+                    break
+                writer.writerows(chunk)
+                rows += len(chunk)
+        conn.rollback()   # پایان تراکنش فقط‌خواندنی
+    except Exception:
+        os.remove(path)
+        raise
+    finally:
+        conn.close()
+    return path, rows
+
+
+def export_filename(table: str) -> str:
+    return f"{table}_{datetime.now():%Y%m%d_%H%M}.csv"
@@ -0,0 +1,295 @@
+# alerts.py
+# هشدار قیمت: ذخیره در جدول price_alerts، ایندکس مرتب برای تطبیق با bisect،
+# فید قیمت دوره‌ای از تیکرهای بایننس و ارسال‌کننده‌ی محدود به نرخ.
+import logging
+import os
+import time
+import asyncio
+from bisect import bisect_left, bisect_right, insort
+
+import psycopg2
+from psycopg2.extras import DictCursor
+
+import outbound
+import resilience
+import technical_analysis
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+MAX_ALERTS_PER_USER = int(os.getenv("MAX_ALERTS_PER_USER", "20"))
+ALERT_SEND_WORKERS = int(os.getenv("ALERT_SEND_WORKERS", "30"))  # ارسال همزمان؛ سرعت را outbound تعیین می‌کند
+
+# آخرین قیمت‌ها از فید مشترک: {"BTC": 68000.0, ...}
+PRICES = {}
+PRICES_UPDATED_AT = None
+
+
+def get_db_connection():
+    return psycopg2.connect(DATABASE_URL, cursor_factory=DictCursor)
+
+def init_alerts_table():
+    """ایجاد جدول هشدارهای قیمت"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS price_alerts (
+            id SERIAL PRIMARY KEY,
+            telegram_id BIGINT NOT NULL,
+            symbol TEXT NOT NULL,
+            target_price DOUBLE PRECISION NOT NULL,
+            direction TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT NOW(),
+            triggered_at TIMESTAMP
+        );
+    """)
+    cur.execute("""
+        CREATE INDEX IF NOT EXISTS price_alerts_active_idx
+        ON price_alerts (telegram_id) WHERE triggered_at IS NULL;
+    """)
+    conn.commit()
+    cur.close()
+    conn.close()
+    logger.info("جدول هشدار قیمت آماده است.")
+
+
+# -------------------------
+# ایندکس تطبیق
+# -------------------------
+class AlertIndex:
+    """
+    برای هر نماد دو آرایه‌ی مرتب (صعودی بر اساس قیمت هدف):
+    above → وقتی قیمت به هدف یا بالاتر برسد، below → وقتی به هدف یا پایین‌تر برسد.
+    هر آپدیت قیمت با یک bisect همه‌ی هشدارهای فعال‌شده را پیدا می‌کند.
+    """
+
+    def __init__(self):
+        self.books = {}   # symbol -> {"above": ([prices], [ids]), "below": ([prices], [ids])}
+        self.alerts = {}  # id -> (telegram_id, symbol, direction, target_price)
+
+    def __len__(self):
+        return len(self.alerts)
+
+    def _book(self, symbol: str, direction: str):
+        sides = self.books.setdefault(symbol, {"above": ([], []), "below": ([], [])})
+        return sides[direction]
+
+    def add(self, alert_id: int, telegram_id: int, symbol: str, direction: str, target: float):
+        prices, ids = self._book(symbol, direction)
+        pos = bisect_right(prices, target)
+        prices.insert(pos, target)
+        ids.insert(pos, alert_id)
+        self.alerts[alert_id] = (telegram_id, symbol, direction, target)
+
+    def load(self, rows):
+        """بارگذاری دسته‌ای (مرتب‌سازی یک‌باره به‌جای insert تک‌تک)"""
+        grouped = {}
+        for r in rows:
+            grouped.setdefault((r["symbol"], r["direction"]), []).append((r["target_price"], r["id"]))
+            self.alerts[r["id"]] = (r["telegram_id"], r["symbol"], r["direction"], r["target_price"])
+        for (symbol, direction), items in grouped.items():
+            prices, ids = self._book(symbol, direction)
+            items.extend(zip(prices, ids))
+            items.sort()
+            prices[:] = [p for p, _ in items]
+            ids[:] = [i for _, i in items]
+
+    def remove(self, alert_id: int) -> bool:
+        meta = self.alerts.pop(alert_id, None)
+        if not meta:
+            return False
+        _, symbol, direction, target = meta
+        prices, ids = self._book(symbol, direction)
+        pos = bisect_left(prices, target)
+        while pos < len(prices) and prices[pos] == target:
+            if ids[pos] == alert_id:
+                del prices[pos]
+                del ids[pos]
+                break
+            pos += 1
+        return True
+
+    def match(self, symbol: str, price: float) -> list:
+        """هشدارهای فعال‌شده با این قیمت را برمی‌گرداند و از ایندکس حذف می‌کند"""
+        sides = self.books.get(symbol)
+        if not sides:
+            return []
+        triggered = []
+
+        prices, ids = sides["above"]
+        k = bisect_right(prices, price)
+        if k:
+            triggered.extend(ids[:k])
+            del prices[:k]
+            del ids[:k]
+
+        prices, ids = sides["below"]
+        k = bisect_left(prices, price)
+        if k < len(prices):
+            triggered.extend(ids[k:])
+            del prices[k:]
+            del ids[k:]
+
+        return [(alert_id, *self.alerts.pop(alert_id)) for alert_id in triggered]
+
+    def symbols(self):
+        return [s for s, sides in self.books.items() if sides["above"][0] or sides["below"][0]]
+
+
+INDEX = AlertIndex()
+
+
+def load_active_alerts():
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT id, telegram_id, symbol, direction, target_price FROM price_alerts WHERE triggered_at IS NULL")
+    INDEX.load(cur.fetchall())
+    cur.close()
+    conn.close()
+    logger.info("%s هشدار قیمت فعال بارگذاری شد.", len(INDEX), extra={"event": "alerts.loaded", "alerts": len(INDEX)})
+
+
+# -------------------------
+# عملیات کاربر
+# -------------------------
+def create_alert(telegram_id: int, symbol: str, target: float, current_price: float):
+    """ثبت هشدار؛ جهت از مقایسه با قیمت فعلی تعیین می‌شود. خروجی: (id, direction) یا None اگر به سقف رسیده باشد"""
+    direction = "above" if target > current_price else "below"
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("SELECT COUNT(*) FROM price_alerts WHERE telegram_id = %s AND triggered_at IS NULL", (telegram_id,))
+        if cur.fetchone()[0] >= MAX_ALERTS_PER_USER:
+            return None
+        cur.execute("""
+            INSERT INTO price_alerts (telegram_id, symbol, target_price, direction)
+            VALUES (%s, %s, %s, %s) RETURNING id
+        """, (telegram_id, symbol, target, direction))
+        alert_id = cur.fetchone()["id"]
+        conn.commit()
+    finally:
+        cur.close()
+        conn.close()
+    INDEX.add(alert_id, telegram_id, symbol, direction, target)
+    return alert_id, direction
+
+def list_alerts(telegram_id: int) -> list:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, symbol, target_price, direction FROM price_alerts
+        WHERE telegram_id = %s AND triggered_at IS NULL ORDER BY id
+    """, (telegram_id,))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+def delete_alert(telegram_id: int, alert_id: int) -> bool:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("DELETE FROM price_alerts WHERE id = %s AND telegram_id = %s AND triggered_at IS NULL", (alert_id, telegram_id))
+    deleted = cur.rowcount > 0
+    conn.commit()
+    cur.close()
+    conn.close()
+    if deleted:
+        INDEX.remove(alert_id)
+    return deleted
+
+def mark_triggered(alert_ids: list):
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("UPDATE price_alerts SET triggered_at = NOW() WHERE id = ANY(%s)", (alert_ids,))
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+# -------------------------
+# فید قیمت
+# -------------------------
+def fetch_prices() -> dict:
+    """همه‌ی قیمت‌های جفت‌های USDT با یک درخواست /api/v3/ticker/price"""
+    prices = {}
+    for t in resilience.BINANCE.call_sync(technical_analysis.get_client().get_all_tickers):
+        pair = t.get("symbol", "")
+        if pair.endswith("USDT") and len(pair) > 4:
+            prices[pair[:-4]] = float(t["price"])
+    return prices
+
+async def refresh_prices() -> dict:
+    global PRICES_UPDATED_AT
+    loop = asyncio.get_running_loop()
+    prices = await loop.run_in_executor(None, fetch_prices)
+    PRICES.update(prices)
+    PRICES_UPDATED_AT = time.time()
+    return prices
+
+
+# -------------------------
+# ارسال هشدارها
+# -------------------------
+class AlertSender:
+    """صف هشدارها؛ چند worker پیام‌ها را با اولویت پایین به زمان‌بند outbound می‌دهند"""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.queue = asyncio.Queue()
+        self.tasks = []
+
+    def start(self, bot):
+        if not self.tasks:
+            self.tasks = [asyncio.create_task(self._run(bot)) for _ in range(self.workers)]
+
+    def send(self, chat_id: int, text: str):
+        self.queue.put_nowait((chat_id, text))
+
+    async def _run(self, bot):
+        while True:
+            chat_id, text = await self.queue.get()
+            try:
+                await bot.send_message(chat_id=chat_id, text=text, parse_mode="HTML",
+                                       rate_limit_args=outbound.BULK)
+            except Exception as e:
+                logger.error("خطا در ارسال هشدار قیمت به %s: %s", chat_id, e, extra={"event": "alerts.send_error", "chat": chat_id})
+
+
+SENDER = AlertSender(ALERT_SEND_WORKERS)
+
+
+async def check_price_alerts(bot):
+    """جاب زمان‌بندی‌شده: آپدیت فید قیمت و تطبیق هشدارها"""
+    SENDER.start(bot)
+    try:
+        prices = await refresh_prices()
+    except Exception as e:
+        logger.error("خطا در دریافت فید قیمت: %s", e, extra={"event": "alerts.feed_error"})
+        return
+
+    fired = []
+    for symbol in INDEX.symbols():
+        price = prices.get(symbol)
+        if price is not None:
+            fired.extend((price, *alert) for alert in INDEX.match(symbol, price))
+    if not fired:
+        return
+
+    # اول ثبت در دیتابیس، بعد ارسال: اگر ثبت نشد، بعد از ری‌استارت همین هشدارها دوباره فعال می‌شدند.
+    # در صورت خطا هشدارها به ایندکس برمی‌گردند تا در دور بعد دوباره امتحان شوند.
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, mark_triggered, [a[1] for a in fired])
+    except Exception as e:
+        for price, alert_id, telegram_id, symbol, direction, target in fired:
+            INDEX.add(alert_id, telegram_id, symbol, direction, target)
+        logger.error("خطا در ثبت هشدارهای فعال‌شده؛ ارسال به دور بعد موکول شد: %s", e,
+                     extra={"event": "alerts.mark_failed", "alerts": len(fired)})
+        return
+
+    for price, alert_id, telegram_id, symbol, direction, target in fired:
+        word = "بالاتر" if direction == "above" else "پایین‌تر"
+        SENDER.send(telegram_id,
+                    f"🔔 <b>هشدار قیمت {symbol}</b>\n"
+                    f"قیمت به ${target:,.8g} یا {word} رسید.\n"
+                    f"قیمت فعلی: <b>${price:,.8g}</b>")
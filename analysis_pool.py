@@ -0,0 +1,123 @@
+# analysis_pool.py
+# اجرای تحلیل تکنیکال بیرون از event loop:
+# دریافت کندل‌ها (I/O بلاکینگ) در ThreadPool و زیگزاگ/قالب‌بندی (CPU) در ProcessPool،
+# با سقف همزمانی و صف محدود تا رگبار درخواست‌ها ربات را قفل نکند.
+import os
+import time
+import asyncio
+from concurrent.futures import ProcessPoolExecutor
+
+import bot_logging
+import technical_analysis
+
+TECH_PROCESS_WORKERS = int(os.getenv("TECH_PROCESS_WORKERS", "2"))
+TECH_IO_WORKERS = int(os.getenv("TECH_IO_WORKERS", "4"))
+TECH_MAX_CONCURRENT = int(os.getenv("TECH_MAX_CONCURRENT", "4"))   # تحلیل‌های همزمان
+TECH_MAX_QUEUE = int(os.getenv("TECH_MAX_QUEUE", "20"))            # حداکثر درخواست در انتظار
+
+
+class AnalysisBusy(Exception):
+    """صف تحلیل پر است؛ درخواست فوراً رد می‌شود"""
+
+
+_process_pool = None
+_io_pool = None
+_semaphore = None
+
+STATS = {
+    "waiting": 0,        # عمق فعلی صف
+    "running": 0,
+    "max_waiting": 0,
+    "completed": 0,
+    "failed": 0,
+    "rejected": 0,
+    "cache_hits": 0,
+    "total_wait": 0.0,   # مجموع زمان انتظار در صف (ثانیه)
+    "total_run": 0.0,
+}
+
+
+def _get_pools():
+    global _process_pool, _io_pool, _semaphore
+    if _process_pool is None:
+        _process_pool = ProcessPoolExecutor(max_workers=TECH_PROCESS_WORKERS)
+        _io_pool = bot_logging.ContextThreadPoolExecutor(max_workers=TECH_IO_WORKERS, thread_name_prefix="tech-io")
+        _semaphore = asyncio.Semaphore(TECH_MAX_CONCURRENT)
+    return _process_pool, _io_pool, _semaphore
+
+
+def get_process_pool() -> ProcessPoolExecutor:
+    """ProcessPool مشترک برای کارهای CPU-bound دیگر (مثل اسکنر بازار)"""
+    return _get_pools()[0]
+
+
+async def run_tech_analysis(symbol: str, interval: str = "4h") -> dict:
+    """نسخه async از technical_analysis.analyze — اگر صف پر باشد AnalysisBusy می‌دهد"""
+    cached = technical_analysis.get_cached(symbol, interval)
+    if cached is not None:
+        STATS["cache_hits"] += 1
+        return cached
+
+    if STATS["waiting"] >= TECH_MAX_QUEUE:
+        STATS["rejected"] += 1
+        raise AnalysisBusy()
+
+    process_pool, io_pool, semaphore = _get_pools()
+    loop = asyncio.get_running_loop()
+
+    STATS["waiting"] += 1
+    STATS["max_waiting"] = max(STATS["max_waiting"], STATS["waiting"])
+    queued_at = time.monotonic()
+    try:
+        await semaphore.acquire()
+    finally:
+        STATS["waiting"] -= 1
+
+    started_at = time.monotonic()
+    STATS["total_wait"] += started_at - queued_at
+    STATS["running"] += 1
+    try:
+        # ممکن است در زمان انتظار، درخواست دیگری همین نماد را حساب کرده باشد
+        cached = technical_analysis.get_cached(symbol, interval)
+        if cached is not None:
+            STATS["cache_hits"] += 1
+            return cached
+
+        klines = await loop.run_in_executor(io_pool, technical_analysis.get_klines, symbol.upper(), interval, 1000)
+        state = technical_analysis.get_indicator_state(symbol, interval)
+        result = await loop.run_in_executor(process_pool, technical_analysis.compute_analysis, symbol, klines, state)
+        if "error" not in result:
+            state = result.pop("indicator_state")
+            technical_analysis.store_cached(symbol, interval, klines.tail(technical_analysis.CACHED_CANDLES).copy(), result, state)
+        STATS["completed"] += 1
+        return result
+    except Exception:
+        STATS["failed"] += 1
+        raise
+    finally:
+        STATS["running"] -= 1
+        STATS["total_run"] += time.monotonic() - started_at
+        semaphore.release()
+
+
+def stats_text() -> str:
+    """خلاصه متریک‌های صف برای گزارش ادمین"""
+    done = STATS["completed"] + STATS["failed"]
+    avg_wait = STATS["total_wait"] / done if done else 0
+    avg_run = STATS["total_run"] / done if done else 0
+    return (
+        f"صف تحلیل تکنیکال:\n"
+        f"در انتظار: {STATS['waiting']} (بیشینه: {STATS['max_waiting']})\n"
+        f"در حال اجرا: {STATS['running']} / {TECH_MAX_CONCURRENT}\n"
+        f"انجام‌شده: {STATS['completed']} | خطا: {STATS['failed']} | ردشده: {STATS['rejected']}\n"
+        f"از کش: {STATS['cache_hits']}\n"
+        f"میانگین انتظار: {avg_wait:.2f}s | میانگین اجرا: {avg_run:.2f}s"
+    )
+
+
+def shutdown():
+    global _process_pool, _io_pool, _semaphore
+    if _process_pool is not None:
+        _process_pool.shutdown(wait=False, cancel_futures=True)
+        _io_pool.shutdown(wait=False, cancel_futures=True)
+    _process_pool = _io_pool = _semaphore = None
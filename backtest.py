@@ -0,0 +1,230 @@
+# backtest.py
+# بک‌تست سیگنال روند زیگزاگ (همان «صعودی قوی / نزولی قوی» در analyze()) روی تاریخچهٔ ذخیره‌شدهٔ کندل‌ها.
+# سیگنال هر کندل فقط از ۳۰۰ کندل تا همان لحظه ساخته می‌شود (بدون نگاه به آینده)،
+# ارزیابی (بازده آینده، hit-rate، افت سرمایه) روی کل سری به‌صورت برداری با NumPy
+# و نمادها/پارامترها به‌صورت موازی در ProcessPool اجرا می‌شوند.
+#
+# دریافت تاریخچه:  python backtest.py download BTC ETH --interval 4h --since 2021-01-01
+# اجرا:           python backtest.py run BTC ETH --horizon 6 --depth 12 --deviation 5 --backstep 3
+# sweep:          python backtest.py run --all --deviation 3,5,8 --workers 8 --csv results.csv
+import os
+import csv
+import time
+import argparse
+import itertools
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import technical_analysis
+from klines import Klines
+
+CANDLE_DIR = os.getenv("CANDLE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "candles"))
+WINDOW = 300  # همان پنجرهٔ analyze()
+
+BULLISH = "صعودی قوی"
+BEARISH = "نزولی قوی"
+
+
+# -------------------------
+# تاریخچهٔ کندل‌ها
+# -------------------------
+def _path(symbol: str, interval: str) -> str:
+    return os.path.join(CANDLE_DIR, interval, f"{symbol.upper()}.npz")
+
+def save_history(symbol: str, interval: str, kl: Klines):
+    os.makedirs(os.path.dirname(_path(symbol, interval)), exist_ok=True)
+    np.savez_compressed(_path(symbol, interval), **{name: getattr(kl, name) for name in Klines.__slots__})
+
+def load_history(symbol: str, interval: str):
+    path = _path(symbol, interval)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return Klines(*(data[name] for name in Klines.__slots__))
+
+def stored_symbols(interval: str) -> list:
+    folder = os.path.join(CANDLE_DIR, interval)
+    if not os.path.isdir(folder):
+        return []
+    return sorted(f[:-4] for f in os.listdir(folder) if f.endswith(".npz"))
+
+def download_history(symbol: str, interval: str, since: datetime) -> int:
+    """دریافت صفحه‌به‌صفحهٔ کندل‌های بسته‌شده از since (یا ادامه از آخرین کندل ذخیره‌شده)"""
+    client = technical_analysis.get_client()
+    existing = load_history(symbol, interval)
+    start_ms = int(since.timestamp() * 1000)
+    if existing is not None and len(existing):
+        start_ms = int(existing.open_time[-1]) + 1
+
+    raw = []
+    now_ms = int(time.time() * 1000)
+    while True:
+        page = client.get_klines(symbol=symbol.upper() + "USDT", interval=interval, startTime=start_ms, limit=1000)
+        page = [k for k in page if k[6] < now_ms]  # فقط کندل‌های بسته‌شده
+        if not page:
+            break
+        raw.extend(page)
+        start_ms = page[-1][0] + 1
+        if len(page) < 1000:
+            break
+
+    new = Klines.from_raw(raw)
+    if existing is not None and len(existing):
+        if not len(new):
+            return 0
+        new = Klines(*(np.concatenate([getattr(existing, n), getattr(new, n)]) for n in Klines.__slots__))
+    if len(new):
+        save_history(symbol, interval, new)
+    return len(raw)
+
+
+# -------------------------
+# سیگنال و ارزیابی
+# -------------------------
+def generate_signals(close: np.ndarray, depth=12, deviation=5, backstep=3, window=WINDOW, step=1) -> np.ndarray:
+    """
+    سیگنال هر کندل t از zig_zag روی close[t-window+1 : t+1]: ‎+1 صعودی قوی، ‎-1 نزولی قوی، 0 بقیه.
+    زیگزاگ مسیروابسته است، پس پنجره‌ها جدا حساب می‌شوند؛ با step>1 فقط هر step کندل و بین آن‌ها ثابت.
+    """
+    signals = np.zeros(len(close), dtype=np.int8)
+    last = 0
+    for t in range(window - 1, len(close)):
+        if (t - window + 1) % step == 0:
+            pivots = technical_analysis.zig_zag(close[t - window + 1:t + 1], depth=depth, deviation=deviation, backstep=backstep)
+            trend, _ = technical_analysis.classify_trend(pivots)
+            last = 1 if trend == BULLISH else -1 if trend == BEARISH else 0
+        signals[t] = last
+    return signals
+
+
+def evaluate(close: np.ndarray, signals: np.ndarray, horizon: int) -> dict:
+    """متریک‌ها به‌صورت برداری روی کل سری"""
+    n = len(close)
+    # بازده آیندهٔ horizon کندلی از هر کندل
+    fwd = np.full(n, np.nan)
+    fwd[:n - horizon] = close[horizon:] / close[:n - horizon] - 1
+
+    active = (signals != 0) & ~np.isnan(fwd)
+    directional = fwd[active] * signals[active]
+    hit_rate = float(np.mean(directional > 0)) if directional.size else float("nan")
+    avg_fwd = float(np.mean(directional)) if directional.size else float("nan")
+
+    # استراتژی: پوزیشن = سیگنال کندل قبل (لانگ/شورت/بیرون)، بازده کندل‌به‌کندل
+    bar_ret = np.zeros(n)
+    bar_ret[1:] = close[1:] / close[:-1] - 1
+    strat_ret = np.zeros(n)
+    strat_ret[1:] = signals[:-1] * bar_ret[1:]
+    equity = np.cumprod(1 + strat_ret)
+    drawdown = equity / np.maximum.accumulate(equity) - 1
+
+    changes = np.count_nonzero(np.diff(signals[signals != 0])) + (1 if np.any(signals) else 0)
+    return {
+        "bars": n,
+        "signal_bars": int(np.count_nonzero(signals)),
+        "long_bars": int(np.count_nonzero(signals == 1)),
+        "short_bars": int(np.count_nonzero(signals == -1)),
+        "flips": int(changes),
+        "hit_rate": hit_rate,
+        "avg_fwd_return": avg_fwd,
+        "total_return": float(equity[-1] - 1),
+        "max_drawdown": float(drawdown.min()),
+        "buy_hold": float(close[-1] / close[0] - 1),
+    }
+
+
+def run_one(task: tuple) -> dict:
+    """یک (نماد، پارامترها) — اجرا در پروسس جدا"""
+    symbol, interval, depth, deviation, backstep, horizon, step = task
+    kl = load_history(symbol, interval)
+    row = {"symbol": symbol, "interval": interval, "depth": depth, "deviation": deviation,
+           "backstep": backstep, "horizon": horizon}
+    if kl is None or len(kl) < WINDOW + horizon:
+        row["error"] = "تاریخچهٔ کافی نیست"
+        return row
+    started = time.perf_counter()
+    signals = generate_signals(kl.close, depth, deviation, backstep, step=step)
+    row.update(evaluate(kl.close, signals, horizon))
+    row["seconds"] = round(time.perf_counter() - started, 2)
+    return row
+
+
+def run_backtest(symbols, interval="4h", depths=(12,), deviations=(5,), backsteps=(3,),
+                 horizon=6, step=1, workers=None) -> list:
+    tasks = [
+        (s, interval, d, dev, b, horizon, step)
+        for s, d, dev, b in itertools.product(symbols, depths, deviations, backsteps)
+    ]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_one, tasks, chunksize=max(1, len(tasks) // ((workers or os.cpu_count() or 1) * 4))))
+
+
+# -------------------------
+# CLI
+# -------------------------
+def _ints(text: str) -> list:
+    return [int(x) for x in text.split(",") if x.strip()]
+
+def _print_rows(rows: list):
+    print(f"{'symbol':<10}{'d/dev/b':<10}{'signals':>8}{'flips':>7}{'hit%':>8}{'avg fwd%':>10}"
+          f"{'return%':>10}{'maxDD%':>9}{'B&H%':>9}")
+    for r in rows:
+        params = f"{r['depth']}/{r['deviation']}/{r['backstep']}"
+        if "error" in r:
+            print(f"{r['symbol']:<10}{params:<10}  {r['error']}")
+            continue
+        print(f"{r['symbol']:<10}{params:<10}{r['signal_bars']:>8}{r['flips']:>7}{r['hit_rate'] * 100:>8.1f}"
+              f"{r['avg_fwd_return'] * 100:>10.2f}{r['total_return'] * 100:>10.1f}{r['max_drawdown'] * 100:>9.1f}"
+              f"{r['buy_hold'] * 100:>9.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="بک‌تست سیگنال زیگزاگ")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    dl = sub.add_parser("download", help="دریافت/تکمیل تاریخچهٔ کندل‌ها از بایننس")
+    dl.add_argument("symbols", nargs="+")
+    dl.add_argument("--interval", default="4h")
+    dl.add_argument("--since", default="2021-01-01")
+
+    run = sub.add_parser("run", help="اجرای بک‌تست روی تاریخچهٔ ذخیره‌شده")
+    run.add_argument("symbols", nargs="*")
+    run.add_argument("--all", action="store_true", help="همهٔ نمادهای ذخیره‌شده")
+    run.add_argument("--interval", default="4h")
+    run.add_argument("--depth", type=_ints, default=[12])
+    run.add_argument("--deviation", type=_ints, default=[5])
+    run.add_argument("--backstep", type=_ints, default=[3])
+    run.add_argument("--horizon", type=int, default=6, help="افق بازده آینده (تعداد کندل)")
+    run.add_argument("--step", type=int, default=1, help="محاسبهٔ سیگنال هر چند کندل")
+    run.add_argument("--workers", type=int, default=None)
+    run.add_argument("--csv", help="ذخیرهٔ نتایج در CSV")
+
+    args = parser.parse_args()
+
+    if args.command == "download":
+        since = datetime.fromisoformat(args.since)
+        for symbol in args.symbols:
+            count = download_history(symbol, args.interval, since)
+            print(f"{symbol.upper()}: {count} کندل جدید")
+        return
+
+    symbols = stored_symbols(args.interval) if args.all else [s.upper() for s in args.symbols]
+    if not symbols:
+        parser.error("نمادی مشخص نشده (یا --all بدون تاریخچهٔ ذخیره‌شده)")
+
+    started = time.perf_counter()
+    rows = run_backtest(symbols, args.interval, args.depth, args.deviation, args.backstep,
+                        args.horizon, args.step, args.workers)
+    _print_rows(rows)
+    print(f"\n{len(rows)} اجرا در {time.perf_counter() - started:.1f} ثانیه")
+
+    if args.csv:
+        fields = sorted({k for r in rows for k in r})
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    main()
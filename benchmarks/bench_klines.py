@@ -0,0 +1,90 @@
+# benchmarks/bench_klines.py
+# مقایسه‌ی پارس کندل‌ها: مسیر قدیمی (DataFrame دوازده‌ستونی pandas) در برابر klines.Klines.
+# زمان پارس و حافظه‌ی هر سری را گزارش می‌کند. نیاز به pandas فقط برای همین مقایسه است.
+# اجرا:  python benchmarks/bench_klines.py [--rows 1000] [--repeat 200]
+import os
+import sys
+import time
+import random
+import argparse
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from klines import Klines
+
+COLUMNS = [
+    'timestamp', 'open', 'high', 'low', 'close', 'volume',
+    'close_time', 'quote_volume', 'trades', 'tb_base', 'tb_quote', 'ignore'
+]
+
+
+def synthetic_raw(rows: int, seed: int = 42, interval_ms: int = 4 * 3600 * 1000) -> list:
+    """پاسخ ساختگی با همان قالب /api/v3/klines (قیمت‌ها به‌صورت رشته)"""
+    rnd = random.Random(seed)
+    price = 30000.0
+    t0 = 1_600_000_000_000
+    raw = []
+    for i in range(rows):
+        o = price
+        price = max(1.0, price * (1 + rnd.gauss(0, 0.01)))
+        h = max(o, price) * (1 + abs(rnd.gauss(0, 0.003)))
+        l = min(o, price) * (1 - abs(rnd.gauss(0, 0.003)))
+        v = abs(rnd.gauss(1000, 300))
+        open_time = t0 + i * interval_ms
+        raw.append([
+            open_time, f"{o:.8f}", f"{h:.8f}", f"{l:.8f}", f"{price:.8f}", f"{v:.8f}",
+            open_time + interval_ms - 1, f"{v * price:.8f}", rnd.randint(100, 5000),
+            f"{v / 2:.8f}", f"{v * price / 2:.8f}", "0",
+        ])
+    return raw
+
+
+def parse_dataframe(raw):
+    """همان کاری که get_klines قبلاً انجام می‌داد"""
+    import pandas as pd
+    df = pd.DataFrame(raw, columns=COLUMNS)
+    df['close'] = pd.to_numeric(df['close'])
+    df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
+    return df[['timestamp', 'close']]
+
+
+def parse_compact(raw):
+    return Klines.from_raw(raw)
+
+
+def bench(fn, raw, repeat):
+    fn(raw)  # warm-up (ایمپورت‌ها و کش‌های داخلی)
+    t = time.perf_counter()
+    for _ in range(repeat):
+        fn(raw)
+    per_call = (time.perf_counter() - t) / repeat
+
+    tracemalloc.start()
+    obj = fn(raw)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return per_call, current, peak, obj
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک پارس کندل‌ها")
+    parser.add_argument("--rows", type=int, default=1000)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    raw = synthetic_raw(args.rows)
+    print(f"{args.rows} کندل، {args.repeat} تکرار\n")
+    print(f"{'مسیر':<12}{'زمان/سری':>14}{'حافظه نگه‌داشته':>18}{'پیک':>12}")
+    rows = [("dataframe", parse_dataframe), ("klines", parse_compact)]
+    results = {}
+    for name, fn in rows:
+        per_call, current, peak, obj = bench(fn, raw, args.repeat)
+        results[name] = per_call
+        print(f"{name:<12}{per_call * 1e6:>11.1f} us{current / 1024:>15.1f} KB{peak / 1024:>9.1f} KB")
+
+    print(f"\nسرعت klines نسبت به dataframe: {results['dataframe'] / results['klines']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
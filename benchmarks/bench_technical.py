@@ -0,0 +1,229 @@
+# benchmarks/bench_technical.py
+# میکروبنچمارک مسیر داغ تحلیل تکنیکال با دروازهٔ پسرفت:
+# zig_zag (سری ساختگی و ضبط‌شده)، پارس get_klines از پاسخ ضبط‌شدهٔ بایننس،
+# تاریخ شمسی نقاط چرخش (مسیر قبلی تک‌به‌تک با jdatetime در برابر تبدیل دسته‌ای/کش‌شدهٔ shamsi) و analyze() کامل با کلاینت جعلی — همه آفلاین و در چند ثانیه.
+# زمان هر عملیات و پیک حافظه/تعداد تخصیص با baseline.json مقایسه می‌شود و اگر بیش از
+# --threshold درصد بدتر شده باشد خروجی با کد ۱ تمام می‌شود.
+#
+# اجرا:              python benchmarks/bench_technical.py
+# به‌روزرسانی مبنا:   python benchmarks/bench_technical.py --update-baseline
+# ضبط فیکسچر تازه:   python benchmarks/bench_technical.py --record BTC   (نیاز به اینترنت)
+import gc
+import os
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+
+import numpy as np
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+import shamsi
+import technical_analysis
+from klines import Klines
+
+FIXTURE = os.path.join(BENCH_DIR, "fixtures", "klines_btcusdt_4h.json")
+BASELINE = os.path.join(BENCH_DIR, "baseline.json")
+ALLOC_SLACK = 5
+# کیس‌های زیر این زمان (میکروثانیه) نسبت به نویز زمان‌بند حساس‌اند؛ با دورهای طولانی‌تر و بیشتر اندازه‌گیری می‌شوند
+MICRO_US = 50
+MICRO_TIME_FACTOR = 4
+MICRO_ROUNDS_FACTOR = 3
+
+
+class StubClient:
+    """جایگزین binance Client: همان پاسخ ضبط‌شده را برمی‌گرداند"""
+
+    def __init__(self, raw):
+        self.raw = raw
+
+    def get_klines(self, symbol, interval, limit=500, **kwargs):
+        return self.raw[-limit:]
+
+
+def load_fixture() -> list:
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def record_fixture(symbol: str, interval: str = "4h"):
+    from binance.client import Client
+    raw = Client().get_klines(symbol=symbol.upper() + "USDT", interval=interval, limit=1000)
+    os.makedirs(os.path.dirname(FIXTURE), exist_ok=True)
+    with open(FIXTURE, "w") as f:
+        json.dump(raw, f, separators=(",", ":"))
+    print(f"{len(raw)} کندل در {FIXTURE} ذخیره شد")
+
+
+def synthetic_close(n: int, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    return 30000 * np.exp(np.cumsum(rng.normal(0, 0.012, n)))
+
+
+def legacy_to_shamsi(dt):
+    """مسیر قبلی: یک شیء jdatetime و strftime برای هر نقطه (برای مقایسه با shamsi)"""
+    import jdatetime
+    return jdatetime.datetime.fromgregorian(datetime=dt).strftime(shamsi.FORMAT_TECH)
+
+
+# -------------------------
+# کیس‌ها: هر کدام تابع بدون آرگومان (آماده‌سازی بیرون از زمان‌گیری)
+# -------------------------
+def build_cases(raw: list) -> dict:
+    kl = Klines.from_raw(raw)
+    recent = kl.tail(300)
+    synthetic = synthetic_close(1000)
+    pivots = technical_analysis.zig_zag(recent, depth=12, deviation=5, backstep=3)
+    pivot_times = [recent.datetime_at(idx) for idx, _, _ in pivots]
+    pivot_ms = recent.open_time[[idx for idx, _, _ in pivots]]
+
+    def shamsi_batch_cold():
+        shamsi.clear()
+        return shamsi.format_ms_many(pivot_ms, shamsi.FORMAT_TECH)
+
+    def analyze_e2e():
+        technical_analysis.CACHE.clear()
+        return technical_analysis.analyze("BTC", "4h")
+
+    def analyze_incremental():
+        # نتیجه منقضی ولی وضعیت اندیکاتورها در کش: مسیر عادی بعد از اولین تحلیل هر نماد
+        technical_analysis.analyze("BTC", "4h")
+        recent, result, _, state = technical_analysis.CACHE["BTC_4h"]
+        technical_analysis.CACHE["BTC_4h"] = (recent, result, 0, state)
+        return technical_analysis.analyze("BTC", "4h")
+
+    return {
+        "zig_zag_synthetic_1000": lambda: technical_analysis.zig_zag(synthetic, 12, 5, 3),
+        "zig_zag_recorded_300": lambda: technical_analysis.zig_zag(recent, 12, 5, 3),
+        "get_klines_parse_1000": lambda: technical_analysis.get_klines("BTC", "4h", 1000),
+        "to_shamsi_per_pivot": lambda: [technical_analysis.to_shamsi(t) for t in pivot_times],
+        "shamsi_legacy_per_pivot": lambda: [legacy_to_shamsi(t) for t in pivot_times],
+        "shamsi_batch_cold": shamsi_batch_cold,
+        "shamsi_batch_memo": lambda: shamsi.format_ms_many(pivot_ms, shamsi.FORMAT_TECH),
+        "analyze_end_to_end": analyze_e2e,
+        "analyze_incremental": analyze_incremental,
+    }
+
+
+def measure(fn, min_time: float, rounds: int) -> dict:
+    fn()  # warm-up (ایمپورت‌های تنبل و کش‌های داخلی)
+    # تعداد تکرار هر دور طوری که هر دور حدود min_time طول بکشد
+    loops = 1
+    while True:
+        t = time.perf_counter()
+        for _ in range(loops):
+            fn()
+        elapsed = time.perf_counter() - t
+        if elapsed >= min_time or loops >= 1_000_000:
+            break
+        loops *= 2
+    samples = []
+    # مثل timeit: GC وسط دور زمان‌گیری را به کیس‌های میکرو تحمیل نکند
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            t = time.perf_counter()
+            for _ in range(loops):
+                fn()
+            samples.append((time.perf_counter() - t) / loops)
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+    # کمینهٔ دورها (مثل timeit): کمترین اثر از نویز زمان‌بند سیستم
+    per_op = min(samples)
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    fn()
+    after = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    allocs = sum(s.count_diff for s in after.compare_to(before, "lineno") if s.count_diff > 0)
+    return {
+        "us_per_op": per_op * 1e6,
+        "ops_per_sec": 1 / per_op if per_op else float("inf"),
+        "peak_kb": peak / 1024,
+        "allocs": allocs,
+    }
+
+
+def compare(results: dict, baseline: dict, threshold: float) -> list:
+    """لیست پسرفت‌ها: (کیس، متریک، مبنا، فعلی، درصد)"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric in ("us_per_op", "peak_kb", "allocs"):
+            old, new = base.get(metric), current[metric]
+            if not old:
+                continue
+            change = (new - old) / old * 100
+            # شمارش تخصیص‌های کوچک نویز دارد؛ چند بلوک بیشتر پسرفت حساب نمی‌شود
+            if metric == "allocs" and new - old <= ALLOC_SLACK:
+                continue
+            if change > threshold:
+                regressions.append((name, metric, old, new, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="بنچمارک تحلیل تکنیکال با مقایسه با مبنا")
+    parser.add_argument("--threshold", type=float, default=25.0, help="حداکثر درصد بدتر شدن مجاز")
+    parser.add_argument("--min-time", type=float, default=0.05, help="حداقل زمان هر دور (ثانیه)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--only", help="فقط کیس‌هایی که این عبارت را دارند")
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--record", metavar="SYMBOL", help="ضبط فیکسچر از بایننس و خروج")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixture(args.record)
+        return 0
+
+    raw = load_fixture()
+    technical_analysis._client = StubClient(raw)
+    cases = build_cases(raw)
+    if args.only:
+        cases = {k: v for k, v in cases.items() if args.only in k}
+
+    baseline = {}
+    if os.path.exists(BASELINE):
+        with open(BASELINE) as f:
+            baseline = json.load(f)
+
+    print(f"{'کیس':<26}{'us/op':>12}{'ops/s':>12}{'peak KB':>10}{'allocs':>9}{'Δ زمان':>10}")
+    results = {}
+    for name, fn in cases.items():
+        r = measure(fn, args.min_time, args.rounds)
+        if r["us_per_op"] < MICRO_US:
+            r = measure(fn, args.min_time * MICRO_TIME_FACTOR, args.rounds * MICRO_ROUNDS_FACTOR)
+        results[name] = r
+        old = baseline.get(name, {}).get("us_per_op")
+        delta = f"{(r['us_per_op'] - old) / old * 100:+.1f}%" if old else "-"
+        print(f"{name:<26}{r['us_per_op']:>12.1f}{r['ops_per_sec']:>12.0f}{r['peak_kb']:>10.1f}{r['allocs']:>9}{delta:>10}")
+
+    if args.update_baseline:
+        baseline.update({k: {m: round(v[m], 3) for m in ("us_per_op", "peak_kb", "allocs")} for k, v in results.items()})
+        with open(BASELINE, "w") as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nمبنا در {BASELINE} به‌روز شد")
+        return 0
+
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\nپسرفت بیش از {args.threshold:.0f}%:")
+        for name, metric, old, new, change in regressions:
+            print(f"  {name} {metric}: {old:.1f} → {new:.1f} ({change:+.1f}%)")
+        return 1
+    print("\nبدون پسرفت" if baseline else "\nمبنایی وجود ندارد؛ با --update-baseline بسازید")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,70 @@
+# benchmarks/startup_time.py
+# اندازه‌گیری زمان ایمپورت main.py (تا لحظه‌ای که ربات آماده‌ی polling است) در پروسس تازه.
+# اجرا:  python benchmarks/startup_time.py [--runs 5] [--top 15]
+import os
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# مقادیر ساختگی تا main.py در ایمپورت خطا ندهد؛ هیچ اتصالی در زمان ایمپورت ساخته نمی‌شود
+DUMMY_ENV = {
+    "BOT_TOKEN": "0:startup-benchmark",
+    "DATABASE_URL": "postgresql://localhost/startup_benchmark",
+}
+
+SNIPPET = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+
+
+def _env():
+    env = dict(os.environ)
+    for k, v in DUMMY_ENV.items():
+        env.setdefault(k, v)
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    return env
+
+
+def measure(runs: int) -> list:
+    times = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", SNIPPET], cwd=ROOT, env=_env(),
+                             capture_output=True, text=True, check=True)
+        times.append(float(out.stdout.strip().splitlines()[-1]))
+    return times
+
+
+def top_imports(top: int) -> list:
+    """سنگین‌ترین ایمپورت‌های مستقیم main بر اساس خروجی -X importtime (cumulative، میکروثانیه)"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"], cwd=ROOT, env=_env(),
+                         capture_output=True, text=True, check=True)
+    rows = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum_us, name = line[len("import time:"):].split("|")
+        name = name[1:]
+        if name.startswith("  ") and not name.startswith("    "):  # فقط فرزندان مستقیم main
+            rows.append((int(cum_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="زمان استارت ربات")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    times = measure(args.runs)
+    print(f"import main: median {statistics.median(times) * 1000:.1f} ms | "
+          f"min {min(times) * 1000:.1f} ms | max {max(times) * 1000:.1f} ms ({args.runs} runs)")
+
+    print(f"\nسنگین‌ترین ایمپورت‌ها (cumulative):")
+    for cum_us, name in top_imports(args.top):
+        print(f"  {cum_us / 1000:8.1f} ms  {name}")
+
+
+if __name__ == "__main__":
+    main()
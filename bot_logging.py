@@ -0,0 +1,194 @@
+# bot_logging.py
+# لاگ ساخت‌یافته (JSON) و غیرمسدودکننده:
+# هندلرها فقط رکورد را در یک صف محدود می‌گذارند (QueueHandler)؛ نوشتن روی stdout در
+# ترد جداگانهٔ QueueListener انجام می‌شود. اگر صف پر باشد رکورد دور ریخته و شمرده می‌شود
+# تا لاگ هیچ‌وقت event loop را معطل نکند.
+import os
+import sys
+import copy
+import json
+import time
+import queue
+import atexit
+import random
+import logging
+import functools
+import contextvars
+import logging.handlers
+from concurrent.futures import ThreadPoolExecutor
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+# نرخ نمونه‌برداری هر سطح (۰ تا ۱)؛ مثلاً LOG_SAMPLE_DEBUG=0.05
+SAMPLE_RATES = {
+    logging.DEBUG: float(os.getenv("LOG_SAMPLE_DEBUG", "1")),
+    logging.INFO: float(os.getenv("LOG_SAMPLE_INFO", "1")),
+}
+
+# زمینهٔ هر آپدیت؛ در رکوردهای لاگ همان هندلر خودکار اضافه می‌شود
+current_handler = contextvars.ContextVar("handler", default=None)
+current_user = contextvars.ContextVar("user_id", default=None)
+current_symbol = contextvars.ContextVar("symbol", default=None)
+
+STATS = {"dropped": 0, "sampled_out": 0}
+
+_listener = None
+
+# فیلدهای استاندارد LogRecord که نباید در JSON تکرار شوند
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "sample"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED and not key.startswith("_") and value is not None:
+                data[key] = value
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class ContextFilter(logging.Filter):
+    """افزودن handler / user_id / symbol از contextvars (در ترد صدازننده اجرا می‌شود)"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if getattr(record, "handler", None) is None:
+            record.handler = current_handler.get()
+        if getattr(record, "user_id", None) is None:
+            record.user_id = current_user.get()
+        if getattr(record, "symbol", None) is None:
+            record.symbol = current_symbol.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """
+    نمونه‌برداری: نرخ هر سطح از SAMPLE_RATES، یا برای یک رویداد پرتکرار
+    با extra={"sample": 0.1}. هشدار و خطا هیچ‌وقت حذف نمی‌شوند.
+    """
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = getattr(record, "sample", None)
+        if rate is None:
+            rate = SAMPLE_RATES.get(record.levelno, 1.0)
+        if rate >= 1 or random.random() < rate:
+            return True
+        STATS["sampled_out"] += 1
+        return False
+
+
+class ContextThreadPoolExecutor(ThreadPoolExecutor):
+    """
+    ThreadPoolExecutor که زمینهٔ لاگ صدازننده (contextvars) را همراه کار به ترد کارگر می‌برد؛
+    loop.run_in_executor خودش این کار را نمی‌کند و لاگ‌های داخل ترد بی handler/user_id می‌ماندند.
+    """
+
+    def submit(self, fn, /, *args, **kwargs):
+        return super().submit(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler که وقتی صف پر است به‌جای بلاک شدن، رکورد را دور می‌ریزد"""
+
+    def prepare(self, record):
+        # مثل QueueHandler.prepare، ولی traceback جدا در exc_text می‌ماند تا فیلد exc در JSON باشد
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            STATS["dropped"] += 1
+
+
+def setup_logging():
+    """پیکربندی لاگر ریشه؛ یک بار در شروع برنامه"""
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    stream = logging.StreamHandler(sys.stdout)
+    stream.setFormatter(JsonFormatter())
+
+    handler = DroppingQueueHandler(log_queue)
+    handler.addFilter(ContextFilter())
+    handler.addFilter(SamplingFilter())
+
+    root = logging.getLogger()
+    root.handlers[:] = [handler]
+    root.setLevel(LOG_LEVEL)
+    # کتابخانه‌های پرحرف
+    for noisy in ("httpx", "apscheduler", "urllib3"):
+        logging.getLogger(noisy).setLevel(logging.WARNING)
+
+    _listener = logging.handlers.QueueListener(log_queue, stream, respect_handler_level=False)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def stats_text() -> str:
+    return f"لاگ: {STATS['dropped']} رکورد دورریخته (صف پر)، {STATS['sampled_out']} حذف با نمونه‌برداری"
+
+
+def logged_handler(name: str, symbol_from=None, sample: float = None):
+    """
+    دکوریتور هندلرهای تلگرام: زمینهٔ لاگ (handler، user_id، symbol) را تنظیم
+    و در پایان latency را ثبت می‌کند. symbol_from(update) نماد را از آپدیت درمی‌آورد؛
+    sample نرخ نمونه‌برداری لاگ latency برای هندلرهای پرتکرار است.
+    """
+    logger = logging.getLogger("handlers")
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update, context):
+            user = getattr(update, "effective_user", None)
+            tokens = [
+                current_handler.set(name),
+                current_user.set(user.id if user else None),
+                current_symbol.set(symbol_from(update) if symbol_from else None),
+            ]
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                return await handler(update, context)
+            except Exception:
+                status = "error"
+                logger.exception("خطای هندلر")
+                raise
+            finally:
+                logger.info("handler.done", extra={
+                    "event": "handler.done",
+                    "status": status,
+                    "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+                    "sample": sample,
+                })
+                current_symbol.reset(tokens[2])
+                current_user.reset(tokens[1])
+                current_handler.reset(tokens[0])
+        return wrapper
+    return decorator
@@ -0,0 +1,145 @@
+# charts.py
+# نمودار PNG زیگزاگ (قیمت کلوز + نقاط چرخش + برچسب روند) سمت سرور.
+# هر نمودار با کلید (نماد، تایم‌فریم، زمان آخرین کندل بسته‌شده) فقط یک بار رندر می‌شود؛
+# فایل روی دیسک با هش همین کلید ذخیره و file_id تلگرام برای ارسال‌های بعدی نگه داشته می‌شود.
+import logging
+import os
+import time
+import asyncio
+import hashlib
+from collections import Counter
+
+import technical_analysis
+import analysis_pool
+
+logger = logging.getLogger(__name__)
+
+CHART_DIR = os.getenv("CHART_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "charts"))
+CHART_WINDOW = technical_analysis.ANALYSIS_WINDOW
+HOT_SYMBOLS = int(os.getenv("CHART_HOT_SYMBOLS", "20"))   # چند نماد پرتقاضا از قبل رندر شوند
+CHART_MAX_AGE_HOURS = 48
+
+FILE_IDS = {}      # chart key -> file_id تلگرام
+HOT = Counter()    # تعداد درخواست نمودار برای هر (symbol, interval)
+STATS = {"rendered": 0, "uploads": 0, "file_id_hits": 0}
+_inflight = {}     # chart key -> Future رندر در حال اجرا (تا رندر تکراری نشود)
+
+
+def closed_window(klines, now_ms: int = None):
+    """(open_time, close) همان پنجرهٔ کندل‌های بسته‌شده‌ای که زیگزاگ متن تحلیل روی آن حساب می‌شود"""
+    window = technical_analysis.analysis_window(klines, now_ms)
+    return window.open_time, window.close
+
+
+def chart_key(symbol: str, interval: str, last_open_time: int) -> str:
+    return hashlib.sha256(f"{symbol.upper()}|{interval}|{int(last_open_time)}".encode()).hexdigest()[:32]
+
+def chart_path(key: str) -> str:
+    return os.path.join(CHART_DIR, f"{key}.png")
+
+
+def render_chart_png(symbol: str, interval: str, open_time, close, path: str) -> str:
+    """اجرا در ProcessPool: رسم و ذخیرهٔ اتمیک PNG"""
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import matplotlib.dates as mdates
+    import numpy as np
+
+    pivots = technical_analysis.zig_zag(close, depth=12, deviation=5, backstep=3)
+    trend, _ = technical_analysis.classify_trend(pivots)
+    times = (np.asarray(open_time, dtype="int64")).astype("datetime64[ms]")
+
+    fig, ax = plt.subplots(figsize=(10, 5), dpi=100)
+    ax.plot(times, close, color="#888888", linewidth=1, label="close")
+    if pivots:
+        idx = [p[0] for p in pivots]
+        ax.plot(times[idx], [p[1] for p in pivots], color="#1f77b4", linewidth=1.8, label="ZigZag")
+        for i, price, ptype in pivots[1:]:
+            ax.scatter(times[i], price, color="#2ca02c" if ptype == "high" else "#d62728", s=25, zorder=3)
+    ax.set_title(f"{symbol.upper()}/USDT {interval} — ZigZag(12, 5, 3)")
+    # برچسب لاتین، چون فونت پیش‌فرض matplotlib حروف فارسی را درست نمایش نمی‌دهد
+    label = {"صعودی قوی": "Strong uptrend", "نزولی قوی": "Strong downtrend", "رنج / ساید وی": "Range"}.get(trend, "Undetermined")
+    ax.text(0.01, 0.97, label, transform=ax.transAxes, va="top", fontsize=11, fontweight="bold",
+            bbox={"facecolor": "white", "alpha": 0.8, "edgecolor": "#cccccc"})
+    ax.xaxis.set_major_formatter(mdates.DateFormatter("%m-%d"))
+    ax.grid(alpha=0.3)
+    ax.legend(loc="lower right")
+    fig.tight_layout()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    fig.savefig(tmp, format="png")
+    plt.close(fig)
+    os.replace(tmp, path)
+    return path
+
+
+async def ensure_chart(symbol: str, interval: str, klines):
+    """کلید نمودار آخرین کندل بسته‌شده؛ اگر فایل و file_id هیچ‌کدام نبود، در ProcessPool رندر می‌شود"""
+    open_time, close = closed_window(klines)
+    if len(close) < 2:
+        return None
+    key = chart_key(symbol, interval, open_time[-1])
+    if key in FILE_IDS:
+        return key
+    path = chart_path(key)
+    if os.path.exists(path):
+        return key
+    if key not in _inflight:
+        loop = asyncio.get_running_loop()
+        _inflight[key] = loop.run_in_executor(analysis_pool.get_process_pool(), render_chart_png,
+                                              symbol, interval, open_time, close, path)
+        STATS["rendered"] += 1
+    try:
+        await asyncio.shield(_inflight[key])
+    finally:
+        if key in _inflight and _inflight[key].done():
+            del _inflight[key]
+    return key
+
+
+async def send_chart(message, symbol: str, interval: str, klines, caption: str = None):
+    """ارسال نمودار به‌صورت reply؛ file_id اولین آپلود برای دفعات بعد ذخیره می‌شود"""
+    HOT[(symbol.upper(), interval)] += 1
+    key = await ensure_chart(symbol, interval, klines)
+    if not key:
+        return None
+    if key in FILE_IDS:
+        STATS["file_id_hits"] += 1
+        return await message.reply_photo(photo=FILE_IDS[key], caption=caption)
+    STATS["uploads"] += 1
+    with open(chart_path(key), "rb") as f:
+        sent = await message.reply_photo(photo=f, caption=caption)
+    if sent and sent.photo:
+        FILE_IDS[key] = sent.photo[-1].file_id
+    return sent
+
+
+async def prerender_hot():
+    """جاب پس‌زمینه: برای نمادهای پرتقاضا، نمودار کندل تازه‌بسته‌شده را از قبل بساز"""
+    loop = asyncio.get_running_loop()
+    for (symbol, interval), _ in HOT.most_common(HOT_SYMBOLS):
+        try:
+            klines = await loop.run_in_executor(None, technical_analysis.get_klines, symbol, interval,
+                                                technical_analysis.CACHED_CANDLES)
+            if klines is not None:
+                await ensure_chart(symbol, interval, klines)
+        except Exception as e:
+            logger.error("خطا در رندر پس‌زمینهٔ نمودار %s: %s", symbol, e, extra={"event": "chart.prerender_error", "symbol": symbol})
+    _cleanup()
+
+
+def _cleanup():
+    """حذف فایل‌های قدیمی و file_idهای بی‌فایل"""
+    if not os.path.isdir(CHART_DIR):
+        return
+    cutoff = time.time() - CHART_MAX_AGE_HOURS * 3600
+    for name in os.listdir(CHART_DIR):
+        path = os.path.join(CHART_DIR, name)
+        try:
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                FILE_IDS.pop(name[:-4], None)
+        except OSError:
+            pass
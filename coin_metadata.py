@@ -0,0 +1,193 @@
+# coin_metadata.py
+# متادیتای ثابت کوین‌ها (توضیحات، وبسایت، وایت‌پیپر، کانترکت‌ها) در Postgres،
+# پرشده به‌صورت دسته‌ای از endpoint چند-idی CMC و تازه‌سازی روزانه،
+# تا دکمهٔ اطلاعات تکمیلی برای هر کلیک فقط یک کوت از CMC بگیرد.
+import logging
+import os
+import json
+import requests
+import psycopg2
+from psycopg2.extras import DictCursor, execute_values
+
+import resilience
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+METADATA_TOP_N = int(os.getenv("METADATA_TOP_N", "1000"))  # چند کوین برتر در هر تازه‌سازی
+INFO_BATCH_SIZE = 100                                        # هر ۱۰۰ id = ۱ کردیت
+
+CMC_BASE = "https://pro-api.coinmarketcap.com"
+
+
+def get_db_connection():
+    return psycopg2.connect(DATABASE_URL, cursor_factory=DictCursor)
+
+def init_metadata_table():
+    """ایجاد جدول متادیتای کوین‌ها"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS coin_metadata (
+            symbol TEXT PRIMARY KEY,
+            cmc_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            description TEXT,
+            website TEXT,
+            whitepaper TEXT,
+            contracts JSONB DEFAULT '[]',
+            updated_at TIMESTAMP DEFAULT NOW()
+        );
+    """)
+    cur.execute("ALTER TABLE coin_metadata ADD COLUMN IF NOT EXISTS cmc_rank INTEGER;")
+    conn.commit()
+    cur.close()
+    conn.close()
+    logger.info("جدول متادیتای کوین‌ها آماده است.")
+
+def metadata_count() -> int:
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT COUNT(*) FROM coin_metadata")
+    count = cur.fetchone()[0]
+    cur.close()
+    conn.close()
+    return count
+
+
+def _parse_info(data: dict) -> dict:
+    """تبدیل یک آیتم /cryptocurrency/info به ردیف جدول"""
+    urls = data.get("urls") or {}
+    contracts = []
+    for c in data.get("contract_address") or data.get("contracts") or []:
+        addr = c.get("contract_address") or c.get("address")
+        platform = c.get("platform")
+        net = (platform.get("name") if isinstance(platform, dict) else platform) or c.get("name")
+        if addr:
+            contracts.append({"network": net, "address": addr})
+    return {
+        "symbol": data["symbol"].upper(),
+        "cmc_id": data["id"],
+        "name": data.get("name", data["symbol"]),
+        "description": (data.get("description") or "")[:3000],
+        "website": (urls.get("website") or ["ندارد"])[0],
+        "whitepaper": (urls.get("technical_doc") or ["ندارد"])[0],
+        "contracts": contracts,
+    }
+
+def _upsert(rows: list):
+    if not rows:
+        return
+    conn = get_db_connection()
+    cur = conn.cursor()
+    execute_values(cur, """
+        INSERT INTO coin_metadata (symbol, cmc_id, name, description, website, whitepaper, contracts, cmc_rank, updated_at)
+        VALUES %s
+        ON CONFLICT (symbol) DO UPDATE SET
+            cmc_id = EXCLUDED.cmc_id,
+            cmc_rank = COALESCE(EXCLUDED.cmc_rank, coin_metadata.cmc_rank),
+            name = EXCLUDED.name,
+            description = EXCLUDED.description,
+            website = EXCLUDED.website,
+            whitepaper = EXCLUDED.whitepaper,
+            contracts = EXCLUDED.contracts,
+            updated_at = NOW()
+    """, [
+        (r["symbol"], r["cmc_id"], r["name"], r["description"], r["website"], r["whitepaper"],
+         json.dumps(r["contracts"]), r.get("cmc_rank"))
+        for r in rows
+    ], template="(%s, %s, %s, %s, %s, %s, %s::jsonb, %s, NOW())")
+    conn.commit()
+    cur.close()
+    conn.close()
+
+
+def refresh_metadata(api_key: str) -> int:
+    """تازه‌سازی دسته‌ای: N کوین برتر + هر کوینی که قبلاً در جدول بوده"""
+    headers = {"Accepts": "application/json", "X-CMC_PRO_API_KEY": api_key}
+    resp = requests.get(f"{CMC_BASE}/v1/cryptocurrency/map", headers=headers,
+                        params={"sort": "cmc_rank", "limit": METADATA_TOP_N}, timeout=15)
+    resp.raise_for_status()
+    listed = resp.json().get("data", [])
+    ids = [c["id"] for c in listed]
+    ranks = {c["id"]: c.get("rank") for c in listed}
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT cmc_id FROM coin_metadata")
+    known = [r[0] for r in cur.fetchall()]
+    cur.close()
+    conn.close()
+    top = set(ids)
+    ids += [i for i in known if i not in top]
+
+    rows, seen = [], set()
+    for start in range(0, len(ids), INFO_BATCH_SIZE):
+        chunk = ids[start:start + INFO_BATCH_SIZE]
+        r = requests.get(f"{CMC_BASE}/v2/cryptocurrency/info", headers=headers,
+                         params={"id": ",".join(map(str, chunk))}, timeout=20)
+        r.raise_for_status()
+        data = r.json().get("data", {})
+        for cmc_id in chunk:  # به ترتیب رتبه، تا نماد تکراری به کوین بالاتر برسد
+            item = data.get(str(cmc_id))
+            if item and item["symbol"].upper() not in seen:
+                seen.add(item["symbol"].upper())
+                row = _parse_info(item)
+                row["cmc_rank"] = ranks.get(cmc_id)
+                rows.append(row)
+    _upsert(rows)
+    logger.info("متادیتای %s کوین تازه‌سازی شد.", len(rows), extra={"event": "metadata.refreshed", "coins": len(rows)})
+    return len(rows)
+
+
+def fetch_symbol_metadata(symbol: str, api_key: str):
+    """برای نمادی که هنوز در جدول نیست: یک درخواست info و ذخیره"""
+    headers = {"Accepts": "application/json", "X-CMC_PRO_API_KEY": api_key}
+    try:
+        resp = resilience.CMC.call_sync(resilience.http_get, f"{CMC_BASE}/v2/cryptocurrency/info", headers=headers,
+                                        params={"symbol": symbol}, timeout=resilience.CMC.budget)
+    except requests.HTTPError:
+        return None
+    items = resp.json().get("data", {}).get(symbol.upper()) or []
+    if isinstance(items, dict):
+        items = [items]
+    if not items:
+        return None
+    row = _parse_info(items[0])
+    _upsert([row])
+    return row
+
+
+def get_metadata(symbol: str, api_key: str = None):
+    """متادیتای محلی؛ در صورت نبود و داشتن کلید، یک‌بار از CMC گرفته و ذخیره می‌شود"""
+    try:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("""
+            SELECT symbol, cmc_id, name, description, website, whitepaper, contracts
+            FROM coin_metadata WHERE symbol = %s
+        """, (symbol.upper(),))
+        rec = cur.fetchone()
+        cur.close()
+        conn.close()
+        if rec:
+            return dict(rec)
+    except Exception as e:
+        logger.error("خطا در خواندن متادیتا: %s", e, extra={"event": "metadata.read_error"})
+    if api_key:
+        try:
+            return fetch_symbol_metadata(symbol, api_key)
+        except Exception as e:
+            logger.error("خطا در دریافت متادیتای %s: %s", symbol, e, extra={"event": "metadata.fetch_error", "symbol": symbol})
+    return None
+
+
+def search_entries() -> list:
+    """(symbol, name, cmc_rank) همهٔ کوین‌ها برای ایندکس جستجوی inline"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("SELECT symbol, name, cmc_rank FROM coin_metadata")
+    rows = [(r["symbol"], r["name"], r["cmc_rank"]) for r in cur.fetchall()]
+    cur.close()
+    conn.close()
+    return rows
@@ -1,17 +1,32 @@
 # deep_analysis.py
+import logging
 import os
 import json
+import time
 import requests
 import psycopg2
 from psycopg2.extras import DictCursor
 from datetime import datetime, timedelta
 
+import invalidation
+import resilience
+from response_cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
 # تنظیمات
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  # یا هر API دیگه
 DATABASE_URL = os.getenv("DATABASE_URL")
 MODEL = "gpt-4o"  # یا gpt-4o, claude, gemini
 #CACHE_DAYS = 1  # چند روز کش بشه؟
-CACHE_MINUTES = 1 # پیش‌فرض ۱ دقیقه
+CACHE_MINUTES = 1 # TTL ثابت قبلی؛ فقط به‌عنوان مبنای مقایسه در گزارش
+# TTL تطبیقی: کوین‌های بزرگ و آرام نزدیک سقف، کوین‌های کوچک و پرنوسان نزدیک کف
+CACHE_MIN_MINUTES = int(os.getenv("DEEP_CACHE_MIN_MINUTES", "15"))
+CACHE_MAX_MINUTES = int(os.getenv("DEEP_CACHE_MAX_MINUTES", "720"))
+
+# کش محلی (متن تحلیل، زمان ساخت)؛ با ذخیرهٔ تحلیل جدید در هر اینستنسی، همه‌جا ابطال می‌شود
+LOCAL_CACHE = TTLCache(ttl=CACHE_MIN_MINUTES * 60, max_entries=2000)
+invalidation.register("deep", lambda key: LOCAL_CACHE.clear() if key is None else LOCAL_CACHE.invalidate(key))
 
 def get_db_connection():
     return psycopg2.connect(DATABASE_URL, cursor_factory=DictCursor)
@@ -33,32 +48,85 @@ def init_cache_table():
     conn.commit()
     cur.close()
     conn.close()
-    print("جدول کش تحلیل عمیق آماده است.")
+    logger.info("جدول کش تحلیل عمیق آماده است.")
 
-def get_cached_analysis(symbol: str) -> str | None:
-    """بررسی کش: اگر معتبر بود، متن رو برگردون"""
+# آمار کش و مصرف توکن (از زمان اجرای فعلی)
+STATS = {
+    "hits": 0,
+    "misses": 0,
+    "hits_beyond_fixed": 0,   # hitهایی که با TTL ثابت CACHE_MINUTES منقضی شده بودند
+    "api_calls": 0,
+    "prompt_tokens": 0,
+    "completion_tokens": 0,
+    "stored": 0,              # تحلیل‌های تازهٔ ذخیره‌شده در کش (خطاها و جواب‌های کوتاه نه)
+    "ttl_minutes_total": 0,
+}
+
+def compute_ttl_minutes(coin_data: dict) -> int:
+    """
+    TTL هر ورودی از داده‌های بازار همان لحظه: رتبه، نوسان ۲۴ساعته و حجم.
+    رتبهٔ بالا و نوسان کم → TTL بلندتر؛ کوین کم‌حجم یا پرنوسان → TTL کوتاه‌تر.
+    """
+    rank = coin_data.get("rank") or 0
+    change_24h = abs(coin_data.get("change_24h") or 0)
+    volume_24h = coin_data.get("volume_24h") or 0
+
+    if 0 < rank <= 20:
+        rank_factor = 1.0
+    elif 0 < rank <= 100:
+        rank_factor = 0.6
+    elif 0 < rank <= 500:
+        rank_factor = 0.3
+    else:
+        rank_factor = 0.15   # نامشخص یا خیلی پایین
+
+    vol_factor = 1 / (1 + change_24h / 5)         # هر ۵٪ تغییر، TTL را نصف می‌کند
+    liquidity_factor = 0.5 if volume_24h < 1_000_000 else 1.0
+
+    ttl = CACHE_MIN_MINUTES + (CACHE_MAX_MINUTES - CACHE_MIN_MINUTES) * rank_factor * vol_factor * liquidity_factor
+    return int(min(CACHE_MAX_MINUTES, max(CACHE_MIN_MINUTES, ttl)))
+
+def _lookup_cached(symbol: str):
+    """(متن، سن ورودی به ثانیه، ثانیه تا انقضا) یا None"""
+    local = LOCAL_CACHE.get(symbol.upper())
+    if local is not None:
+        text, created = local
+        expires_at = LOCAL_CACHE.expires_at(symbol.upper())
+        return text, time.time() - created, expires_at - time.time()
     try:
         conn = get_db_connection()
         cur = conn.cursor()
         cur.execute("""
-            SELECT analysis_text FROM deep_analysis_cache 
+            SELECT analysis_text,
+                   EXTRACT(EPOCH FROM (expires_at - NOW())) AS ttl,
+                   EXTRACT(EPOCH FROM (NOW() - created_at)) AS age
+            FROM deep_analysis_cache
             WHERE symbol = %s AND expires_at > NOW()
         """, (symbol.upper(),))
         rec = cur.fetchone()
         cur.close()
         conn.close()
-        return rec["analysis_text"] if rec else None
+        if not rec:
+            return None
+        ttl, age = float(rec["ttl"]), float(rec["age"])
+        LOCAL_CACHE.set(symbol.upper(), (rec["analysis_text"], time.time() - age), ttl=ttl)
+        return rec["analysis_text"], age, ttl
     except Exception as e:
-        print(f"خطا در خواندن کش: {e}")
+        logger.error("خطا در خواندن کش: %s", e, extra={"event": "deep.cache_read_error"})
         return None
 
-def save_analysis_to_cache(symbol: str, name: str, analysis: str):
+def get_cached_analysis(symbol: str) -> str | None:
+    """بررسی کش: اگر معتبر بود، متن رو برگردون"""
+    found = _lookup_cached(symbol)
+    return found[0] if found else None
+
+def save_analysis_to_cache(symbol: str, name: str, analysis: str, ttl_minutes: int = None):
     """ذخیره تحلیل در دیتابیس با انقضا"""
     try:
         conn = get_db_connection()
         cur = conn.cursor()
         #expires_at = datetime.now() + timedelta(days=CACHE_DAYS)
-        expires_at = datetime.now() + timedelta(minutes=CACHE_MINUTES)
+        expires_at = datetime.now() + timedelta(minutes=ttl_minutes or CACHE_MIN_MINUTES)
         cur.execute("""
             INSERT INTO deep_analysis_cache (symbol, name, analysis_text, expires_at)
             VALUES (%s, %s, %s, %s)
@@ -68,11 +136,12 @@ def save_analysis_to_cache(symbol: str, name: str, analysis: str):
                 expires_at = EXCLUDED.expires_at,
                 created_at = NOW()
         """, (symbol.upper(), name, analysis, expires_at))
+        invalidation.publish(f"deep:{symbol.upper()}", cur)
         conn.commit()
         cur.close()
         conn.close()
     except Exception as e:
-        print(f"خطا در ذخیره کش: {e}")
+        logger.error("خطا در ذخیره کش: %s", e, extra={"event": "deep.cache_write_error"})
 
 def call_openai_analysis(coin_data: dict) -> str:
     """فراخوانی ChatGPT فقط وقتی کش نیست"""
@@ -147,11 +216,19 @@ def call_openai_analysis(coin_data: dict) -> str:
             "temperature": 0.7,
             "max_tokens": 1200
         }
-        resp = requests.post("https://api.openai.com/v1/chat/completions", json=payload, headers=headers, timeout=40)
-        resp.raise_for_status()
-        return resp.json()["choices"][0]["message"]["content"].strip()
+        # بدون hedge (هر درخواست هزینه دارد)؛ بودجه و breaker جلوی انتظار ۴۰ ثانیه‌ای را می‌گیرند
+        resp = resilience.OPENAI.call_sync(
+            resilience.http_post, "https://api.openai.com/v1/chat/completions",
+            json=payload, headers=headers, timeout=resilience.OPENAI.budget, idempotent=False,
+        )
+        body = resp.json()
+        usage = body.get("usage") or {}
+        STATS["api_calls"] += 1
+        STATS["prompt_tokens"] += usage.get("prompt_tokens", 0)
+        STATS["completion_tokens"] += usage.get("completion_tokens", 0)
+        return body["choices"][0]["message"]["content"].strip()
     except Exception as e:
-        print(f"خطا در فراخوانی OpenAI: {e}")
+        logger.error("خطا در فراخوانی OpenAI: %s", e, extra={"event": "deep.openai_error"})
         return f"موقتی در دسترس نیست. بعداً امتحان کن."
 
 def get_deep_analysis(coin_data: dict) -> str:
@@ -161,18 +238,50 @@ def get_deep_analysis(coin_data: dict) -> str:
     symbol = coin_data["symbol"]
 
     # ۱. کش رو چک کن
-    cached = get_cached_analysis(symbol)
-    if cached:
+    found = _lookup_cached(symbol)
+    if found:
+        cached, age, remaining = found
+        STATS["hits"] += 1
+        if age > CACHE_MINUTES * 60:
+            STATS["hits_beyond_fixed"] += 1
         #return f"تحلیل عمیق {coin_data['name']} (از حافظه):\n\n{cached}"
-        return f"تحلیل عمیق {coin_data['name']} (از کش - تا {CACHE_MINUTES} دقیقه):\n\n{cached}"
+        return f"تحلیل عمیق {coin_data['name']} (از کش - تا {max(1, int(remaining // 60))} دقیقه):\n\n{cached}"
 
     # ۲. اگر کش نبود، API رو بزن
-    print(f"تحلیل جدید برای {symbol} — فراخوانی API...")
+    STATS["misses"] += 1
+    logger.info("تحلیل جدید برای %s — فراخوانی API...", symbol, extra={"event": "deep.generate", "symbol": symbol})
     analysis = call_openai_analysis(coin_data)
 
     # ۳. ذخیره در کش (حتی اگر خطا داد، ذخیره نشه)
     if "خطا" not in analysis and "تنظیم نشده" not in analysis and len(analysis) > 100:
-        save_analysis_to_cache(symbol, coin_data["name"], analysis)
+        ttl_minutes = compute_ttl_minutes(coin_data)
+        STATS["stored"] += 1
+        STATS["ttl_minutes_total"] += ttl_minutes
+        save_analysis_to_cache(symbol, coin_data["name"], analysis, ttl_minutes)
         return f"تحلیل عمیق {coin_data['name']} (تازه):\n\n{analysis}"
     else:
+        # سرویس در دسترس نیست: تحلیل منقضی‌شدهٔ قبلی بهتر از هیچ است
+        stale = LOCAL_CACHE.get_stale(symbol.upper())
+        if stale:
+            return f"تحلیل عمیق {coin_data['name']} (قدیمی - سرویس تحلیل موقتاً در دسترس نیست):\n\n{stale[0]}"
         return analysis  # خطا
+
+def cache_report() -> str:
+    """گزارش hit-rate و مصرف توکن، و مقایسه با TTL ثابت"""
+    hits, misses = STATS["hits"], STATS["misses"]
+    lookups = hits + misses
+    calls = STATS["api_calls"]
+    tokens = STATS["prompt_tokens"] + STATS["completion_tokens"]
+    avg_tokens = tokens / calls if calls else 0
+    saved_calls = STATS["hits_beyond_fixed"]
+    fixed_hit_rate = (hits - saved_calls) / lookups * 100 if lookups else 0
+    stored = STATS["stored"]
+    avg_ttl = STATS["ttl_minutes_total"] / stored if stored else 0
+    return (
+        f"کش تحلیل عمیق:\n"
+        f"درخواست‌ها: {lookups} | hit: {hits} | miss: {misses}\n"
+        f"hit-rate: {hits / lookups * 100 if lookups else 0:.1f}% (با TTL ثابت {CACHE_MINUTES} دقیقه: {fixed_hit_rate:.1f}%)\n"
+        f"میانگین TTL تطبیقی: {avg_ttl:.0f} دقیقه روی {stored} ذخیره (بازه {CACHE_MIN_MINUTES}–{CACHE_MAX_MINUTES})\n"
+        f"فراخوانی OpenAI: {calls} | توکن مصرفی: {tokens:,} (میانگین {avg_tokens:,.0f})\n"
+        f"صرفه‌جویی نسبت به TTL ثابت: {saved_calls} فراخوانی ≈ {saved_calls * avg_tokens:,.0f} توکن"
+    )
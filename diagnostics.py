@@ -0,0 +1,298 @@
+# diagnostics.py
+# عیب‌یابی حافظهٔ پروسهٔ ربات در حال اجرا، بدون ری‌استارت یا دیباگر:
+# snapshot با tracemalloc و مقایسه با یک مبنا (بیشترین رشد بر اساس محل تخصیص)، اندازهٔ هر کش،
+# آمار نسل‌های GC و RSS. از دستور ادمین /mem و (اختیاری) endpoint HTTP با توکن در دسترس است.
+import logging
+import os
+import gc
+import hmac
+import sys
+import time
+import asyncio
+import itertools
+import threading
+import tracemalloc
+
+from aiohttp import web
+
+logger = logging.getLogger(__name__)
+
+DIAG_PORT = int(os.getenv("DIAG_PORT", "0"))             # 0 = بدون endpoint
+DIAG_HOST = os.getenv("DIAG_HOST", "127.0.0.1")
+DIAG_TOKEN = os.getenv("DIAG_TOKEN")
+DIAG_TRACE_FRAMES = int(os.getenv("DIAG_TRACE_FRAMES", "1"))
+DIAG_TRACE_ON_START = os.getenv("DIAG_TRACE_ON_START", "0") == "1"
+TOP_N = 10
+SIZE_SAMPLE = 50   # برای تخمین حجم هر کش، این تعداد مقدار نمونه‌گیری می‌شود
+
+CACHES = {}        # نام -> تابعی که (تعداد ورودی، بایت تقریبی) برمی‌گرداند
+_baseline = None
+_baseline_at = None
+_runner = None
+
+
+# -------------------------
+# اندازهٔ کش‌ها
+# -------------------------
+def approx_size(obj, depth: int = 3) -> int:
+    """حجم تقریبی (عمق محدود؛ آرایه‌های NumPy با nbytes)"""
+    nbytes = getattr(obj, "nbytes", None)
+    if isinstance(nbytes, int):
+        return nbytes + sys.getsizeof(obj)
+    size = sys.getsizeof(obj)
+    if depth <= 0:
+        return size
+    if isinstance(obj, dict):
+        items = itertools.islice(obj.items(), SIZE_SAMPLE)
+        sampled = [approx_size(k, depth - 1) + approx_size(v, depth - 1) for k, v in items]
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        sampled = [approx_size(x, depth - 1) for x in itertools.islice(obj, SIZE_SAMPLE)]
+    elif hasattr(obj, "__slots__"):
+        sampled = [approx_size(getattr(obj, s, None), depth - 1) for s in obj.__slots__]
+        return size + sum(sampled)
+    elif hasattr(obj, "__dict__"):
+        return size + approx_size(vars(obj), depth - 1)
+    else:
+        return size
+    if not sampled:
+        return size
+    # برون‌یابی از نمونه برای مجموعه‌های بزرگ
+    return size + int(sum(sampled) / len(sampled) * len(obj))
+
+
+def register_cache(name: str, container, size_of=None):
+    """
+    container: dict یا TTLCache یا هر چیز دارای len — یا تابعی که آن را برگرداند، برای
+    ماژول‌هایی که ساختارشان را با نمونهٔ تازه جایگزین می‌کنند؛ size_of اختیاری برای حجم دقیق‌تر
+    """
+    def measure():
+        current = container() if callable(container) else container
+        data = getattr(current, "data", current)
+        return len(current), (size_of(current) if size_of else approx_size(data))
+    CACHES[name] = measure
+
+
+def _register_builtin_caches():
+    """کش‌های ماژول‌های ربات (ماژول‌ها تنبل ایمپورت می‌شوند تا وابستگی چرخشی نسازند)"""
+    import technical_analysis, deep_analysis, inline_search, charts, alerts, rate_limit
+    register_cache("technical_analysis.CACHE", technical_analysis.CACHE, lambda c: sum(
+        (entry[0].nbytes if entry[0] is not None else 0) + approx_size(entry[1]) + approx_size(entry[3])
+        for entry in list(c.values())))
+    register_cache("deep_analysis.LOCAL_CACHE", deep_analysis.LOCAL_CACHE)
+    register_cache("inline_search.RESULT_CACHE", inline_search.RESULT_CACHE)
+    # build_index هر دو را با نمونهٔ تازه جایگزین می‌کند، پس در لحظهٔ اندازه‌گیری خوانده می‌شوند
+    register_cache("inline_search.TRIE", lambda: inline_search.NAMES,
+                   lambda names: approx_size(inline_search.TRIE.root, depth=6))
+    register_cache("charts.FILE_IDS", charts.FILE_IDS)
+    register_cache("alerts.INDEX", alerts.INDEX, lambda index: approx_size(index.alerts) + approx_size(index.books, depth=4))
+    register_cache("alerts.PRICES", alerts.PRICES)
+    register_cache("rate_limit.BUCKETS", rate_limit.BUCKETS.buckets)
+
+
+def cache_sizes() -> list:
+    if "technical_analysis.CACHE" not in CACHES:
+        _register_builtin_caches()
+    rows = []
+    for name, measure in CACHES.items():
+        try:
+            entries, nbytes = measure()
+        except Exception as e:
+            logger.warning("خطا در اندازه‌گیری کش %s: %s", name, e, extra={"event": "diag.measure_error", "cache": name})
+            continue
+        rows.append({"name": name, "entries": entries, "bytes": nbytes})
+    return sorted(rows, key=lambda r: r["bytes"], reverse=True)
+
+
+# -------------------------
+# tracemalloc
+# -------------------------
+def start_tracing():
+    """شروع tracemalloc و گرفتن مبنا"""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(DIAG_TRACE_FRAMES)
+    reset_baseline()
+
+
+def stop_tracing():
+    global _baseline, _baseline_at
+    tracemalloc.stop()
+    _baseline = _baseline_at = None
+
+
+def reset_baseline():
+    global _baseline, _baseline_at
+    _baseline = _filtered_snapshot()
+    _baseline_at = time.time()
+
+
+def _filtered_snapshot():
+    return tracemalloc.take_snapshot().filter_traces((
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        tracemalloc.Filter(False, "<unknown>"),
+    ))
+
+
+def allocation_report(top: int = TOP_N) -> dict:
+    """بیشترین رشد نسبت به مبنا و بزرگ‌ترین محل‌های تخصیص فعلی"""
+    if not tracemalloc.is_tracing():
+        return {"tracing": False}
+    snapshot = _filtered_snapshot()
+    current, peak = tracemalloc.get_traced_memory()
+    report = {
+        "tracing": True,
+        "traced_bytes": current,
+        "traced_peak_bytes": peak,
+        "tracemalloc_overhead_bytes": tracemalloc.get_tracemalloc_memory(),
+        "top": [
+            {"where": str(s.traceback), "bytes": s.size, "blocks": s.count}
+            for s in snapshot.statistics("lineno")[:top]
+        ],
+    }
+    if _baseline is not None:
+        report["baseline_age_s"] = round(time.time() - _baseline_at)
+        report["growth"] = [
+            {"where": str(s.traceback), "bytes_diff": s.size_diff, "blocks_diff": s.count_diff, "bytes": s.size}
+            for s in snapshot.compare_to(_baseline, "lineno")[:top] if s.size_diff > 0
+        ]
+    return report
+
+
+# -------------------------
+# GC و پروسه
+# -------------------------
+def rss_bytes():
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024   # بیشینه، نه فعلی
+    except Exception:
+        return None
+
+
+def gc_report() -> dict:
+    return {
+        "counts": gc.get_count(),
+        "thresholds": gc.get_threshold(),
+        "generations": [
+            {"gen": i, "collections": s["collections"], "collected": s["collected"], "uncollectable": s["uncollectable"]}
+            for i, s in enumerate(gc.get_stats())
+        ],
+        "garbage": len(gc.garbage),
+        "frozen": gc.get_freeze_count(),
+    }
+
+
+def task_count():
+    """تعداد تسک‌های asyncio؛ all_tasks امن بین تردها نیست، پس فقط روی خود event loop صدا زده شود"""
+    try:
+        return len(asyncio.all_tasks())
+    except RuntimeError:
+        return None
+
+
+def process_report(tasks: int = None) -> dict:
+    return {"rss_bytes": rss_bytes(), "threads": threading.active_count(), "asyncio_tasks": tasks}
+
+
+def full_report(top: int = TOP_N, tasks: int = None, baseline: bool = False) -> dict:
+    """
+    کل گزارش؛ سنگین است (snapshot)، پس در executor صدا زده شود. tasks را صدازننده روی
+    event loop می‌شمارد (task_count)؛ baseline اول tracemalloc را روشن و مبنا را ثبت می‌کند.
+    """
+    if baseline:
+        start_tracing()
+    return {
+        "at": time.time(),
+        "process": process_report(tasks),
+        "gc": gc_report(),
+        "caches": cache_sizes(),
+        "allocations": allocation_report(top),
+    }
+
+
+def _mb(n) -> str:
+    return "-" if n is None else f"{n / 1024 / 1024:.1f}MB"
+
+
+def report_text(report: dict, top: int = 5) -> str:
+    """خلاصهٔ متنی برای /mem"""
+    p, g, a = report["process"], report["gc"], report["allocations"]
+    lines = [
+        f"RSS: {_mb(p['rss_bytes'])} | ترد: {p['threads']} | تسک: {p['asyncio_tasks']}",
+        "GC: " + " | ".join(f"نسل {x['gen']}: {x['collections']} بار، {x['collected']} آزاد، {x['uncollectable']} غیرقابل"
+                            for x in g["generations"]) + f" | garbage: {g['garbage']}",
+        "",
+        "کش‌ها:",
+    ]
+    lines += [f"{c['name']}: {c['entries']:,} ورودی، ~{_mb(c['bytes'])}" for c in report["caches"]]
+    if not a["tracing"]:
+        lines += ["", "tracemalloc خاموش است؛ /mem start برای شروع و گرفتن مبنا"]
+        return "\n".join(lines)
+    lines += ["", f"tracemalloc: {_mb(a['traced_bytes'])} (پیک {_mb(a['traced_peak_bytes'])}، سربار {_mb(a['tracemalloc_overhead_bytes'])})"]
+    if "growth" in a:
+        lines.append(f"بیشترین رشد از مبنا ({a['baseline_age_s'] // 60} دقیقه پیش):")
+        lines += [f"+{_mb(s['bytes_diff'])} ({s['blocks_diff']:+,} بلوک) {s['where']}" for s in a["growth"][:top]] or ["-"]
+    lines.append("بزرگ‌ترین محل‌های تخصیص:")
+    lines += [f"{_mb(s['bytes'])} {s['where']}" for s in a["top"][:top]]
+    return "\n".join(lines)
+
+
+# -------------------------
+# endpoint HTTP (اختیاری)
+# -------------------------
+@web.middleware
+async def _auth(request, handler):
+    token = request.headers.get("X-Diag-Token") or request.query.get("token") or ""
+    if not DIAG_TOKEN or not hmac.compare_digest(token.encode(), DIAG_TOKEN.encode()):
+        raise web.HTTPUnauthorized()
+    return await handler(request)
+
+
+async def _mem(request):
+    try:
+        top = max(1, min(int(request.query.get("top", TOP_N)), 100))
+    except ValueError:
+        raise web.HTTPBadRequest(text="top باید عدد صحیح باشد")
+    baseline = request.query.get("baseline") == "1"
+    loop = asyncio.get_running_loop()
+    report = await loop.run_in_executor(None, full_report, top, task_count(), baseline)
+    return web.json_response(report)
+
+
+async def _loop(request):
+    import loop_monitor
+    return web.json_response(loop_monitor.metrics())
+
+
+async def start_server():
+    """اگر DIAG_PORT و DIAG_TOKEN تنظیم شده باشند، endpoint روی همان event loop بالا می‌آید"""
+    global _runner
+    if DIAG_TRACE_ON_START:
+        start_tracing()
+    if not DIAG_PORT:
+        return
+    if not DIAG_TOKEN:
+        logger.warning("DIAG_PORT بدون DIAG_TOKEN تنظیم شده؛ endpoint عیب‌یابی راه‌اندازی نشد.")
+        return
+    app = web.Application(middlewares=[_auth])
+    app.router.add_get("/diag/mem", _mem)
+    app.router.add_get("/diag/loop", _loop)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, DIAG_HOST, DIAG_PORT).start()
+    logger.info("endpoint عیب‌یابی روی %s:%s فعال شد.", DIAG_HOST, DIAG_PORT, extra={"event": "diag.started"})
+
+
+async def stop_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
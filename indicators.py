@@ -0,0 +1,193 @@
+# indicators.py
+# اندیکاتورهای کلاسیک (EMA، RSI، MACD، ATR، باندهای بولینگر) روی همان آرایه‌های Klines.
+# همهٔ اندیکاتورهای بازگشتی (EMA، RSI و ATR به روش Wilder، MACD) در یک پیمایش به‌روز می‌شوند و
+# وضعیتشان (IndicatorState) کنار نتیجهٔ زیگزاگ کش می‌شود؛ دفعهٔ بعد فقط کندل‌های بسته‌شدهٔ
+# جدید پردازش می‌شوند. کندل در حال تشکیل روی یک کپی از وضعیت حساب می‌شود و ثبت نمی‌شود.
+# فرمول‌ها مثل ewm(adjust=False) در pandas / کتابخانهٔ ta هستند.
+import time
+
+import numpy as np
+
+EMA_PERIODS = (20, 50, 200)
+RSI_PERIOD = 14
+ATR_PERIOD = 14
+MACD_FAST, MACD_SLOW, MACD_SIGNAL = 12, 26, 9
+BB_PERIOD, BB_STD = 20, 2.0
+
+# ضریب هموارسازی هر سری بازگشتی
+_ALPHAS = {f"ema{p}": 2 / (p + 1) for p in set(EMA_PERIODS) | {MACD_FAST, MACD_SLOW}}
+_ALPHAS["signal"] = 2 / (MACD_SIGNAL + 1)
+_ALPHAS["gain"] = _ALPHAS["loss"] = 1 / RSI_PERIOD
+_ALPHAS["atr"] = 1 / ATR_PERIOD
+_EMA_KEYS = tuple(f"ema{p}" for p in sorted(set(EMA_PERIODS) | {MACD_FAST, MACD_SLOW}))
+
+
+class IndicatorState:
+    """وضعیت بازگشتی بعد از آخرین کندل بسته‌شدهٔ پردازش‌شده (قابل pickle برای ProcessPool)"""
+    __slots__ = ("last_open_time", "prev_close", "values", "count")
+
+    def __init__(self, last_open_time=None, prev_close=None, values=None, count=0):
+        self.last_open_time = last_open_time
+        self.prev_close = prev_close
+        self.values = values or {}   # نام سری -> آخرین مقدار
+        self.count = count
+
+    def copy(self) -> "IndicatorState":
+        return IndicatorState(self.last_open_time, self.prev_close, dict(self.values), self.count)
+
+
+def _ewm(values: dict, key: str, x: float):
+    prev = values.get(key)
+    values[key] = x if prev is None else prev + _ALPHAS[key] * (x - prev)
+
+
+def _step(state: IndicatorState, high: float, low: float, close: float):
+    """اعمال یک کندل روی وضعیت (درجا)"""
+    v = state.values
+    prev = state.prev_close
+    for key in _EMA_KEYS:
+        _ewm(v, key, close)
+    _ewm(v, "signal", v[f"ema{MACD_FAST}"] - v[f"ema{MACD_SLOW}"])
+    if prev is not None:
+        change = close - prev
+        _ewm(v, "gain", change if change > 0 else 0.0)
+        _ewm(v, "loss", -change if change < 0 else 0.0)
+        _ewm(v, "atr", max(high - low, abs(high - prev), abs(low - prev)))
+    else:
+        _ewm(v, "atr", high - low)
+    state.prev_close = close
+    state.count += 1
+
+
+def _advance(state: IndicatorState, klines, start: int, stop: int) -> IndicatorState:
+    """
+    اعمال کندل‌های start..stop؛ ورودی‌های هر گام (تغییر قیمت، true range) برداری حساب می‌شوند
+    و فقط بازگشت‌ها در حلقه روی float خالص می‌مانند (چند برابر سریع‌تر از _step برای هر کندل).
+    """
+    if stop <= start:
+        return state
+    if state.prev_close is None:
+        _step(state, float(klines.high[start]), float(klines.low[start]), float(klines.close[start]))
+        start += 1
+        if stop <= start:
+            state.last_open_time = int(klines.open_time[stop - 1])
+            return state
+
+    close = klines.close[start:stop]
+    prev = np.concatenate(([state.prev_close], close[:-1]))
+    high, low = klines.high[start:stop], klines.low[start:stop]
+    change = close - prev
+    gains = np.maximum(change, 0.0).tolist()
+    losses = np.maximum(-change, 0.0).tolist()
+    true_range = np.maximum(high - low, np.maximum(np.abs(high - prev), np.abs(low - prev))).tolist()
+
+    v = state.values
+    emas = [v[key] for key in _EMA_KEYS]
+    alphas = [_ALPHAS[key] for key in _EMA_KEYS]
+    fast, slow = _EMA_KEYS.index(f"ema{MACD_FAST}"), _EMA_KEYS.index(f"ema{MACD_SLOW}")
+    signal, a_signal = v["signal"], _ALPHAS["signal"]
+    gain, loss, atr = v.get("gain"), v.get("loss"), v["atr"]
+    a_rsi, a_atr = _ALPHAS["gain"], _ALPHAS["atr"]
+    for c, g, l, tr in zip(close.tolist(), gains, losses, true_range):
+        for k in range(len(emas)):
+            emas[k] += alphas[k] * (c - emas[k])
+        signal += a_signal * ((emas[fast] - emas[slow]) - signal)
+        if gain is None:
+            gain, loss = g, l
+        else:
+            gain += a_rsi * (g - gain)
+            loss += a_rsi * (l - loss)
+        atr += a_atr * (tr - atr)
+
+    v.update(zip(_EMA_KEYS, emas))
+    v.update(signal=signal, gain=gain, loss=loss, atr=atr)
+    state.prev_close = float(close[-1])
+    state.count += len(close)
+    state.last_open_time = int(klines.open_time[stop - 1])
+    return state
+
+
+def update_state(state, klines, now_ms: int = None) -> tuple:
+    """
+    (وضعیت جدید، تعداد کندل پردازش‌شده). فقط کندل‌های بسته‌شده ثبت می‌شوند؛ اگر وضعیت
+    قبلی نبود یا آخرین کندلش دیگر در پنجره نیست (فاصله افتاده)، از اول حساب می‌شود.
+    """
+    now_ms = now_ms or int(time.time() * 1000)
+    closed = len(klines)
+    while closed and klines.close_time[closed - 1] >= now_ms:
+        closed -= 1
+
+    start = 0
+    if state is not None and state.last_open_time is not None:
+        pos = int(np.searchsorted(klines.open_time[:closed], state.last_open_time))
+        if pos < closed and klines.open_time[pos] == state.last_open_time:
+            start = pos + 1
+            state = state.copy()
+        else:
+            state = None
+    if start == 0:
+        state = IndicatorState()
+    return _advance(state, klines, start, closed), closed - start
+
+
+def snapshot(state: IndicatorState, klines) -> dict:
+    """مقادیر فعلی اندیکاتورها؛ کندل در حال تشکیل (اگر هست) فقط روی کپی وضعیت اعمال می‌شود"""
+    live = state
+    if len(klines) and (state.last_open_time is None or klines.open_time[-1] > state.last_open_time):
+        live = state.copy()
+        _step(live, float(klines.high[-1]), float(klines.low[-1]), float(klines.close[-1]))
+    v = live.values
+
+    gain, loss = v.get("gain"), v.get("loss")
+    if live.count <= RSI_PERIOD or gain is None:
+        rsi = None
+    else:
+        rsi = 100.0 if loss == 0 else 100 - 100 / (1 + gain / loss)
+
+    macd = v[f"ema{MACD_FAST}"] - v[f"ema{MACD_SLOW}"] if live.count >= MACD_SLOW else None
+    window = klines.close[-BB_PERIOD:]
+    if len(window) == BB_PERIOD:
+        mid = float(window.mean())
+        band = BB_STD * float(window.std())
+        bollinger = (mid - band, mid, mid + band)
+    else:
+        bollinger = None
+
+    return {
+        "price": float(klines.close[-1]) if len(klines) else None,
+        "ema": {p: (v[f"ema{p}"] if live.count >= p else None) for p in EMA_PERIODS},
+        "rsi": rsi,
+        "macd": macd,
+        "macd_signal": v["signal"] if macd is not None else None,
+        "macd_hist": macd - v["signal"] if macd is not None else None,
+        "atr": v.get("atr") if live.count > ATR_PERIOD else None,
+        "bollinger": bollinger,
+    }
+
+
+def compute(klines, state=None, now_ms: int = None) -> tuple:
+    """(مقادیر اندیکاتورها، وضعیت برای کش)"""
+    state, _ = update_state(state, klines, now_ms)
+    return snapshot(state, klines), state
+
+
+def format_lines(ind: dict) -> list:
+    """خطوط پیام تلگرام"""
+    lines = []
+    price = ind.get("price")
+    rsi = ind.get("rsi")
+    if rsi is not None:
+        zone = "اشباع خرید" if rsi >= 70 else "اشباع فروش" if rsi <= 30 else "خنثی"
+        lines.append(f"RSI({RSI_PERIOD}): {rsi:.1f} — {zone}")
+    if ind.get("macd") is not None:
+        side = "مثبت" if ind["macd_hist"] > 0 else "منفی"
+        lines.append(f"MACD: {ind['macd']:,.2f} | سیگنال: {ind['macd_signal']:,.2f} | هیستوگرام {side}")
+    emas = [f"EMA{p}: ${val:,.2f}" for p, val in ind.get("ema", {}).items() if val is not None]
+    if emas:
+        lines.append(" | ".join(emas))
+    if ind.get("atr") is not None and price:
+        lines.append(f"ATR({ATR_PERIOD}): ${ind['atr']:,.2f} ({ind['atr'] / price * 100:.1f}%)")
+    if ind.get("bollinger"):
+        low, mid, high = ind["bollinger"]
+        lines.append(f"بولینگر({BB_PERIOD}): ${low:,.2f} / ${mid:,.2f} / ${high:,.2f}")
+    return lines
@@ -0,0 +1,93 @@
+# inline_search.py
+# جستجوی inline (‏@bot btc) از حافظه: trie پیشوندی روی نماد، نام و نام‌های فارسی کوین‌ها.
+# هر گره بهترین نتایج (بر اساس رتبهٔ CMC) را از قبل نگه می‌دارد، پس جواب هر کوئری
+# فقط پیمایش طول پیشوند است؛ قیمت‌ها از فید مشترک alerts.PRICES خوانده می‌شوند.
+import logging
+import os
+
+from response_cache import TTLCache
+import alerts
+
+logger = logging.getLogger(__name__)
+
+MAX_RESULTS = 10
+RESULT_CACHE_TTL = int(os.getenv("INLINE_RESULT_CACHE_TTL", "15"))  # کمتر از دورهٔ فید قیمت
+
+# نام‌های رایج فارسی → نماد
+PERSIAN_ALIASES = {
+    "بیت کوین": "BTC", "بیتکوین": "BTC", "اتریوم": "ETH", "اتر": "ETH", "تتر": "USDT",
+    "ریپل": "XRP", "بایننس کوین": "BNB", "سولانا": "SOL", "دوج کوین": "DOGE", "دوج": "DOGE",
+    "کاردانو": "ADA", "ترون": "TRX", "تون کوین": "TON", "تون": "TON", "شیبا": "SHIB",
+    "پولکادات": "DOT", "لایت کوین": "LTC", "آوالانچ": "AVAX", "چین لینک": "LINK",
+    "پالیگان": "POL", "استلار": "XLM", "مونرو": "XMR", "اتریوم کلاسیک": "ETC",
+    "یونی سواپ": "UNI", "نات کوین": "NOT", "پپه": "PEPE", "اپتوس": "APT", "آربیتروم": "ARB",
+}
+
+
+def normalize(text: str) -> str:
+    """یکسان‌سازی برای جستجو: حروف کوچک، ی/ک عربی، حذف فاصله و نیم‌فاصله"""
+    return (text.lower().replace("ي", "ی").replace("ك", "ک")
+            .replace("‌", "").replace(" ", "").strip())
+
+
+class PrefixTrie:
+    """trie که هر گره حداکثر MAX_RESULTS نماد با بهترین رتبه را نگه می‌دارد"""
+
+    def __init__(self):
+        self.root = {}  # char -> node؛ کلید "" در هر گره = لیست (rank, symbol)
+
+    def insert(self, term: str, symbol: str, rank: int):
+        node = self.root
+        for ch in term:
+            node = node.setdefault(ch, {})
+            best = node.setdefault("", [])
+            if any(s == symbol for _, s in best):
+                continue
+            best.append((rank, symbol))
+            best.sort()
+            del best[MAX_RESULTS:]
+
+    def search(self, prefix: str) -> list:
+        node = self.root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return []
+        return [symbol for _, symbol in node.get("", [])]
+
+
+TRIE = PrefixTrie()
+NAMES = {}  # symbol -> name
+RESULT_CACHE = TTLCache(ttl=RESULT_CACHE_TTL, max_entries=5000)
+
+
+def build_index(entries: list):
+    """entries: (symbol, name, cmc_rank) — جایگزینی اتمیک ایندکس قبلی"""
+    global TRIE, NAMES
+    trie, names = PrefixTrie(), {}
+    by_symbol = {}
+    for symbol, name, rank in entries:
+        rank = rank or 10**6
+        names[symbol] = name
+        by_symbol[symbol] = rank
+        trie.insert(normalize(symbol), symbol, rank)
+        trie.insert(normalize(name), symbol, rank)
+    for alias, symbol in PERSIAN_ALIASES.items():
+        if symbol in by_symbol:
+            trie.insert(normalize(alias), symbol, by_symbol[symbol])
+    TRIE, NAMES = trie, names
+    RESULT_CACHE.clear()
+    logger.info("ایندکس جستجوی inline: %s کوین", len(names), extra={"event": "inline.index_built", "coins": len(names)})
+
+
+def search(query: str) -> list:
+    """لیست (symbol, name, price یا None) برای پیشوند؛ نتیجهٔ هر پیشوند کوتاه‌مدت کش می‌شود"""
+    prefix = normalize(query)
+    if not prefix:
+        return []
+    cached = RESULT_CACHE.get(prefix)
+    if cached is not None:
+        return cached
+    results = [(s, NAMES.get(s, s), alerts.PRICES.get(s)) for s in TRIE.search(prefix)]
+    RESULT_CACHE.set(prefix, results)
+    return results
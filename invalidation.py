@@ -0,0 +1,128 @@
+# invalidation.py
+# باس ابطال کش بین چند اینستنس ربات روی LISTEN/NOTIFY پستگرس (بدون بروکر خارجی).
+# نویسنده‌ها بعد از تغییر داده یک کلید مثل "sub:12345" منتشر می‌کنند و هر اینستنس
+# ورودی محلی متناظر را از کش‌هایش حذف می‌کند.
+import logging
+import os
+import asyncio
+
+import psycopg2
+import psycopg2.extensions
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+CHANNEL = "bot_invalidation"
+
+# prefix -> لیست callback(suffix)؛ suffix=None یعنی «همه را خالی کن»
+_handlers = {}
+_listen_conn = None
+_loop = None
+
+STATS = {"published": 0, "received": 0, "reconnects": 0}
+
+
+def register(prefix: str, callback):
+    """ثبت تابع حذف برای کلیدهای prefix:*"""
+    _handlers.setdefault(prefix, []).append(callback)
+
+
+def _dispatch(key: str):
+    prefix, _, suffix = key.partition(":")
+    for callback in _handlers.get(prefix, []):
+        try:
+            callback(suffix)
+        except Exception as e:
+            logger.error("خطا در ابطال کش %s: %s", key, e, extra={"event": "invalidation.apply_error", "key": key})
+
+
+def _flush_all():
+    for callbacks in _handlers.values():
+        for callback in callbacks:
+            try:
+                callback(None)
+            except Exception as e:
+                logger.error("خطا در خالی کردن کش: %s", e, extra={"event": "invalidation.clear_error"})
+
+
+def publish(key: str, cur=None):
+    """
+    انتشار ابطال. اگر cur داده شود، NOTIFY در همان تراکنش نویسنده ارسال می‌شود
+    (پستگرس آن را فقط بعد از commit تحویل می‌دهد) و کش محلی هم با همان پیام، که به شنوندهٔ
+    خود این اینستنس هم می‌رسد، خالی می‌شود؛ حذف زودتر از commit اجازه می‌داد خواننده‌ای همزمان
+    ردیف قدیمی را دوباره در کش بگذارد. بدون cur داده قبلاً commit شده و کش محلی همین الان خالی می‌شود.
+    """
+    STATS["published"] += 1
+    try:
+        if cur is not None:
+            cur.execute("SELECT pg_notify(%s, %s)", (CHANNEL, key))
+            return
+        _dispatch(key)
+        conn = psycopg2.connect(DATABASE_URL)
+        conn.autocommit = True
+        try:
+            with conn.cursor() as c:
+                c.execute("SELECT pg_notify(%s, %s)", (CHANNEL, key))
+        finally:
+            conn.close()
+    except Exception as e:
+        logger.error("خطا در انتشار ابطال %s: %s", key, e, extra={"event": "invalidation.publish_error", "key": key})
+
+
+def _on_readable():
+    global _listen_conn
+    try:
+        _listen_conn.poll()
+    except Exception as e:
+        logger.warning("اتصال LISTEN قطع شد: %s", e, extra={"event": "invalidation.listen_lost"})
+        _close_listener()
+        return
+    while _listen_conn.notifies:
+        note = _listen_conn.notifies.pop(0)
+        STATS["received"] += 1
+        _dispatch(note.payload)
+
+
+def _close_listener():
+    global _listen_conn
+    if _listen_conn is not None:
+        try:
+            _loop.remove_reader(_listen_conn.fileno())
+        except Exception:
+            pass
+        try:
+            _listen_conn.close()
+        except Exception:
+            pass
+    _listen_conn = None
+
+
+def start_listener():
+    """اتصال LISTEN و ثبت آن در event loop (باید داخل loop صدا زده شود)"""
+    global _listen_conn, _loop
+    _loop = asyncio.get_running_loop()
+    conn = psycopg2.connect(DATABASE_URL)
+    conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+    with conn.cursor() as cur:
+        cur.execute(f"LISTEN {CHANNEL};")
+    _listen_conn = conn
+    _loop.add_reader(conn.fileno(), _on_readable)
+    logger.info("شنونده ابطال کش فعال شد.")
+
+
+async def ensure_listener():
+    """جاب دوره‌ای: اگر اتصال افتاده، دوباره وصل شو و چون ممکن است پیامی از دست رفته باشد همه را خالی کن"""
+    if _listen_conn is not None and not _listen_conn.closed:
+        return
+    _close_listener()
+    try:
+        start_listener()
+    except Exception as e:
+        logger.error("خطا در اتصال دوباره LISTEN: %s", e, extra={"event": "invalidation.reconnect_error"})
+        return
+    STATS["reconnects"] += 1
+    _flush_all()
+
+
+def stop_listener():
+    _close_listener()
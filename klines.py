@@ -0,0 +1,71 @@
+# klines.py
+# نمایش سبک کندل‌های بایننس: به‌جای DataFrame دوازده‌ستونی pandas،
+# هر ستون لازم یک آرایه‌ی NumPy است (struct-of-arrays) که مستقیم از JSON خام پر می‌شود.
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+_EPOCH = datetime(1970, 1, 1)
+
+# ترتیب ستون‌ها در پاسخ /api/v3/klines
+_OPEN_TIME, _OPEN, _HIGH, _LOW, _CLOSE, _VOLUME, _CLOSE_TIME = range(7)
+
+
+class Klines:
+    """سری کندل‌ها؛ زمان‌ها int64 میلی‌ثانیه (UTC) و قیمت/حجم float64"""
+    __slots__ = ("open_time", "open", "high", "low", "close", "volume", "close_time")
+
+    def __init__(self, open_time, open, high, low, close, volume, close_time):
+        self.open_time = open_time
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+        self.close_time = close_time
+
+    @classmethod
+    def from_raw(cls, raw: list) -> "Klines":
+        """ساخت از لیست خام get_klines (هر ردیف: [open_time, "open", "high", ...])"""
+        if not raw:
+            empty_f = np.empty(0, dtype=np.float64)
+            empty_i = np.empty(0, dtype=np.int64)
+            return cls(empty_i, empty_f, empty_f, empty_f, empty_f, empty_f, empty_i)
+        cols = list(zip(*raw))
+        return cls(
+            np.array(cols[_OPEN_TIME], dtype=np.int64),
+            np.array(cols[_OPEN], dtype=np.float64),
+            np.array(cols[_HIGH], dtype=np.float64),
+            np.array(cols[_LOW], dtype=np.float64),
+            np.array(cols[_CLOSE], dtype=np.float64),
+            np.array(cols[_VOLUME], dtype=np.float64),
+            np.array(cols[_CLOSE_TIME], dtype=np.int64),
+        )
+
+    def __len__(self) -> int:
+        return len(self.close)
+
+    def tail(self, n: int) -> "Klines":
+        """n کندل آخر (view روی همان آرایه‌ها، بدون کپی)"""
+        return Klines(*(getattr(self, name)[-n:] for name in self.__slots__))
+
+    def closed(self, now_ms: int = None) -> "Klines":
+        """فقط کندل‌های بسته‌شده (view)؛ کندل در حال تشکیل انتهای سری کنار گذاشته می‌شود"""
+        now_ms = now_ms or int(time.time() * 1000)
+        n = len(self)
+        while n and self.close_time[n - 1] >= now_ms:
+            n -= 1
+        return Klines(*(getattr(self, name)[:n] for name in self.__slots__))
+
+    def copy(self) -> "Klines":
+        """کپی مستقل — برای نگه‌داشتن یک tail در کش بدون نگه‌داشتن کل آرایه‌ی والد"""
+        return Klines(*(getattr(self, name).copy() for name in self.__slots__))
+
+    def datetime_at(self, i: int) -> datetime:
+        """زمان باز شدن کندل i به‌صورت datetime بدون tz (UTC) — مثل pd.to_datetime(unit='ms')"""
+        return _EPOCH + timedelta(milliseconds=int(self.open_time[i]))
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name in self.__slots__)
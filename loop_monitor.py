@@ -0,0 +1,164 @@
+# loop_monitor.py
+# پایش تأخیر event loop: یک تسک هر LOOP_SAMPLE_INTERVAL ثانیه می‌خوابد و تأخیر بیدار شدنش
+# را ثبت می‌کند (lag)؛ یک ترد نگهبان اگر ضربان این تسک بیش از LOOP_STALL_MS قطع شود،
+# استک ترد loop را همان لحظه برمی‌دارد تا معلوم شود کدام هندلر/تابع loop را بلاک کرده است.
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+LOOP_SAMPLE_INTERVAL = float(os.getenv("LOOP_SAMPLE_INTERVAL", "0.25"))   # ثانیه
+LOOP_LAG_WARN_MS = float(os.getenv("LOOP_LAG_WARN_MS", "100"))
+LOOP_STALL_MS = float(os.getenv("LOOP_STALL_MS", "300"))                   # آستانهٔ گرفتن استک
+LAG_WINDOW = 2400        # حدود ۱۰ دقیقه نمونه با فاصلهٔ ۰.۲۵ ثانیه
+MAX_STALLS = 20
+STACK_DEPTH = 12
+
+_PROJECT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+LAGS = deque(maxlen=LAG_WINDOW)   # تأخیر هر نمونه (میلی‌ثانیه)
+STALLS = deque(maxlen=MAX_STALLS)
+STATS = {"samples": 0, "over_threshold": 0, "stalls": 0, "max_lag_ms": 0.0}
+
+_heartbeat = 0.0
+_loop_thread_id = None
+_task = None
+_watchdog = None
+_stop = threading.Event()
+_open_stall = None   # رکورد توقفی که هنوز ادامه دارد
+
+
+def _handler_name(frame):
+    """نام هندلر از فریم wrapper دکوریتور bot_logging.logged_handler، اگر روی استک باشد"""
+    while frame is not None:
+        code = frame.f_code
+        if code.co_name == "wrapper" and code.co_filename.endswith("bot_logging.py"):
+            return frame.f_locals.get("name")
+        frame = frame.f_back
+    return None
+
+
+def _culprit(frame):
+    """درونی‌ترین تابع خود پروژه روی استک (جایی که loop واقعاً گیر کرده)"""
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_PROJECT_DIR) and not filename.endswith(("loop_monitor.py", "bot_logging.py")):
+            return f"{os.path.basename(filename)}:{frame.f_lineno} {frame.f_code.co_name}"
+        frame = frame.f_back
+    return None
+
+
+def _capture_stall(blocked_ms: float):
+    global _open_stall
+    frame = sys._current_frames().get(_loop_thread_id)
+    if frame is None:
+        return
+    _open_stall = {
+        "at": time.time(),
+        "blocked_ms": blocked_ms,
+        "handler": _handler_name(frame),
+        "culprit": _culprit(frame),
+        "stack": "".join(traceback.format_stack(frame, limit=STACK_DEPTH)),
+    }
+    STALLS.append(_open_stall)
+    STATS["stalls"] += 1
+    logger.warning("event loop بلاک شده است", extra={
+        "event": "loop.stall", "handler": _open_stall["handler"],
+        "culprit": _open_stall["culprit"], "stack": _open_stall["stack"],
+    })
+
+
+def _watch():
+    """ترد نگهبان: اگر ضربان loop قطع شد، یک بار برای هر توقف استک را بگیر"""
+    captured_for = None
+    while not _stop.wait(LOOP_STALL_MS / 4000):
+        beat = _heartbeat
+        blocked_ms = (time.monotonic() - beat) * 1000 - LOOP_SAMPLE_INTERVAL * 1000
+        if blocked_ms >= LOOP_STALL_MS and captured_for != beat:
+            captured_for = beat
+            try:
+                _capture_stall(blocked_ms)
+            except Exception as e:
+                logger.error("خطا در گرفتن استک loop: %s", e, extra={"event": "loop.stack_error"})
+
+
+async def _sample():
+    global _heartbeat, _open_stall
+    while True:
+        started = time.monotonic()
+        _heartbeat = started
+        await asyncio.sleep(LOOP_SAMPLE_INTERVAL)
+        lag_ms = max(0.0, (time.monotonic() - started - LOOP_SAMPLE_INTERVAL) * 1000)
+        _heartbeat = time.monotonic()
+        LAGS.append(lag_ms)
+        STATS["samples"] += 1
+        STATS["max_lag_ms"] = max(STATS["max_lag_ms"], lag_ms)
+        if _open_stall is not None:
+            # مدت واقعی توقف وقتی loop دوباره آزاد شد معلوم می‌شود
+            _open_stall["blocked_ms"] = lag_ms
+            _open_stall = None
+        if lag_ms >= LOOP_LAG_WARN_MS:
+            STATS["over_threshold"] += 1
+            logger.warning("تأخیر event loop: %.0fms", lag_ms, extra={"event": "loop.lag", "lag_ms": round(lag_ms, 1)})
+
+
+def start():
+    """شروع پایش روی loop جاری (داخل main صدا زده می‌شود)"""
+    global _task, _watchdog, _loop_thread_id, _heartbeat
+    if _task is not None:
+        return
+    _loop_thread_id = threading.get_ident()
+    _heartbeat = time.monotonic()
+    _stop.clear()
+    _task = asyncio.get_running_loop().create_task(_sample())
+    _watchdog = threading.Thread(target=_watch, name="loop-watchdog", daemon=True)
+    _watchdog.start()
+
+
+def stop():
+    global _task, _watchdog
+    _stop.set()
+    if _task is not None:
+        _task.cancel()
+    _task = _watchdog = None
+
+
+def metrics() -> dict:
+    """متریک‌های تأخیر روی پنجرهٔ اخیر (میلی‌ثانیه)"""
+    lags = sorted(LAGS)
+    if not lags:
+        p50 = p95 = p99 = recent_max = 0.0
+    else:
+        # صدک با اندیس روی لیست مرتب (پنجره کوچک است؛ numpy لازم نیست)
+        p50, p95, p99 = (lags[min(len(lags) - 1, int(q * len(lags)))] for q in (0.50, 0.95, 0.99))
+        recent_max = lags[-1]
+    return {
+        "lag_p50_ms": p50, "lag_p95_ms": p95, "lag_p99_ms": p99,
+        "lag_max_recent_ms": recent_max, "lag_max_ms": STATS["max_lag_ms"],
+        "samples": STATS["samples"], "over_threshold": STATS["over_threshold"], "stalls": STATS["stalls"],
+    }
+
+
+def stats_text(last: int = 3) -> str:
+    """گزارش ادمین: صدک‌های تأخیر و آخرین توقف‌ها با محل بلاک شدن"""
+    m = metrics()
+    lines = [
+        f"تأخیر event loop (حدود {len(LAGS) * LOOP_SAMPLE_INTERVAL / 60:.0f} دقیقهٔ اخیر):",
+        f"p50: {m['lag_p50_ms']:.1f}ms | p95: {m['lag_p95_ms']:.1f}ms | p99: {m['lag_p99_ms']:.1f}ms",
+        f"بیشینه: {m['lag_max_recent_ms']:.0f}ms (از شروع: {m['lag_max_ms']:.0f}ms)",
+        f"بالای {LOOP_LAG_WARN_MS:.0f}ms: {m['over_threshold']} | توقف‌های ثبت‌شده: {m['stalls']}",
+    ]
+    for stall in list(STALLS)[-last:][::-1]:
+        when = time.strftime("%H:%M:%S", time.localtime(stall["at"]))
+        lines.append(
+            f"\n⏱ {when} — {stall['blocked_ms']:.0f}ms\n"
+            f"هندلر: {stall['handler'] or '-'}\n"
+            f"محل: {stall['culprit'] or '-'}"
+        )
+    return "\n".join(lines)
@@ -4,25 +4,55 @@
 # نمایش اطلاعات تکمیلی برای مشترکین و نمایش کانترکت‌ها (درصورت وجود).
 # دکمه‌ها در کیبورد پایین ربات (نه inline) 
 
+import logging
 import os
 import requests
-import jdatetime
 from datetime import datetime, timedelta, date
 from telegram import (
     Update, InlineKeyboardMarkup, InlineKeyboardButton, Bot, BotCommand,
-    ReplyKeyboardMarkup, KeyboardButton
+    ReplyKeyboardMarkup, KeyboardButton, InlineQueryResultArticle, InputTextMessageContent
 )
 from telegram.ext import (
     ApplicationBuilder, CommandHandler, MessageHandler,
-    CallbackQueryHandler, filters, ContextTypes
+    CallbackQueryHandler, InlineQueryHandler, filters, ContextTypes
 )
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import asyncio
 import telegram.error
 import psycopg2
 from psycopg2.extras import DictCursor
-from deep_analysis import get_deep_analysis, init_cache_table
-from technical_analysis import analyze as tech_analyze
+from deep_analysis import get_deep_analysis, init_cache_table, cache_report
+from analysis_pool import run_tech_analysis, AnalysisBusy
+import analysis_pool
+import screener
+import alerts
+import coin_metadata
+import rate_limit
+from rate_limit import concurrency_limit
+from response_cache import TTLCache, expiry_from_cmc
+import invalidation
+import tron_verifier
+import admin_reports
+import diagnostics
+import resilience
+import outbound
+import shamsi
+import charts
+import inline_search
+import technical_analysis
+import bot_logging
+import loop_monitor
+from bot_logging import logged_handler
+
+bot_logging.setup_logging()
+logger = logging.getLogger(__name__)
+
+# استخراج نماد برای زمینهٔ لاگ
+def _data_symbol(prefix: str):
+    return lambda update: update.callback_query.data[len(prefix):].upper()
+
+def _text_symbol(update):
+    return update.message.text.strip().upper()
 
 # -------------------------
 # تنظیمات محیطی
@@ -36,6 +66,17 @@ CMC_API_KEY_1 = os.getenv("CMC_API_KEY_1")
 CMC_API_KEY_2 = os.getenv("CMC_API_KEY_2")
 CMC_API_KEY_3 = os.getenv("CMC_API_KEY_3")
 
+REPORT_REFRESH_MINUTES = int(os.getenv("REPORT_REFRESH_MINUTES", "15"))  # تازه‌سازی viewهای آمار ادمین
+TRON_VERIFY_INTERVAL = int(os.getenv("TRON_VERIFY_INTERVAL", "20"))  # ثانیه، دورهٔ تأیید خودکار پرداخت‌ها
+
+INLINE_CACHE_TIME = int(os.getenv("INLINE_CACHE_TIME", "10"))  # کش سمت تلگرام برای جواب‌های inline
+
+# سقف اجرای همزمان هندلرهای سنگین
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+DETAILS_MAX_CONCURRENT = int(os.getenv("DETAILS_MAX_CONCURRENT", "3"))   # OpenAI
+TECH_MAX_CONCURRENT = int(os.getenv("TECH_HANDLER_MAX_CONCURRENT", "8"))  # بایننس + ProcessPool
+COIN_MAX_CONCURRENT = int(os.getenv("COIN_MAX_CONCURRENT", "10"))        # CMC
+
 # پشتیبانی از هر دو نام: ADMIN_IDS یا ADMIN_USER_ID
 ADMIN_IDS = os.getenv("ADMIN_IDS") or os.getenv("ADMIN_USER_ID")
 
@@ -61,10 +102,10 @@ if ADMIN_IDS:
             if s:
                 ADMIN_ID_LIST.append(int(s))
     except Exception:
-        print("فرمت ADMIN_IDS اشتباه است. مثال صحیح: 12345678,87654321")
+        logger.warning("فرمت ADMIN_IDS اشتباه است. مثال صحیح: 12345678,87654321")
         ADMIN_ID_LIST = []
 
-print("لیست ادمین‌ها:", ADMIN_ID_LIST)
+logger.info("لیست ادمین‌ها: %s", ADMIN_ID_LIST)
 
 # -------------------------
 # دیتابیس
@@ -110,25 +151,24 @@ def init_db():
     conn.commit()
     cur.close()
     conn.close()
-    print("دیتابیس و جداول آماده‌اند.")
+    logger.info("دیتابیس و جداول آماده‌اند.")
 
 # -------------------------
 # تاریخ شمسی
 # -------------------------
 def to_shamsi(dt: datetime) -> str:
-    try:
-        jdt = jdatetime.datetime.fromgregorian(datetime=dt)
-        return jdt.strftime("%Y/%-m/%-d ساعت %H:%M")
-    except Exception:
-        try:
-            jdt = jdatetime.datetime.fromgregorian(datetime=dt)
-            return jdt.strftime("%Y/%m/%d ساعت %H:%M")
-        except Exception:
-            return dt.strftime("%Y-%m-%d %H:%M")
+    return shamsi.format_datetime(dt, shamsi.FORMAT_USER)
 
 # -------------------------
 # مدیریت اشتراک
 # -------------------------
+# کش محلی تاریخ انقضای اشتراک؛ هر تغییر با invalidation در همهٔ اینستنس‌ها پاک می‌شود
+SUBSCRIPTION_CACHE = TTLCache(ttl=int(os.getenv("SUBSCRIPTION_CACHE_TTL", "600")), max_entries=50000)
+invalidation.register(
+    "sub", lambda key: SUBSCRIPTION_CACHE.clear() if key is None else SUBSCRIPTION_CACHE.invalidate(int(key))
+)
+diagnostics.register_cache("main.SUBSCRIPTION_CACHE", SUBSCRIPTION_CACHE)
+
 def register_user_if_not_exists(telegram_id: int):
     conn = get_db_connection()
     cur = conn.cursor()
@@ -139,10 +179,13 @@ def register_user_if_not_exists(telegram_id: int):
     cur.close()
     conn.close()
 
-def activate_user_subscription(telegram_id: int, days: int = 30):
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT subscription_expiry FROM users WHERE telegram_id = %s", (telegram_id,))
+def activate_user_subscription(telegram_id: int, days: int = 30, cur=None):
+    """تمدید اشتراک؛ اگر cur داده شود داخل همان تراکنش صدازننده اجرا و commit نمی‌شود"""
+    own = cur is None
+    if own:
+        conn = get_db_connection()
+        cur = conn.cursor()
+    cur.execute("SELECT subscription_expiry FROM users WHERE telegram_id = %s FOR UPDATE", (telegram_id,))
     rec = cur.fetchone()
     now = datetime.now()
     if rec and rec["subscription_expiry"] and rec["subscription_expiry"] > now:
@@ -150,23 +193,29 @@ def activate_user_subscription(telegram_id: int, days: int = 30):
     else:
         new_expiry = now + timedelta(days=days)
     cur.execute("UPDATE users SET subscription_expiry = %s, notified_3day = FALSE WHERE telegram_id = %s", (new_expiry, telegram_id))
-    conn.commit()
-    cur.close()
-    conn.close()
+    invalidation.publish(f"sub:{telegram_id}", cur)
+    if own:
+        conn.commit()
+        cur.close()
+        conn.close()
     return new_expiry
 
 def check_subscription_status(telegram_id: int):
     if telegram_id in ADMIN_ID_LIST:
         return True, 3650
-    conn = get_db_connection()
-    cur = conn.cursor()
-    cur.execute("SELECT subscription_expiry FROM users WHERE telegram_id = %s", (telegram_id,))
-    rec = cur.fetchone()
-    cur.close()
-    conn.close()
-    if not rec or not rec["subscription_expiry"]:
+    cached = SUBSCRIPTION_CACHE.get(telegram_id)
+    if cached is None:
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute("SELECT subscription_expiry FROM users WHERE telegram_id = %s", (telegram_id,))
+        rec = cur.fetchone()
+        cur.close()
+        conn.close()
+        cached = (rec["subscription_expiry"] if rec else None,)
+        SUBSCRIPTION_CACHE.set(telegram_id, cached)
+    expiry = cached[0]
+    if not expiry:
         return False, 0
-    expiry = rec["subscription_expiry"]
     now = datetime.now()
     if expiry > now:
         return True, (expiry - now).days
@@ -178,6 +227,18 @@ def check_subscription_status(telegram_id: int):
 def safe_number(value, fmt="{:,.2f}"):
     return fmt.format(value) if value is not None else "نامشخص"
 
+# -------------------------
+# کش پاسخ‌ها
+# -------------------------
+# CMC آمار کلی بازار را حدوداً هر ۵ دقیقه و کوت‌ها را هر ۶۰ ثانیه آپدیت می‌کند
+GLOBAL_METRICS_CADENCE = int(os.getenv("GLOBAL_METRICS_CADENCE", "300"))
+QUOTE_CADENCE = int(os.getenv("QUOTE_CADENCE", "60"))
+
+GLOBAL_MARKET_CACHE = TTLCache(ttl=GLOBAL_METRICS_CADENCE, max_entries=1)
+diagnostics.register_cache("main.GLOBAL_MARKET_CACHE", GLOBAL_MARKET_CACHE)
+COIN_CARD_CACHE = TTLCache(ttl=QUOTE_CADENCE)   # symbol -> (msg, reply_markup)
+diagnostics.register_cache("main.COIN_CARD_CACHE", COIN_CARD_CACHE)
+
 # -------------------------
 # مدیریت کلیدهای CMC
 # -------------------------
@@ -186,7 +247,7 @@ async def check_and_select_api_key(bot: Bot):
     if not api_keys:
         if REPORT_CHANNEL:
             try:
-                await bot.send_message(chat_id=REPORT_CHANNEL, text="هیچ کلید CoinMarketCap تنظیم نشده.", parse_mode="HTML")
+                await bot.send_message(chat_id=REPORT_CHANNEL, text="هیچ کلید CoinMarketCap تنظیم نشده.", parse_mode="HTML", rate_limit_args=outbound.BULK)
             except telegram.error.TelegramError:
                 pass
         current_api_key = None
@@ -213,13 +274,14 @@ async def check_and_select_api_key(bot: Bot):
                 selected = True
                 break
         except Exception as e:
-            print(f"Error checking CMC key #{idx+1}: {e}")
+            logger.error("Error checking CMC key #%s: %s", idx + 1, e, extra={"event": "cmc.key_check_error"})
             continue
 
     if prev_index is not None and selected and prev_index != current_key_index and REPORT_CHANNEL:
         try:
             await bot.send_message(chat_id=REPORT_CHANNEL,
-                                   text=f"کلید CMC تغییر کرد!\nاز کلید #{prev_index+1} به #{current_key_index+1} سوئیچ شد.\n{to_shamsi(datetime.now())}")
+                                   text=f"کلید CMC تغییر کرد!\nاز کلید #{prev_index+1} به #{current_key_index+1} سوئیچ شد.\n{to_shamsi(datetime.now())}",
+                                   rate_limit_args=outbound.BULK)
         except telegram.error.TelegramError:
             pass
             
@@ -256,7 +318,7 @@ async def send_usage_report_to_channel(bot: Bot):
                 active_keys += 1
             per_key_msgs.append((idx, plan_name, credits_total, credits_used, credits_left))
         except Exception as e:
-            print(f"Error checking key #{idx+1}: {e}")
+            logger.error("Error checking key #%s: %s", idx + 1, e, extra={"event": "cmc.key_check_error"})
             per_key_msgs.append((idx, "Error", 0, 0, 0))
 
     if current_api_key is not None and current_key_index is not None:
@@ -275,7 +337,7 @@ async def send_usage_report_to_channel(bot: Bot):
 کلید فعال: شماره {current_key_index + 1} ({current_api_key[-6:]})
 آخرین بروزرسانی: {to_shamsi(datetime.now())}"""
         try:
-            await bot.send_message(chat_id=REPORT_CHANNEL, text=msg_active, parse_mode="HTML")
+            await bot.send_message(chat_id=REPORT_CHANNEL, text=msg_active, parse_mode="HTML", rate_limit_args=outbound.BULK)
         except telegram.error.TelegramError:
             pass
 
@@ -286,7 +348,12 @@ async def send_usage_report_to_channel(bot: Bot):
 کل کردیت باقی‌مانده: {total_credits_left:,}
 آخرین بروزرسانی: {to_shamsi(datetime.now())}"""
     try:
-        await bot.send_message(chat_id=REPORT_CHANNEL, text=msg_summary, parse_mode="HTML")
+        await bot.send_message(chat_id=REPORT_CHANNEL, text=msg_summary, parse_mode="HTML", rate_limit_args=outbound.BULK)
+    except telegram.error.TelegramError:
+        pass
+
+    try:
+        await bot.send_message(chat_id=REPORT_CHANNEL, text=cache_report() + "\n\n" + tron_verifier.stats_text(), rate_limit_args=outbound.BULK)
     except telegram.error.TelegramError:
         pass
 
@@ -298,11 +365,17 @@ async def set_bot_commands(bot: Bot):
         BotCommand("start", "شروع ربات"),
         BotCommand("check", "بررسی اشتراک"),
         BotCommand("verify", "ثبت هش پرداخت: /verify <tx_hash>"),
+        BotCommand("bullish", "ارزهایی که تازه صعودی شدن"),
+        BotCommand("bearish", "ارزهایی که تازه نزولی شدن"),
+        BotCommand("alert", "هشدار قیمت: /alert BTC 70000"),
+        BotCommand("alerts", "لیست هشدارهای قیمت"),
+        BotCommand("delalert", "حذف هشدار قیمت: /delalert 12"),
     ]
     await bot.set_my_commands(commands)
 
 # /start — با کیبورد پایین
 # /start — دکمه‌ها بر اساس اشتراک
+@logged_handler("start")
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user = update.effective_user
     user_id = user.id
@@ -345,6 +418,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
 # هندلر کلیک روی دکمه‌های کیبورد پایین
 # هندلر کلیک روی دکمه‌های کیبورد پایین
+@logged_handler("handle_keyboard_buttons")
 async def handle_keyboard_buttons(update: Update, context: ContextTypes.DEFAULT_TYPE):
     text = update.message.text.strip()
     user_id = update.effective_user.id
@@ -368,9 +442,17 @@ async def handle_keyboard_buttons(update: Update, context: ContextTypes.DEFAULT_
     elif text == "اشتراک و پرداخت":
         # فقط غیرمشترکین این دکمه رو دارن
         tron_address = TRON_ADDRESS or "آدرس پرداخت هنوز تنظیم نشده است."
+        # مبلغ یکتای این کاربر؛ تأیید خودکار فقط با همین مبلغ دقیق انجام می‌شود
+        try:
+            loop = asyncio.get_running_loop()
+            amount = tron_verifier.format_trx(await loop.run_in_executor(None, tron_verifier.payment_quote, user_id))
+        except Exception as e:
+            logger.error("خطا در صدور مبلغ پرداخت برای %s: %s", user_id, e, extra={"event": "payment.quote_error"})
+            amount = tron_verifier.format_trx(tron_verifier.SUBSCRIPTION_PRICE_SUN)
         await update.message.reply_text(
-            f"<b>اشتراک ماهیانه (۵ ترون)</b>\n\n"
-            f"مبلغ رو به این آدرس واریز کن:\n\n"
+            f"<b>اشتراک ماهیانه ({amount} ترون)</b>\n\n"
+            f"دقیقاً <code>{amount}</code> TRX به این آدرس واریز کن "
+            f"(این مبلغ مخصوص توست و پرداختت با همین مبلغ شناخته می‌شود):\n\n"
             f"<code>{tron_address}</code>\n\n"
             f"بعد از پرداخت، هش تراکنش رو با دستور زیر بفرست:\n"
             f"<code>/verify YOUR_TX_HASH</code>",
@@ -379,6 +461,7 @@ async def handle_keyboard_buttons(update: Update, context: ContextTypes.DEFAULT_
         return
 
 # /check
+@logged_handler("check_subscription")
 async def check_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     subscribed, days_left = check_subscription_status(user_id)
@@ -389,6 +472,7 @@ async def check_subscription(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
 # /verify <tx_hash>
 # /verify <tx_hash>
+@logged_handler("verify_tx")
 async def verify_tx(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id
     args = context.args
@@ -411,16 +495,16 @@ async def verify_tx(update: Update, context: ContextTypes.DEFAULT_TYPE):
     cur = conn.cursor()
     try:
         cur.execute("""
-            INSERT INTO payments (telegram_id, tx_hash, status)
-            VALUES (%s, %s, 'pending')
+            INSERT INTO payments (telegram_id, tx_hash, status, expected_sun)
+            VALUES (%s, %s, 'pending', (SELECT amount_sun FROM payment_quotes WHERE telegram_id = %s))
             RETURNING id, created_at
-        """, (user_id, tx_hash))
+        """, (user_id, tx_hash, user_id))
         rec = cur.fetchone()
         payment_id = rec["id"]
         created_at = rec["created_at"]
         conn.commit()
     except Exception as e:
-        print(f"خطا در ذخیره پرداخت: {e}")
+        logger.error("خطا در ذخیره پرداخت: %s", e, extra={"event": "payment.save_error"})
         await update.message.reply_text("خطا در ثبت تراکنش. بعداً امتحان کن.")
         cur.close()
         conn.close()
@@ -432,7 +516,7 @@ async def verify_tx(update: Update, context: ContextTypes.DEFAULT_TYPE):
     # پیام به کاربر
     await update.message.reply_text(
         f"هش تراکنش ثبت شد (شناسه: <code>#{payment_id}</code>)\n"
-        "منتظر بررسی ادمین باش — به زودی خبرت می‌کنم",
+        "تراکنش به‌صورت خودکار روی شبکهٔ ترون بررسی می‌شود و معمولاً چند دقیقه بعد از تأیید شبکه اشتراکت فعال می‌شه",
         parse_mode="HTML"
     )
 
@@ -462,19 +546,21 @@ async def verify_tx(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 reply_markup=InlineKeyboardMarkup(keyboard)
             )
         except telegram.error.TelegramError as e:
-            print(f"خطا در ارسال به کانال: {e}")
+            logger.error("خطا در ارسال به کانال: %s", e, extra={"event": "payment.channel_error"})
             await update.message.reply_text("هش ثبت شد، اما ارسال به ادمین با مشکل مواجه شد.")
         except Exception as e:
-            print(f"خطای غیرمنتظره: {e}")
+            logger.error("خطای غیرمنتظره: %s", e, extra={"event": "payment.channel_error"})
             await update.message.reply_text("خطا در ارتباط با کانال.")
 
 
+@logged_handler("admin_payment_callback")
 async def admin_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    print(f"دکمه کلیک شد: {update.callback_query.data}")  # لاگ
+    logger.debug("دکمه کلیک شد: %s", update.callback_query.data, extra={"event": "payment.callback"})
     query = update.callback_query
     await query.answer()
     # ... بقیه کدها
 # ====================== هندلر ادمین برای تأیید/رد پرداخت ======================
+@logged_handler("admin_payment_callback")
 async def admin_payment_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -493,7 +579,7 @@ async def admin_payment_callback(update: Update, context: ContextTypes.DEFAULT_T
 
     conn = get_db_connection()
     cur = conn.cursor()
-    cur.execute("SELECT telegram_id, status FROM payments WHERE id = %s", (payment_id,))
+    cur.execute("SELECT telegram_id, status FROM payments WHERE id = %s FOR UPDATE", (payment_id,))
     rec = cur.fetchone()
     if not rec or rec["status"] != "pending":
         cur.close()
@@ -504,9 +590,18 @@ async def admin_payment_callback(update: Update, context: ContextTypes.DEFAULT_T
     now = datetime.now()
 
     if action == "pay_ok":
-        new_expiry = activate_user_subscription(payer_id, days=30)
-        cur.execute("UPDATE payments SET status='approved', processed_at=%s WHERE id=%s", (now, payment_id))
-        conn.commit()
+        try:
+            new_expiry = activate_user_subscription(payer_id, days=30, cur=cur)
+            cur.execute("UPDATE payments SET status='approved', processed_at=%s WHERE id=%s", (now, payment_id))
+            cur.execute("DELETE FROM payment_quotes WHERE telegram_id = %s", (payer_id,))
+            conn.commit()
+        except psycopg2.IntegrityError:
+            # همین هش قبلاً برای پرداخت دیگری تأیید شده (ایندکس یکتای tron_verifier)
+            conn.rollback()
+            cur.close()
+            conn.close()
+            await query.edit_message_text("این هش قبلاً برای پرداخت دیگری تأیید شده است.")
+            return
         await query.edit_message_text(f"تأیید شد! اشتراک تا {to_shamsi(new_expiry)}")
         await context.bot.send_message(payer_id, f"پرداخت تأیید شد!\nاشتراک تا {to_shamsi(new_expiry)} فعال شد")
 
@@ -519,6 +614,7 @@ async def admin_payment_callback(update: Update, context: ContextTypes.DEFAULT_T
     cur.close()
     conn.close()
 # وضعیت کلی بازار
+@logged_handler("show_global_market")
 async def show_global_market(update: Update, context: ContextTypes.DEFAULT_TYPE):
     user_id = update.effective_user.id if update.message else update.callback_query.from_user.id
     subscribed, _ = check_subscription_status(user_id)
@@ -526,6 +622,11 @@ async def show_global_market(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await (update.message or update.callback_query.message).reply_text("برای دیدن وضعیت کلی بازار باید اشتراک داشته باشی.")
         return
 
+    cached = GLOBAL_MARKET_CACHE.get("global")
+    if cached:
+        await (update.message or update.callback_query.message).reply_text(cached)
+        return
+
     if not current_api_key:
         await (update.message or update.callback_query.message).reply_text("کلید CoinMarketCap فعال نیست. بعداً تلاش کن.")
         return
@@ -533,8 +634,7 @@ async def show_global_market(update: Update, context: ContextTypes.DEFAULT_TYPE)
     url = "https://pro-api.coinmarketcap.com/v1/global-metrics/quotes/latest"
     headers = {"Accepts": "application/json", "X-CMC_PRO_API_KEY": current_api_key}
     try:
-        resp = requests.get(url, headers=headers, timeout=10)
-        resp.raise_for_status()
+        resp = await resilience.CMC.call(resilience.http_get, url, headers=headers, timeout=resilience.CMC.budget)
         data = resp.json().get("data", {})
         total_market_cap = data.get("quote", {}).get("USD", {}).get("total_market_cap")
         total_volume_24h = data.get("quote", {}).get("USD", {}).get("total_volume_24h")
@@ -551,13 +651,23 @@ async def show_global_market(update: Update, context: ContextTypes.DEFAULT_TYPE)
             f"تعداد ارزها: {active_cryptocurrencies}\n"
             f"آخرین بروزرسانی: {last_txt}"
         )
+        GLOBAL_MARKET_CACHE.set("global", msg, version=last_updated,
+                                expires_at=expiry_from_cmc(last_updated, GLOBAL_METRICS_CADENCE))
         await (update.message or update.callback_query.message).reply_text(msg)
+    except resilience.UpstreamError as e:
+        # CMC کند یا قطع است: آخرین وضعیت (حتی منقضی) به‌جای انتظار
+        logger.warning("show_global_market بدون CMC: %r", e, extra={"event": "cmc.global_unavailable"})
+        stale = GLOBAL_MARKET_CACHE.get_stale("global")
+        await (update.message or update.callback_query.message).reply_text(
+            f"{stale}\n\n(داده‌ی قبلی — CoinMarketCap موقتاً در دسترس نیست)" if stale
+            else "CoinMarketCap موقتاً در دسترس نیست. کمی بعد دوباره تلاش کن.")
     except Exception as e:
-        print(f"Error show_global_market: {e}")
+        logger.error("Error show_global_market: %s", e, extra={"event": "cmc.global_error"})
         await (update.message or update.callback_query.message).reply_text("خطا در دریافت وضعیت کلی بازار.")
 
 # اطلاعات تکمیلی
 # ====================== تحلیل عمیق با کش در دیتابیس ======================
+@logged_handler("handle_details_callback", symbol_from=_data_symbol("details_"))
 async def handle_details_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -591,42 +701,50 @@ async def handle_details_callback(update: Update, context: ContextTypes.DEFAULT_
         "rank": 0,
     }
 
-    # دریافت اطلاعات از CMC
+    # متادیتا از جدول محلی (در صورت نبود، یک‌بار از CMC گرفته و ذخیره می‌شود)
+    # در ترد: کوئری دیتابیس و (برای نماد ناشناخته) درخواست CMC نباید event loop را نگه دارند
+    loop = asyncio.get_running_loop()
+    meta = await loop.run_in_executor(None, coin_metadata.get_metadata, symbol, current_api_key)
+    if meta:
+        coin_data.update({
+            "name": meta["name"],
+            "description": meta["description"] or "",
+            "website": meta["website"],
+            "whitepaper": meta["whitepaper"],
+            "contracts": meta["contracts"] or [],
+        })
+
+    # قیمت، مارکت کپ، حجم — تنها درخواست CMC در هر کلیک
     try:
-        # اطلاعات پایه
-        url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/info"
-        headers = {"X-CMC_PRO_API_KEY": current_api_key}
-        resp = requests.get(url, headers=headers, params={"symbol": symbol}, timeout=10)
-        if resp.ok:
-            data = resp.json()["data"][symbol]
-            coin_data.update({
-                "name": data.get("name", symbol),
-                "description": data.get("description", "")[:3000],
-                "website": data.get("urls", {}).get("website", ["ندارد"])[0],
-                "whitepaper": data.get("urls", {}).get("technical_doc", ["ندارد"])[0],
-            })
-            # قراردادها
-            for c in data.get("contracts", []):
-                addr = c.get("contract_address") or c.get("address")
-                net = c.get("platform") or c.get("name")
-                if addr:
-                    coin_data["contracts"].append({"network": net, "address": addr})
-
-        # قیمت، مارکت کپ، حجم
         qurl = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
-        qresp = requests.get(qurl, headers=headers, params={"symbol": symbol}, timeout=8)
-        if qresp.ok:
-            q = qresp.json()["data"][symbol]["quote"]["USD"]
-            coin_data.update({
-                "price": q.get("price", 0),
-                "market_cap": q.get("market_cap", 0),
-                "volume_24h": q.get("volume_24h", 0)
-            })
+        headers = {"X-CMC_PRO_API_KEY": current_api_key}
+        params = {"id": meta["cmc_id"]} if meta else {"symbol": symbol}
+        qresp = await resilience.CMC.call(resilience.http_get, qurl, headers=headers, params=params,
+                                          timeout=resilience.CMC.budget)
+        item = qresp.json()["data"][str(meta["cmc_id"]) if meta else symbol]
+        q = item["quote"]["USD"]
+        coin_data.update({
+            "price": q.get("price") or 0,
+            "market_cap": q.get("market_cap") or 0,
+            "volume_24h": q.get("volume_24h") or 0,
+            "change_1h": q.get("percent_change_1h") or 0,
+            "change_24h": q.get("percent_change_24h") or 0,
+            "circulating_supply": item.get("circulating_supply") or 0,
+            "total_supply": item.get("total_supply") or 0,
+            "max_supply": item.get("max_supply") or 0,
+            "rank": item.get("cmc_rank") or 0,
+        })
+    except requests.HTTPError as e:
+        # جواب غیر ۲xx از CMC (مثلاً نماد ناشناخته): تحلیل بدون قیمت ادامه می‌یابد
+        logger.warning("کوت CMC برای %s در دسترس نیست: HTTP %s", symbol, e.response.status_code,
+                       extra={"event": "cmc.quote_http", "status": e.response.status_code})
+    except resilience.UpstreamError as e:
+        logger.warning("CMC برای کوت %s جواب نداد: %r", symbol, e, extra={"event": "cmc.quote_unavailable"})
     except Exception as e:
-        print(f"خطا در دریافت داده‌های CMC: {e}")
+        logger.error("خطا در دریافت داده‌های CMC: %s", e, extra={"event": "cmc.quote_error"})
 
-    # دریافت تحلیل عمیق (کش یا API)
-    analysis = get_deep_analysis(coin_data)
+    # دریافت تحلیل عمیق (کش یا API) — در ترد، تا انتظار OpenAI event loop را نگه ندارد
+    analysis = await loop.run_in_executor(None, get_deep_analysis, coin_data)
 
     # حذف لودینگ
     try:
@@ -643,6 +761,7 @@ async def handle_details_callback(update: Update, context: ContextTypes.DEFAULT_
         disable_web_page_preview=True
     )
 
+@logged_handler("handle_close_details")
 async def handle_close_details(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -652,6 +771,7 @@ async def handle_close_details(update: Update, context: ContextTypes.DEFAULT_TYP
         pass
 
 # اطلاعات ارز
+@logged_handler("crypto_info", symbol_from=_text_symbol)
 async def crypto_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     global current_api_key
     user_id = update.effective_user.id
@@ -660,18 +780,24 @@ async def crypto_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
     register_user_if_not_exists(user_id)
     subscribed, _ = check_subscription_status(user_id)
 
+    query_symbol = text.strip().lower()
+    cached = COIN_CARD_CACHE.get(query_symbol.upper())
+    if cached:
+        msg, reply_markup = cached
+        await update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
+        return
+
     if not current_api_key:
         await update.message.reply_text("کلید CoinMarketCap فعال نیست. بعداً تلاش کن.")
         return
 
-    query_symbol = text.strip().lower()
     url = "https://pro-api.coinmarketcap.com/v1/cryptocurrency/quotes/latest"
     headers = {"Accepts": "application/json", "X-CMC_PRO_API_KEY": current_api_key}
     params = {"symbol": query_symbol.upper(), "convert": "USD"}
 
     try:
-        resp = requests.get(url, headers=headers, params=params, timeout=12)
-        resp.raise_for_status()
+        resp = await resilience.CMC.call(resilience.http_get, url, headers=headers, params=params,
+                                         timeout=resilience.CMC.budget)
         data = resp.json()
         if "data" not in data or query_symbol.upper() not in data["data"]:
             await update.message.reply_text("ارز پیدا نشد — نام یا نماد دقیق وارد کن.")
@@ -712,12 +838,62 @@ async def crypto_info(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("اطلاعات تکمیلی", callback_data=f"details_{symbol}")],
             [InlineKeyboardButton("تحلیل تکنیکال ۴ ساعته", callback_data=f"tech_{symbol}")],
         ]
-        await update.message.reply_text(msg, parse_mode="HTML", reply_markup=InlineKeyboardMarkup(keyboard))
+        reply_markup = InlineKeyboardMarkup(keyboard)
+        last_updated = result["quote"]["USD"].get("last_updated")
+        COIN_CARD_CACHE.set(query_symbol.upper(), (msg, reply_markup), version=last_updated,
+                            expires_at=expiry_from_cmc(last_updated, QUOTE_CADENCE))
+        await update.message.reply_text(msg, parse_mode="HTML", reply_markup=reply_markup)
     
+    except resilience.UpstreamError as e:
+        logger.warning("crypto_info بدون CMC: %r", e, extra={"event": "cmc.coin_unavailable"})
+        stale = COIN_CARD_CACHE.get_stale(query_symbol.upper())
+        if stale:
+            msg, reply_markup = stale
+            await update.message.reply_text(f"{msg}\n<i>(داده‌ی قبلی — CoinMarketCap موقتاً در دسترس نیست)</i>",
+                                            parse_mode="HTML", reply_markup=reply_markup)
+        else:
+            await update.message.reply_text("CoinMarketCap موقتاً در دسترس نیست. کمی بعد دوباره تلاش کن.")
     except Exception as e:
-        print(f"Error fetching coin: {e}")
+        logger.error("Error fetching coin: %s", e, extra={"event": "cmc.coin_error"})
         await update.message.reply_text("یه خطایی پیش اومد — دوباره امتحان کن.")
 
+# تازه‌سازی روزانهٔ متادیتای کوین‌ها
+async def refresh_coin_metadata():
+    if not current_api_key:
+        return
+    try:
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, coin_metadata.refresh_metadata, current_api_key)
+        entries = await loop.run_in_executor(None, coin_metadata.search_entries)
+        inline_search.build_index(entries)
+    except Exception as e:
+        logger.error("Error in refresh_coin_metadata: %s", e, extra={"event": "metadata.refresh_error"})
+
+# حالت inline: ‏@bot btc — جواب فقط از حافظه (trie + فید قیمت)
+@logged_handler("inline_query", sample=float(os.getenv("LOG_SAMPLE_INLINE", "0.1")))
+async def inline_query(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    query = update.inline_query
+    results = []
+    for symbol, name, price in inline_search.search(query.query):
+        price_txt = f"${safe_number(price, '{:,.8g}')}" if price is not None else "قیمت در دسترس نیست"
+        # کارت کامل کوین اگر در کش است (بدون دکمه‌ها: callback پیام inline، message ندارد)؛
+        # وگرنه همان نام و قیمت از فید بایننس
+        card = COIN_CARD_CACHE.get(symbol)
+        if card:
+            text = card[0]
+        else:
+            text = f"💱 <b>{name}</b> ({symbol})\n💵 <b>قیمت</b>: {price_txt}\n⏱️ {to_shamsi(datetime.now())}"
+        results.append(InlineQueryResultArticle(
+            id=symbol,
+            title=f"{name} ({symbol})",
+            description=price_txt if price is not None or not card else "اطلاعات کامل از CoinMarketCap",
+            input_message_content=InputTextMessageContent(text, parse_mode="HTML"),
+        ))
+    try:
+        await query.answer(results, cache_time=INLINE_CACHE_TIME)
+    except telegram.error.TelegramError as e:
+        logger.error("خطا در پاسخ inline: %s", e, extra={"event": "inline.answer_error"})
+
 # نوتیفیکیشن تمدید
 def check_and_notify_renewals():
     try:
@@ -737,7 +913,7 @@ def check_and_notify_renewals():
         cur.close()
         conn.close()
     except Exception as e:
-        print(f"Error in check_and_notify_renewals: {e}")
+        logger.error("Error in check_and_notify_renewals: %s", e, extra={"event": "renewal.check_error"})
 
 async def send_pending_renewal_notifications(bot: Bot):
     try:
@@ -745,21 +921,26 @@ async def send_pending_renewal_notifications(bot: Bot):
         cur = conn.cursor()
         cur.execute("SELECT telegram_id, subscription_expiry FROM users WHERE notified_3day = TRUE")
         rows = cur.fetchall()
-        now = datetime.now()
-        for r in rows:
-            if r["subscription_expiry"] and 0 < (r["subscription_expiry"] - now).days <= 3:
-                try:
-                    await bot.send_message(chat_id=r["telegram_id"], text=f"فقط ۳ روز تا پایان اشتراک مونده! برای تمدید از دکمه اشتراک استفاده کن")
-                except:
-                    pass
         cur.close()
         conn.close()
+        now = datetime.now()
+        # همه یک‌جا به صف outbound (اولویت پایین)؛ سرعت ارسال را زمان‌بند تنظیم می‌کند
+        results = await asyncio.gather(*(
+            bot.send_message(chat_id=r["telegram_id"], text=f"فقط ۳ روز تا پایان اشتراک مونده! برای تمدید از دکمه اشتراک استفاده کن",
+                             rate_limit_args=outbound.BULK)
+            for r in rows
+            if r["subscription_expiry"] and 0 < (r["subscription_expiry"] - now).days <= 3
+        ), return_exceptions=True)
+        failed = sum(isinstance(r, Exception) for r in results)
+        if failed:
+            logger.warning("یادآوری تمدید: %s از %s ارسال ناموفق", failed, len(results), extra={"event": "renewal.send_failed", "failed": failed})
     except Exception as e:
-        print(f"Error in send_pending_renewal_notifications: {e}")
+        logger.error("Error in send_pending_renewal_notifications: %s", e, extra={"event": "renewal.send_error"})
 
 
 
 # تابع جدید (تحلیل تکنیکال)
+@logged_handler("handle_tech_callback", symbol_from=_data_symbol("tech_"))
 async def handle_tech_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -778,8 +959,7 @@ async def handle_tech_callback(update: Update, context: ContextTypes.DEFAULT_TYP
     )
 
     try:
-        from technical_analysis import analyze as tech_analyze
-        result = tech_analyze(symbol)
+        result = await run_tech_analysis(symbol)
 
         await loading_msg.delete()
 
@@ -787,35 +967,241 @@ async def handle_tech_callback(update: Update, context: ContextTypes.DEFAULT_TYP
             await query.message.reply_text(f"دیتا برای {symbol} دریافت نشد.\nدقایقی دیگر دوباره امتحان کن.")
             return
 
-        # آخرین ۶ اکستریم
-        extremes = result["extreme_points"][-6:] if len(result["extreme_points"]) > 6 else result["extreme_points"]
-        extremes_text = "\n".join(extremes) if extremes else "در حال تشکیل..."
-
+        # فقط کلیدهایی که compute_analysis واقعاً برمی‌گرداند؛ نبود یک بخش نباید کل جواب را خراب کند
         text = f"""
-<b>تحلیل زیگزاگ حرفه‌ای {result["symbol"]}/USDT</b>
+<b>تحلیل زیگزاگ حرفه‌ای {result.get("symbol", symbol)}/USDT</b>
 
-قیمت فعلی: <b>{result["price"]}</b>
-روند: <b>{result["trend"]}</b>
-پیشنهاد: <b>{result["suggestion"]}</b>
+قیمت فعلی: <b>{result.get("price", "-")}</b>
+روند: <b>{result.get("trend", "نامشخص")}</b>
+پیشنهاد: <b>{result.get("suggestion", "-")}</b>
 
-<b>{result["start_point"]}</b>
+<b>{result.get("start_point", "")}</b>
 
 <b>نقاط زیگزاگ (دقیقاً مثل تریدینگ‌ویو):</b>
-""" + "\n".join(result["reversal_prices"][-7:]) + f"""
+""" + ("\n".join(result.get("reversal_prices", [])[-7:]) or "در حال تشکیل...") + f"""
+
+تعداد کل نقاط: <b>{result.get("total_points", 0)}</b>
+
+<b>اندیکاتورها:</b>
+""" + "\n".join(result.get("indicators") or ["-"]) + f"""
 
-تعداد کل نقاط: <b>{result["total_points"]}</b>
-{result["time"]}
+{result.get("time", "")}
         """.strip()
 
-        
+        await query.message.reply_text(text, parse_mode="HTML")
+
+        # نمودار زیگزاگ (برای هر کندل فقط یک بار رندر و آپلود می‌شود)
+        klines = technical_analysis.get_cached_klines(symbol)
+        if klines is not None:
+            try:
+                await charts.send_chart(query.message, symbol, "4h", klines,
+                                        caption=f"{result.get('symbol', symbol)}/USDT — {result.get('trend', 'نامشخص')}")
+            except Exception as e:
+                logger.error("خطا در ارسال نمودار %s: %s", symbol, e, extra={"event": "chart.send_error", "symbol": symbol})
+
+    except AnalysisBusy:
+        try:
+            await loading_msg.delete()
+        except:
+            pass
+        await query.message.reply_text("سرور تحلیل الان شلوغه. چند لحظه دیگه دوباره امتحان کن.")
     except Exception as e:
-        print(f"خطا در تحلیل تکنیکال {symbol}: {e}")
+        logger.error("خطا در تحلیل تکنیکال %s: %s", symbol, e, extra={"event": "tech.error", "symbol": symbol})
         try:
             await loading_msg.delete()
         except:
             pass
         await query.message.reply_text("خطایی رخ داد. دوباره امتحان کن.")
+
+# /techstats — فقط ادمین
+@logged_handler("tech_stats")
+async def tech_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    await update.message.reply_text(analysis_pool.stats_text())
+
+# /bullish و /bearish — چرخش‌های تازه از جدول آماده‌ی اسکنر (فقط مشترکین)
+@logged_handler("show_fresh_reversals")
+async def show_fresh_reversals(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    subscribed, _ = check_subscription_status(user_id)
+    if not subscribed:
+        await update.message.reply_text("اسکنر بازار فقط برای مشترکین فعاله!")
+        return
+
+    if not screener.RESULTS["updated_at"]:
+        await update.message.reply_text("اسکنر هنوز اولین اسکن بازار رو تموم نکرده. چند دقیقه دیگه امتحان کن.")
+        return
+
+    bullish = update.message.text.lstrip("/").split()[0].split("@")[0] == "bullish"
+    trend = screener.BULLISH if bullish else screener.BEARISH
+    rows = screener.fresh_reversals(trend)
+    title = "ارزهایی که تازه صعودی شدن" if bullish else "ارزهایی که تازه نزولی شدن"
+
+    if not rows:
+        text = f"<b>{title}</b>\n\nفعلاً موردی پیدا نشد."
+    else:
+        lines = [
+            f"{i}. <b>{r['symbol']}</b> — ${r['price']:,.4g} ({r['move_pct']:+.1f}% از نقطه چرخش، {r['bars_since_pivot']} کندل پیش)"
+            for i, r in enumerate(rows, start=1)
+        ]
+        text = f"<b>{title} ({screener.SCREENER_INTERVAL})</b>\n\n" + "\n".join(lines)
+    updated = to_shamsi(datetime.fromtimestamp(screener.RESULTS["updated_at"]))
+    text += f"\n\nاسکن {screener.RESULTS['scanned']} جفت USDT — {updated}"
+    await update.message.reply_text(text, parse_mode="HTML")
+
+# /alert BTC 70000 — هشدار قیمت (فقط مشترکین)
+@logged_handler("set_price_alert")
+async def set_price_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    user_id = update.effective_user.id
+    subscribed, _ = check_subscription_status(user_id)
+    if not subscribed:
+        await update.message.reply_text("هشدار قیمت فقط برای مشترکین فعاله!")
+        return
+
+    args = context.args
+    try:
+        symbol = args[0].strip().upper()
+        target = float(args[1].replace(",", ""))
+        if target <= 0:
+            raise ValueError
+    except (IndexError, ValueError):
+        await update.message.reply_text(
+            "لطفاً به شکل زیر بفرست:\n<code>/alert BTC 70000</code>", parse_mode="HTML"
+        )
+        return
+
+    price = alerts.PRICES.get(symbol)
+    if price is None:
+        try:
+            loop = asyncio.get_running_loop()
+            ticker = await loop.run_in_executor(
+                None, lambda: alerts.technical_analysis.get_client().get_symbol_ticker(symbol=symbol + "USDT")
+            )
+            price = float(ticker["price"])
+        except Exception:
+            await update.message.reply_text(f"جفت {symbol}/USDT در بایننس پیدا نشد.")
+            return
+
+    created = alerts.create_alert(user_id, symbol, target, price)
+    if not created:
+        await update.message.reply_text(f"حداکثر {alerts.MAX_ALERTS_PER_USER} هشدار فعال می‌تونی داشته باشی. با /delalert یکی رو پاک کن.")
+        return
+    alert_id, direction = created
+    word = "بالاتر از" if direction == "above" else "پایین‌تر از"
+    await update.message.reply_text(
+        f"هشدار <code>#{alert_id}</code> ثبت شد: وقتی {symbol} به {word} ${target:,.8g} برسه خبرت می‌کنم.\n"
+        f"قیمت فعلی: ${price:,.8g}",
+        parse_mode="HTML"
+    )
+
+# /alerts — لیست هشدارهای فعال
+@logged_handler("list_price_alerts")
+async def list_price_alerts(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    rows = alerts.list_alerts(update.effective_user.id)
+    if not rows:
+        await update.message.reply_text("هشدار فعالی نداری. مثال ثبت: /alert BTC 70000")
+        return
+    lines = [
+        f"<code>#{r['id']}</code> {r['symbol']} {'≥' if r['direction'] == 'above' else '≤'} ${r['target_price']:,.8g}"
+        for r in rows
+    ]
+    await update.message.reply_text("<b>هشدارهای فعال:</b>\n" + "\n".join(lines) + "\n\nحذف: /delalert شناسه", parse_mode="HTML")
+
+# /delalert <id>
+@logged_handler("delete_price_alert")
+async def delete_price_alert(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    try:
+        alert_id = int(context.args[0].lstrip("#"))
+    except (IndexError, ValueError):
+        await update.message.reply_text("لطفاً شناسه هشدار رو بفرست: /delalert 12")
+        return
+    if alerts.delete_alert(update.effective_user.id, alert_id):
+        await update.message.reply_text(f"هشدار #{alert_id} حذف شد.")
+    else:
+        await update.message.reply_text("هشداری با این شناسه پیدا نشد.")
+
+# /limits — وضعیت محدودیت نرخ (فقط ادمین)
+@logged_handler("limits_stats")
+async def limits_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    await update.message.reply_text(rate_limit.stats_text() + "\n" + bot_logging.stats_text()
+                                    + "\n" + outbound.LIMITER.stats_text())
+
+# /stats — آمار مشترکین، درآمد و تبدیل از viewهای آماده (فقط ادمین)
+@logged_handler("admin_stats")
+async def admin_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    loop = asyncio.get_running_loop()
+    text = await loop.run_in_executor(None, admin_reports.stats_text)
+    await update.message.reply_text(text, parse_mode="HTML")
+
+# /export users|payments — خروجی CSV (فقط ادمین)
+@logged_handler("admin_export")
+async def admin_export(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    table = context.args[0].lower() if context.args else ""
+    if table not in admin_reports.EXPORTS:
+        await update.message.reply_text("استفاده: /export users یا /export payments")
+        return
+    loop = asyncio.get_running_loop()
+    path = None
+    try:
+        path, rows = await loop.run_in_executor(None, admin_reports.export_csv, table)
+        with open(path, "rb") as f:
+            await update.message.reply_document(document=f, filename=admin_reports.export_filename(table),
+                                                caption=f"{table}: {rows:,} ردیف")
+    except Exception as e:
+        logger.error("خطا در خروجی %s: %s", table, e, extra={"event": "export.error", "table": table})
+        await update.message.reply_text("خطا در ساخت خروجی.")
+    finally:
+        if path and os.path.exists(path):
+            os.remove(path)
+
+# /mem [start|baseline|stop] — حافظه، کش‌ها، GC و رشد تخصیص‌ها نسبت به مبنا (فقط ادمین)
+@logged_handler("memory_diagnostics")
+async def memory_diagnostics(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    action = context.args[0].lower() if context.args else ""
+    loop = asyncio.get_running_loop()
+    if action in ("start", "baseline"):
+        await loop.run_in_executor(None, diagnostics.start_tracing)
+        await update.message.reply_text("tracemalloc فعال و مبنا ثبت شد. بعداً /mem را بزن تا رشد را ببینی.")
+        return
+    if action == "stop":
+        diagnostics.stop_tracing()
+        await update.message.reply_text("tracemalloc خاموش شد.")
+        return
+    report = await loop.run_in_executor(None, diagnostics.full_report, diagnostics.TOP_N, diagnostics.task_count())
+    await update.message.reply_text(diagnostics.report_text(report)[:4000])
+
+# /looplag — تأخیر event loop و آخرین بلاک‌شدن‌ها (فقط ادمین)
+@logged_handler("loop_lag")
+async def loop_lag(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    await update.message.reply_text(loop_monitor.stats_text())
+
+# /upstreams — تأخیر، hedge و وضعیت مدار سرویس‌های بیرونی (فقط ادمین)
+@logged_handler("upstream_stats")
+async def upstream_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    await update.message.reply_text(resilience.stats_text())
+
+# /cachestats — hit-rate و مصرف توکن تحلیل عمیق (فقط ادمین)
+@logged_handler("deep_cache_stats")
+async def deep_cache_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if update.effective_user.id not in ADMIN_ID_LIST:
+        return
+    await update.message.reply_text(cache_report())
+
 # هندلر بستن تحلیل تکنیکال
+@logged_handler("close_tech_callback")
 async def close_tech_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
     query = update.callback_query
     await query.answer()
@@ -830,25 +1216,60 @@ async def close_tech_callback(update: Update, context: ContextTypes.DEFAULT_TYPE
 # -------------------------
 async def main():
     try:
-        print("راه‌اندازی ربات...")
+        logger.info("راه‌اندازی ربات...")
+        # کارهای run_in_executor(None, ...) زمینهٔ لاگ آپدیت (handler، user_id) را نگه می‌دارند
+        asyncio.get_running_loop().set_default_executor(
+            bot_logging.ContextThreadPoolExecutor(thread_name_prefix="executor"))
         init_db()
+        tron_verifier.init_tron_table()
+        admin_reports.init_report_views()
         init_cache_table()
+        alerts.init_alerts_table()
+        alerts.load_active_alerts()
+        coin_metadata.init_metadata_table()
+        rate_limit.init_rate_limit_table()
+        try:
+            invalidation.start_listener()
+        except Exception as e:
+            # باس ابطال اختیاری است؛ جاب ensure_listener هر ۳۰ ثانیه دوباره وصل می‌شود
+            logger.warning("شنونده ابطال کش راه نیفتاد: %s", e, extra={"event": "invalidation.start_error"})
+        inline_search.build_index(coin_metadata.search_entries())
         #init_tech_cache_table()
-        app = ApplicationBuilder().token(BOT_TOKEN).build()
+        # پردازش همزمان آپدیت‌ها؛ سقف هر هندلر سنگین با concurrency_limit کنترل می‌شود
+        # همهٔ ارسال/ویرایش/حذف‌ها از زمان‌بند outbound رد می‌شوند (سقف تلگرام، اولویت، RetryAfter)
+        app = (ApplicationBuilder().token(BOT_TOKEN).concurrent_updates(CONCURRENT_UPDATES)
+               .rate_limiter(outbound.LIMITER).build())
+
+        # محدودیت نرخ هر کاربر — قبل از همهٔ هندلرها
+        rate_limit.install(app, ADMIN_ID_LIST)
 
         # هندلرها — همه با ۸ اسپیس
         app.add_handler(CommandHandler("start", start))
         app.add_handler(CommandHandler("check", check_subscription))
         app.add_handler(CommandHandler("verify", verify_tx))
+        app.add_handler(CommandHandler("techstats", tech_stats))
+        app.add_handler(CommandHandler("limits", limits_stats))
+        app.add_handler(CommandHandler("cachestats", deep_cache_stats))
+        app.add_handler(CommandHandler("looplag", loop_lag))
+        app.add_handler(CommandHandler("upstreams", upstream_stats))
+        app.add_handler(CommandHandler("stats", admin_stats))
+        app.add_handler(CommandHandler("export", admin_export))
+        app.add_handler(CommandHandler("mem", memory_diagnostics))
+        app.add_handler(CommandHandler(["bullish", "bearish"], show_fresh_reversals))
+        app.add_handler(CommandHandler("alert", set_price_alert))
+        app.add_handler(CommandHandler("alerts", list_price_alerts))
+        app.add_handler(CommandHandler("delalert", delete_price_alert))
 
         app.add_handler(MessageHandler(filters.Regex(r"^(وضعیت کلی بازار|بررسی اشتراک|اشتراک و پرداخت)$"), handle_keyboard_buttons))
-        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & ~filters.Regex(r"^(وضعیت کلی بازار|بررسی اشتراک|اشتراک و پرداخت)$"), crypto_info))
+        app.add_handler(MessageHandler(filters.TEXT & ~filters.COMMAND & ~filters.Regex(r"^(وضعیت کلی بازار|بررسی اشتراک|اشتراک و پرداخت)$"), concurrency_limit("crypto_info", COIN_MAX_CONCURRENT)(crypto_info)))
 
         app.add_handler(CallbackQueryHandler(admin_payment_callback, pattern=r"^(pay_ok|pay_no):"))
-        app.add_handler(CallbackQueryHandler(handle_details_callback, pattern=r"^details_"))
+        app.add_handler(CallbackQueryHandler(concurrency_limit("details", DETAILS_MAX_CONCURRENT)(handle_details_callback), pattern=r"^details_"))
         app.add_handler(CallbackQueryHandler(handle_close_details, pattern=r"^close_details_"))
-        app.add_handler(CallbackQueryHandler(handle_tech_callback, pattern=r"^tech_"))
+        app.add_handler(CallbackQueryHandler(concurrency_limit("tech", TECH_MAX_CONCURRENT)(handle_tech_callback), pattern=r"^tech_"))
         app.add_handler(CallbackQueryHandler(close_tech_callback, pattern=r"^close_tech$"))
+        # حالت inline باید در BotFather با /setinline فعال شده باشد
+        app.add_handler(InlineQueryHandler(inline_query))
         
 
         await set_bot_commands(app.bot)
@@ -856,6 +1277,8 @@ async def main():
 
         await app.initialize()
         await app.start()
+        loop_monitor.start()
+        await diagnostics.start_server()
 
         # ... بقیه کدها
 
@@ -873,15 +1296,33 @@ async def main():
         scheduler.add_job(check_and_notify_renewals, "interval", days=1)
         scheduler.add_job(lambda: asyncio.create_task(send_pending_renewal_notifications(app.bot)), "interval", days=1)
         scheduler.add_job(lambda: asyncio.create_task(check_and_select_api_key(app.bot)), "interval", hours=6)
+        scheduler.add_job(screener.run_scan, "interval", minutes=30, next_run_time=datetime.now())
+        scheduler.add_job(alerts.check_price_alerts, "interval", seconds=30, args=[app.bot])
+        scheduler.add_job(rate_limit.prune, "interval", minutes=10)
+        scheduler.add_job(invalidation.ensure_listener, "interval", seconds=30)
+        scheduler.add_job(charts.prerender_hot, "interval", minutes=5)
+        scheduler.add_job(admin_reports.refresh_report_views, "interval", minutes=REPORT_REFRESH_MINUTES)
+        scheduler.add_job(tron_verifier.verify_pending, "interval", seconds=TRON_VERIFY_INTERVAL,
+                          args=[app.bot, activate_user_subscription, to_shamsi])
+        # متادیتای کوین‌ها روزی یک بار؛ اگر جدول خالی است همین الان
+        # (next_run_time=None در APScheduler یعنی جاب متوقف، پس فقط در صورت نیاز پاس داده می‌شود)
+        metadata_job = {"next_run_time": datetime.now()} if coin_metadata.metadata_count() == 0 else {}
+        scheduler.add_job(refresh_coin_metadata, "interval", days=1, **metadata_job)
         scheduler.start()
 
-        print("ربات اجرا شد")
+        logger.info("ربات اجرا شد")
         await asyncio.Event().wait()
     except Exception as e:
-        print(f"Error in main: {e}")
+        logger.exception("Error in main: %s", e, extra={"event": "main.crash"})
         raise
     finally:
+        loop_monitor.stop()
+        analysis_pool.shutdown()
+        resilience.shutdown()
+        invalidation.stop_listener()
+        bot_logging.stop_logging()
         try:
+            await diagnostics.stop_server()
             await app.stop()
             await app.shutdown()
         except Exception:
@@ -0,0 +1,311 @@
+# outbound.py
+# زمان‌بند مرکزی همهٔ درخواست‌های خروجی به تلگرام (ارسال، ویرایش، حذف) به‌عنوان rate limiter
+# خود PTB، پس هر bot.send_message / edit_message_text / message.delete بدون تغییر از آن رد می‌شود:
+# - سقف سراسری (پنجرهٔ ۱ ثانیه‌ای) و سطل توکن هر چت (خصوصی ~۱ پیام در ثانیه، گروه/کانال ۲۰ در دقیقه)
+# - اولویت: جواب‌های تعاملی قبل از ارسال‌های گروهی (rate_limit_args=BULK) و چند اسلات رزرو برایشان
+# - ویرایش‌های پشت‌سرهم یک پیام که هنوز ارسال نشده‌اند یکی می‌شوند (فقط آخرین متن می‌رود)؛
+#   حذف پیام، ویرایش‌های در صف همان پیام را بی‌اثر می‌کند
+# - RetryAfter: همان چت (یا کل ارسال) به اندازهٔ retry_after متوقف و درخواست دوباره صف می‌شود
+import logging
+import os
+import time
+import asyncio
+from collections import deque, OrderedDict
+
+from telegram.error import RetryAfter
+from telegram.ext import BaseRateLimiter
+
+logger = logging.getLogger(__name__)
+
+OUTBOUND_GLOBAL_RATE = int(os.getenv("OUTBOUND_GLOBAL_RATE", "30"))        # درخواست در ثانیه
+OUTBOUND_BULK_RESERVE = int(os.getenv("OUTBOUND_BULK_RESERVE", "3"))       # اسلات‌های مخصوص تعاملی
+OUTBOUND_PRIVATE_RATE = float(os.getenv("OUTBOUND_PRIVATE_RATE", "1"))     # پیام در ثانیه برای هر کاربر
+OUTBOUND_GROUP_RATE = float(os.getenv("OUTBOUND_GROUP_RATE", str(20 / 60)))
+OUTBOUND_CHAT_BURST = int(os.getenv("OUTBOUND_CHAT_BURST", "3"))           # چند پیام پشت‌سرهم مجاز
+OUTBOUND_MAX_RETRIES = int(os.getenv("OUTBOUND_MAX_RETRIES", "3"))
+MAX_BUCKETS = 20000
+
+# مقدار rate_limit_args در فراخوانی‌های bot
+INTERACTIVE = 0
+BULK = 1
+
+# فقط این endpointها در صف می‌روند؛ answerCallbackQuery، answerInlineQuery و getterها مستقیم
+_QUEUED_PREFIXES = ("send", "edit", "delete", "copy", "forward")
+# حذف پیام جزو سهمیهٔ پیام هر چت نیست (ولی در سقف سراسری حساب می‌شود)
+_NO_CHAT_TOKEN = ("deleteMessage", "sendChatAction")
+
+
+class _Entry:
+    __slots__ = ("priority", "chat", "endpoint", "callback", "args", "kwargs",
+                 "waiters", "merge_key", "attempts", "queued_at", "dropped")
+
+    def __init__(self, priority, chat, endpoint, callback, args, kwargs, merge_key):
+        self.priority = priority
+        self.chat = chat
+        self.endpoint = endpoint
+        self.callback = callback
+        self.args = args
+        self.kwargs = kwargs
+        self.waiters = [asyncio.get_running_loop().create_future()]
+        self.merge_key = merge_key
+        self.attempts = 0
+        self.queued_at = time.monotonic()
+        self.dropped = False
+
+    def resolve(self, result=None, error=None):
+        for f in self.waiters:
+            if f.done():
+                continue
+            if error is not None:
+                f.set_exception(error)
+            else:
+                f.set_result(result)
+
+
+class _ChatBucket:
+    __slots__ = ("tokens", "updated", "rate", "blocked_until")
+
+    def __init__(self, rate: float):
+        self.tokens = float(OUTBOUND_CHAT_BURST)
+        self.updated = time.monotonic()
+        self.rate = rate
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(OUTBOUND_CHAT_BURST, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def ready_at(self, now) -> float:
+        self._refill(now)
+        at = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(at, self.blocked_until)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def idle(self, now) -> bool:
+        self._refill(now)
+        return self.tokens >= OUTBOUND_CHAT_BURST and self.blocked_until <= now
+
+
+def _chat_key(data: dict):
+    chat = data.get("chat_id")
+    return None if chat is None else str(chat)
+
+
+def _merge_key(endpoint: str, data: dict):
+    if not endpoint.startswith("edit"):
+        return None
+    if data.get("inline_message_id"):
+        return (endpoint, data["inline_message_id"])
+    return (endpoint, _chat_key(data), data.get("message_id"))
+
+
+class OutboundLimiter(BaseRateLimiter):
+    def __init__(self):
+        self.queues = {INTERACTIVE: OrderedDict(), BULK: OrderedDict()}   # اولویت -> چت -> صف
+        self.buckets = {}
+        self.window = deque()        # زمان ارسال‌های ۱ ثانیهٔ اخیر
+        self.paused_until = 0.0      # RetryAfter بدون چت (سراسری)
+        self.pending_edits = {}      # merge_key -> _Entry هنوز ارسال‌نشده
+        self.wakeup = None
+        self.task = None
+        self.inflight = set()
+        self.stats = {"sent": 0, "merged_edits": 0, "dropped_edits": 0, "retry_after": 0, "failed": 0,
+                      "wait_ms_max": {INTERACTIVE: 0.0, BULK: 0.0}}
+
+    async def initialize(self):
+        if self.task is None:
+            self.wakeup = asyncio.Event()
+            self.task = asyncio.create_task(self._dispatch(), name="outbound-dispatch")
+
+    async def shutdown(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+            self.task = None
+        for chats in self.queues.values():
+            for queue in chats.values():
+                for entry in queue:
+                    entry.resolve(error=asyncio.CancelledError())
+            chats.clear()
+        self.pending_edits.clear()
+
+    # ---------- ورود درخواست ----------
+    async def process_request(self, callback, args, kwargs, endpoint, data, rate_limit_args):
+        if self.task is None or not endpoint.startswith(_QUEUED_PREFIXES):
+            return await callback(*args, **kwargs)
+
+        priority = BULK if rate_limit_args == BULK else INTERACTIVE
+        merge_key = _merge_key(endpoint, data)
+
+        # ویرایش جدید پیامی که ویرایش قبلی‌اش هنوز در صف است: جای قبلی، محتوای جدید
+        pending = self.pending_edits.get(merge_key) if merge_key else None
+        if pending is not None:
+            pending.args, pending.kwargs = args, kwargs
+            waiter = asyncio.get_running_loop().create_future()
+            pending.waiters.append(waiter)
+            self.stats["merged_edits"] += 1
+            return await waiter
+
+        if endpoint == "deleteMessage":
+            self._drop_edits(_chat_key(data), data.get("message_id"))
+
+        entry = _Entry(priority, _chat_key(data), endpoint, callback, args, kwargs, merge_key)
+        if merge_key:
+            self.pending_edits[merge_key] = entry
+        self._enqueue(entry)
+        return await entry.waiters[0]
+
+    def _enqueue(self, entry: _Entry, front: bool = False):
+        chats = self.queues[entry.priority]
+        queue = chats.get(entry.chat)
+        if queue is None:
+            queue = chats[entry.chat] = deque()
+        if front:
+            queue.appendleft(entry)
+        else:
+            queue.append(entry)
+        self.wakeup.set()
+
+    def _drop_edits(self, chat, message_id):
+        """پیام در حال حذف است؛ ویرایش‌های در صفش ارسال نمی‌شوند"""
+        for key in [k for k in self.pending_edits if k[1:] == (chat, message_id)]:
+            entry = self.pending_edits.pop(key)
+            entry.dropped = True
+            entry.resolve(True)
+            self.stats["dropped_edits"] += 1
+
+    # ---------- ارسال ----------
+    def _bucket(self, chat) -> _ChatBucket:
+        bucket = self.buckets.get(chat)
+        if bucket is None:
+            if len(self.buckets) >= MAX_BUCKETS:
+                now = time.monotonic()
+                for key in [k for k, b in self.buckets.items() if b.idle(now)]:
+                    del self.buckets[key]
+            private = not chat.startswith(("-", "@"))
+            bucket = self.buckets[chat] = _ChatBucket(OUTBOUND_PRIVATE_RATE if private else OUTBOUND_GROUP_RATE)
+        return bucket
+
+    def _chat_ready_at(self, entry: _Entry, now: float) -> float:
+        if entry.chat is None:   # ویرایش پیام inline: فقط سقف سراسری
+            return now
+        bucket = self._bucket(entry.chat)
+        if entry.endpoint in _NO_CHAT_TOKEN:
+            return max(now, bucket.blocked_until)
+        return bucket.ready_at(now)
+
+    def _next(self, now: float):
+        """(درخواست بعدی، یا None و زمان آماده شدن زودترین چت)"""
+        earliest = None
+        while self.window and now - self.window[0] >= 1:
+            self.window.popleft()
+        for priority, chats in self.queues.items():
+            # بخشی از سقف سراسری فقط برای جواب‌های تعاملی
+            limit = OUTBOUND_GLOBAL_RATE - (OUTBOUND_BULK_RESERVE if priority == BULK else 0)
+            if len(self.window) >= limit:
+                ready = self.window[len(self.window) - limit] + 1
+                earliest = ready if earliest is None else min(earliest, ready)
+                continue
+            for chat in list(chats):
+                queue = chats[chat]
+                while queue and queue[0].dropped:
+                    queue.popleft()
+                if not queue:
+                    del chats[chat]
+                    continue
+                ready = self._chat_ready_at(queue[0], now)
+                if ready <= now:
+                    entry = queue.popleft()
+                    if queue:
+                        chats.move_to_end(chat)   # نوبت چرخشی بین چت‌ها
+                    else:
+                        del chats[chat]
+                    return entry, None
+                earliest = ready if earliest is None else min(earliest, ready)
+        return None, earliest
+
+    async def _dispatch(self):
+        while True:
+            try:
+                await self._dispatch_one()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # حلقه نباید بمیرد، وگرنه همهٔ ارسال‌ها منتظر می‌مانند
+                logger.exception("خطا در زمان‌بند ارسال: %s", e, extra={"event": "outbound.dispatch_error"})
+                await asyncio.sleep(0.1)
+
+    async def _dispatch_one(self):
+        now = time.monotonic()
+        if self.paused_until > now:
+            await asyncio.sleep(self.paused_until - now)
+            return
+        self.wakeup.clear()
+        entry, ready_at = self._next(now)
+        if entry is None:
+            timeout = None if ready_at is None else max(ready_at - now, 0.005)
+            try:
+                await asyncio.wait_for(self.wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            return
+        if entry.merge_key and self.pending_edits.get(entry.merge_key) is entry:
+            del self.pending_edits[entry.merge_key]
+        self.window.append(now)
+        if entry.chat is not None and entry.endpoint not in _NO_CHAT_TOKEN:
+            self._bucket(entry.chat).take(now)
+        waited = (now - entry.queued_at) * 1000
+        if waited > self.stats["wait_ms_max"][entry.priority]:
+            self.stats["wait_ms_max"][entry.priority] = waited
+        task = asyncio.create_task(self._send(entry))
+        self.inflight.add(task)
+        task.add_done_callback(self.inflight.discard)
+
+    async def _send(self, entry: _Entry):
+        try:
+            result = await entry.callback(*entry.args, **entry.kwargs)
+        except RetryAfter as e:
+            self.stats["retry_after"] += 1
+            delay = e.retry_after.total_seconds() if hasattr(e.retry_after, "total_seconds") else e.retry_after
+            retry_at = time.monotonic() + delay
+            logger.warning("RetryAfter %s برای %s (چت %s)", e.retry_after, entry.endpoint, entry.chat,
+                           extra={"event": "outbound.retry_after", "endpoint": entry.endpoint, "chat": entry.chat})
+            if entry.chat is None:
+                self.paused_until = max(self.paused_until, retry_at)
+            else:
+                bucket = self._bucket(entry.chat)
+                bucket.blocked_until = max(bucket.blocked_until, retry_at)
+            entry.attempts += 1
+            if entry.attempts > OUTBOUND_MAX_RETRIES:
+                self.stats["failed"] += 1
+                entry.resolve(error=e)
+                return
+            self._enqueue(entry, front=True)
+            return
+        except Exception as e:
+            # بقیهٔ خطاها مال صدازننده است (BaseRateLimiter نباید آن‌ها را بخورد)
+            self.stats["failed"] += 1
+            entry.resolve(error=e)
+            return
+        self.stats["sent"] += 1
+        entry.resolve(result)
+
+    # ---------- گزارش ----------
+    def queue_depth(self, priority: int) -> int:
+        return sum(len(q) for q in self.queues[priority].values())
+
+    def stats_text(self) -> str:
+        s = self.stats
+        return (f"ارسال به تلگرام: {s['sent']} موفق، {s['failed']} خطا، {s['retry_after']} RetryAfter\n"
+                f"صف: تعاملی {self.queue_depth(INTERACTIVE)}، گروهی {self.queue_depth(BULK)} | "
+                f"بیشترین انتظار: تعاملی {s['wait_ms_max'][INTERACTIVE]:.0f}ms، گروهی {s['wait_ms_max'][BULK]:.0f}ms\n"
+                f"ویرایش‌های ادغام‌شده: {s['merged_edits']} | حذف‌شده پیش از ارسال: {s['dropped_edits']}")
+
+
+LIMITER = OutboundLimiter()
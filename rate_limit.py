@@ -0,0 +1,211 @@
+# rate_limit.py
+# لایهٔ محدودیت جلوی هندلرها:
+# - سطل توکن برای هر کاربر (TypeHandler در گروه -1 قبل از همهٔ هندلرها)
+# - سقف اجرای همزمان برای هر هندلر سنگین (CMC / بایننس / OpenAI)
+# در هر دو حالت، به‌جای صف کردن، فوراً پیام «شلوغه» برمی‌گردد.
+# وضعیت سطل‌ها در حافظه است؛ با RATE_LIMIT_SHARED=1 بین چند اینستنس در Postgres مشترک می‌شود.
+import logging
+import os
+import time
+import asyncio
+import functools
+
+import psycopg2
+from psycopg2.extras import DictCursor
+from telegram import Update
+from telegram.ext import ApplicationHandlerStop, TypeHandler
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "8"))        # ظرفیت سطل
+RATE_LIMIT_PER_MIN = float(os.getenv("RATE_LIMIT_PER_MIN", "20"))   # نرخ پرشدن
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "0") == "1"
+WARN_INTERVAL = 10  # هر کاربر حداکثر هر ۱۰ ثانیه یک پیام هشدار می‌گیرد
+
+BUSY_TEXT = "سرور الان شلوغه. چند لحظه دیگه دوباره امتحان کن."
+SLOW_DOWN_TEXT = "یه کم آروم‌تر! چند ثانیه صبر کن و دوباره امتحان کن."
+
+# دکمه‌هایی که هزینه‌ای ندارند (کوئری‌های inline هم از حافظه جواب داده می‌شوند و رایگان‌اند)
+FREE_CALLBACK_PREFIXES = ("close_",)
+
+STATS = {"allowed": 0, "limited": 0, "busy": 0}
+
+
+def get_db_connection():
+    return psycopg2.connect(DATABASE_URL, cursor_factory=DictCursor)
+
+def init_rate_limit_table():
+    """جدول سطل‌های مشترک (فقط وقتی RATE_LIMIT_SHARED فعال است)"""
+    if not RATE_LIMIT_SHARED:
+        return
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE UNLOGGED TABLE IF NOT EXISTS rate_limit_buckets (
+            telegram_id BIGINT PRIMARY KEY,
+            tokens DOUBLE PRECISION NOT NULL,
+            updated_at DOUBLE PRECISION NOT NULL
+        );
+    """)
+    conn.commit()
+    cur.close()
+    conn.close()
+    logger.info("جدول محدودیت نرخ آماده است.")
+
+
+# -------------------------
+# سطل توکن
+# -------------------------
+class TokenBuckets:
+    """سطل توکن در حافظه برای هر کاربر"""
+
+    def __init__(self, capacity: float, per_minute: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.buckets = {}  # telegram_id -> [tokens, updated_at]
+
+    def take(self, key, cost: float = 1.0) -> bool:
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [self.capacity, now]
+        tokens = min(self.capacity, bucket[0] + (now - bucket[1]) * self.rate)
+        bucket[1] = now
+        if tokens < cost:
+            bucket[0] = tokens
+            return False
+        bucket[0] = tokens - cost
+        return True
+
+    def prune(self):
+        """حذف سطل‌های پر (کاربرانی که مدتی فعال نبوده‌اند)"""
+        now = time.monotonic()
+        full_after = self.capacity / self.rate
+        for key, b in list(self.buckets.items()):
+            if now - b[1] > full_after:
+                self.buckets.pop(key, None)
+
+
+def _take_shared(telegram_id: int, cost: float = 1.0) -> bool:
+    """همان الگوریتم سطل توکن، به‌صورت اتمیک در یک UPSERT"""
+    now = time.time()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("""
+            INSERT INTO rate_limit_buckets AS b (telegram_id, tokens, updated_at)
+            VALUES (%(id)s, %(cap)s - %(cost)s, %(now)s)
+            ON CONFLICT (telegram_id) DO UPDATE SET
+                tokens = LEAST(%(cap)s, b.tokens + (%(now)s - b.updated_at) * %(rate)s) - %(cost)s,
+                updated_at = %(now)s
+            WHERE LEAST(%(cap)s, b.tokens + (%(now)s - b.updated_at) * %(rate)s) >= %(cost)s
+            RETURNING tokens
+        """, {"id": telegram_id, "cap": RATE_LIMIT_BURST, "cost": cost, "now": now, "rate": RATE_LIMIT_PER_MIN / 60.0})
+        allowed = cur.fetchone() is not None
+        conn.commit()
+        return allowed
+    finally:
+        cur.close()
+        conn.close()
+
+
+BUCKETS = TokenBuckets(RATE_LIMIT_BURST, RATE_LIMIT_PER_MIN)
+_last_warned = {}   # telegram_id -> زمان آخرین پیام هشدار
+
+
+def prune():
+    """جاب دوره‌ای: سطل‌های پر و هشدارهایی که دیگر جلوی هشدار بعدی را نمی‌گیرند"""
+    BUCKETS.prune()
+    now = time.monotonic()
+    for user_id, warned_at in list(_last_warned.items()):
+        if now - warned_at > WARN_INTERVAL:
+            _last_warned.pop(user_id, None)
+
+
+async def _reply_busy(update: Update, text: str):
+    try:
+        if update.callback_query:
+            await update.callback_query.answer(text, show_alert=False)
+        elif update.effective_message:
+            await update.effective_message.reply_text(text)
+    except Exception:
+        pass
+
+
+def _is_free(update: Update) -> bool:
+    if update.inline_query is not None:
+        return True
+    query = update.callback_query
+    return bool(query and query.data and query.data.startswith(FREE_CALLBACK_PREFIXES))
+
+
+def make_guard(admin_ids: list):
+    async def rate_limit_guard(update: Update, context):
+        user = update.effective_user
+        if user is None or user.id in admin_ids or _is_free(update):
+            return
+        if RATE_LIMIT_SHARED:
+            try:
+                loop = asyncio.get_running_loop()
+                allowed = await loop.run_in_executor(None, _take_shared, user.id)
+            except Exception as e:
+                logger.error("خطا در محدودیت نرخ مشترک: %s", e, extra={"event": "rate_limit.shared_error"})
+                allowed = BUCKETS.take(user.id)
+        else:
+            allowed = BUCKETS.take(user.id)
+
+        if allowed:
+            STATS["allowed"] += 1
+            return
+
+        STATS["limited"] += 1
+        now = time.monotonic()
+        if update.callback_query or now - _last_warned.get(user.id, 0) > WARN_INTERVAL:
+            _last_warned[user.id] = now
+            await _reply_busy(update, SLOW_DOWN_TEXT)
+        raise ApplicationHandlerStop
+    return rate_limit_guard
+
+
+def install(app, admin_ids: list):
+    """ثبت middleware در گروه -1 تا قبل از همهٔ هندلرها اجرا شود"""
+    app.add_handler(TypeHandler(Update, make_guard(admin_ids)), group=-1)
+
+
+# -------------------------
+# سقف همزمانی هر هندلر
+# -------------------------
+ACTIVE = {}   # name -> تعداد در حال اجرا
+LIMITS = {}   # name -> سقف
+
+
+def concurrency_limit(name: str, limit: int):
+    """دکوریتور: اگر name به سقف رسیده باشد، بلافاصله «شلوغه» جواب می‌دهد"""
+    LIMITS[name] = limit
+    ACTIVE.setdefault(name, 0)
+
+    def decorator(handler):
+        @functools.wraps(handler)
+        async def wrapper(update: Update, context):
+            if ACTIVE[name] >= limit:
+                STATS["busy"] += 1
+                await _reply_busy(update, BUSY_TEXT)
+                return
+            ACTIVE[name] += 1
+            try:
+                return await handler(update, context)
+            finally:
+                ACTIVE[name] -= 1
+        return wrapper
+    return decorator
+
+
+def stats_text() -> str:
+    lines = [
+        "محدودیت نرخ:",
+        f"مجاز: {STATS['allowed']} | محدودشده: {STATS['limited']} | شلوغ: {STATS['busy']}",
+        f"سطل‌های فعال: {len(BUCKETS.buckets)}" + (" (مشترک در Postgres)" if RATE_LIMIT_SHARED else ""),
+    ]
+    lines += [f"{name}: {ACTIVE[name]} / {LIMITS[name]}" for name in LIMITS]
+    return "\n".join(lines)
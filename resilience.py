@@ -0,0 +1,258 @@
+# resilience.py
+# لایهٔ تاب‌آوری برای سرویس‌های بیرونی (CMC، بایننس، OpenAI):
+# - بودجهٔ زمانی برای هر سرویس: کاربر بیشتر از این منتظر نمی‌ماند (نه timeout کامل requests)
+# - درخواست hedge برای خواندن‌های idempotent و رایگان (بایننس): اگر جواب تا p95 تأخیرهای اخیر
+#   نرسید، یک نسخهٔ دوم موازی فرستاده می‌شود و اولین جواب برنده است
+# - circuit breaker: با نرخ خطای بالا مدار باز می‌شود و تا پایان cooldown درخواست‌ها فوراً رد
+#   می‌شوند (CircuitOpen) تا هندلر سریع جواب بدهد یا از کش قدیمی استفاده کند
+import logging
+import os
+import time
+import asyncio
+import functools
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import requests
+
+import bot_logging
+
+logger = logging.getLogger(__name__)
+
+RESILIENCE_WORKERS = int(os.getenv("RESILIENCE_WORKERS", "16"))
+BREAKER_WINDOW = float(os.getenv("BREAKER_WINDOW", "60"))          # ثانیه، پنجرهٔ نرخ خطا
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "8"))
+BREAKER_ERROR_RATE = float(os.getenv("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN = float(os.getenv("BREAKER_COOLDOWN", "30"))       # ثانیه تا آزمایش دوباره
+HEDGE_MIN_DELAY = 0.1
+HEDGE_DEFAULT_DELAY = 1.0   # تا وقتی نمونهٔ کافی برای p95 نیست
+LATENCY_SAMPLES = 200
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+class UpstreamError(Exception):
+    """سرویس بیرونی در بودجه جواب نداد یا مدارش باز است"""
+
+
+class CircuitOpen(UpstreamError):
+    pass
+
+
+class BudgetExceeded(UpstreamError):
+    pass
+
+
+def _status_code(error):
+    """کد HTTP خطا (HTTPError در requests یا BinanceAPIException)"""
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status if isinstance(status, int) else None
+
+
+def is_upstream_failure(error) -> bool:
+    """خطاهای ۴xx (نماد اشتباه، پارامتر نامعتبر) تقصیر سرویس نیستند و مدار را باز نمی‌کنند"""
+    status = _status_code(error)
+    return status is None or status >= 500 or status in (408, 418, 429)
+
+
+def http_get(url, **kwargs):
+    """requests.get که خطای HTTP را داخل ترد بالا می‌آورد تا در آمار breaker حساب شود"""
+    resp = requests.get(url, **kwargs)
+    resp.raise_for_status()
+    return resp
+
+
+def http_post(url, **kwargs):
+    resp = requests.post(url, **kwargs)
+    resp.raise_for_status()
+    return resp
+
+
+def _get_pool() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = bot_logging.ContextThreadPoolExecutor(max_workers=RESILIENCE_WORKERS, thread_name_prefix="upstream")
+    return _pool
+
+
+class Upstream:
+    def __init__(self, name: str, budget: float, hedge: bool = False):
+        self.name = name
+        self.budget = budget
+        self.hedge = hedge
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.outcomes = deque()   # (زمان، موفق؟) در BREAKER_WINDOW اخیر
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._probe = False
+        self._lock = threading.Lock()
+        self.stats = {"calls": 0, "ok": 0, "errors": 0, "timeouts": 0, "short_circuited": 0,
+                      "hedged": 0, "hedge_wins": 0, "trips": 0}
+
+    # ---------- circuit breaker ----------
+    def _admit(self):
+        with self._lock:
+            if self.state == OPEN:
+                if time.monotonic() - self.opened_at < BREAKER_COOLDOWN:
+                    self.stats["short_circuited"] += 1
+                    raise CircuitOpen(self.name)
+                self.state = HALF_OPEN
+                self._probe = False
+            if self.state == HALF_OPEN:
+                # در half-open فقط یک درخواست آزمایشی
+                if self._probe:
+                    self.stats["short_circuited"] += 1
+                    raise CircuitOpen(self.name)
+                self._probe = True
+            self.stats["calls"] += 1
+
+    def _record(self, ok: bool, latency: float = None):
+        now = time.monotonic()
+        with self._lock:
+            if ok:
+                self.stats["ok"] += 1
+                self.latencies.append(latency)
+            else:
+                self.stats["errors"] += 1
+            if self.state == HALF_OPEN:
+                self.state = CLOSED if ok else OPEN
+                self._probe = False
+                if ok:
+                    self.outcomes.clear()
+                    logger.info("مدار %s دوباره بسته شد.", self.name, extra={"event": "circuit.close", "upstream": self.name})
+                else:
+                    self.opened_at = now
+                return
+            self.outcomes.append((now, ok))
+            while self.outcomes and now - self.outcomes[0][0] > BREAKER_WINDOW:
+                self.outcomes.popleft()
+            failures = sum(1 for _, success in self.outcomes if not success)
+            if (self.state == CLOSED and len(self.outcomes) >= BREAKER_MIN_CALLS
+                    and failures / len(self.outcomes) >= BREAKER_ERROR_RATE):
+                self.state = OPEN
+                self.opened_at = now
+                self.stats["trips"] += 1
+                logger.warning("مدار %s باز شد: %s/%s خطا", self.name, failures, len(self.outcomes),
+                               extra={"event": "circuit.open", "upstream": self.name})
+
+    def is_open(self) -> bool:
+        return self.state == OPEN and time.monotonic() - self.opened_at < BREAKER_COOLDOWN
+
+    # ---------- تأخیرها ----------
+    def percentile(self, q: float):
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    def hedge_delay(self) -> float:
+        p95 = self.percentile(0.95) if len(self.latencies) >= 20 else None
+        delay = HEDGE_DEFAULT_DELAY if p95 is None else p95
+        return min(max(delay, HEDGE_MIN_DELAY), self.budget / 2)
+
+    # ---------- اجرا ----------
+    def call_sync(self, fn, *args, idempotent: bool = True, **kwargs):
+        """اجرای fn در ThreadPool با بودجه/hedge/breaker؛ برای صدازننده‌های همزمان (ترد)"""
+        self._admit()
+        started = time.monotonic()
+        pool = _get_pool()
+        futures = [pool.submit(fn, *args, **kwargs)]
+        deadline = started + self.budget
+        if self.hedge and idempotent:
+            done, _ = wait(futures, timeout=self.hedge_delay())
+            if not done:
+                self.stats["hedged"] += 1
+                futures.append(pool.submit(fn, *args, **kwargs))
+        return self._collect(futures, deadline, started, lambda fs, timeout: wait(fs, timeout, FIRST_COMPLETED))
+
+    async def call(self, fn, *args, idempotent: bool = True, **kwargs):
+        """نسخهٔ async: event loop هرگز منتظر I/O نمی‌ماند"""
+        self._admit()
+        started = time.monotonic()
+        pool = _get_pool()
+        loop = asyncio.get_running_loop()
+        job = functools.partial(fn, *args, **kwargs)
+        futures = [loop.run_in_executor(pool, job)]
+        deadline = started + self.budget
+        if self.hedge and idempotent:
+            done, _ = await asyncio.wait(futures, timeout=self.hedge_delay())
+            if not done:
+                self.stats["hedged"] += 1
+                futures.append(loop.run_in_executor(pool, job))
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = await asyncio.wait(pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    return self._success(f is not futures[0], started, f.result())
+                error = f.exception()
+        return self._failure(error, started)
+
+    def _collect(self, futures, deadline, started, waiter):
+        pending = set(futures)
+        error = None
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = waiter(pending, remaining)
+            for f in done:
+                if f.exception() is None:
+                    return self._success(f is not futures[0], started, f.result())
+                error = f.exception()
+        return self._failure(error, started)
+
+    def _success(self, hedge_won: bool, started: float, result):
+        if hedge_won:
+            self.stats["hedge_wins"] += 1
+        self._record(True, time.monotonic() - started)
+        return result
+
+    def _failure(self, error, started: float):
+        if error is not None:
+            # جواب ۴xx یعنی سرویس سالم است؛ فقط خطا به صدازننده برمی‌گردد
+            upstream_ok = not is_upstream_failure(error)
+            self._record(upstream_ok, time.monotonic() - started if upstream_ok else None)
+            raise error
+        self._record(False)
+        self.stats["timeouts"] += 1
+        raise BudgetExceeded(f"{self.name}: بیش از {self.budget:g} ثانیه")
+
+    def summary(self) -> str:
+        p50, p95 = self.percentile(0.5), self.percentile(0.95)
+        fmt = lambda x: "-" if x is None else f"{x * 1000:.0f}ms"
+        s = self.stats
+        return (f"{self.name} [{self.state}] بودجه {self.budget:g}s | p50 {fmt(p50)} p95 {fmt(p95)}\n"
+                f"  {s['calls']} فراخوانی، {s['errors']} خطا ({s['timeouts']} فراتر از بودجه)، "
+                f"{s['short_circuited']} رد فوری، {s['trips']} بار باز شدن | hedge: {s['hedged']} (برد {s['hedge_wins']})")
+
+
+# هر درخواست CMC اعتبار مصرف می‌کند و hedge در کندی‌ها مصرف را دو برابر می‌کند: فقط بودجه و breaker
+CMC = Upstream("cmc", float(os.getenv("CMC_BUDGET", "4")))
+BINANCE = Upstream("binance", float(os.getenv("BINANCE_BUDGET", "5")), hedge=True)
+# تحلیل OpenAI گران و غیرتکراری است: فقط بودجه و breaker، بدون hedge
+OPENAI = Upstream("openai", float(os.getenv("OPENAI_BUDGET", "30")))
+UPSTREAMS = (CMC, BINANCE, OPENAI)
+
+
+def stats_text() -> str:
+    return "سرویس‌های بیرونی:\n" + "\n".join(u.summary() for u in UPSTREAMS)
+
+
+def shutdown():
+    global _pool
+    if _pool is not None:
+        _pool.shutdown(wait=False, cancel_futures=True)
+        _pool = None
@@ -0,0 +1,77 @@
+# response_cache.py
+# کش پاسخ در حافظه با TTL: پاسخ‌های آماده (متن + کیبورد) برای درخواست‌های تکراری،
+# تا تکرار یک درخواست فقط یک lookup در dict باشد نه یک کردیت CMC و قالب‌بندی دوباره.
+import time
+from datetime import datetime, timezone
+
+
+class TTLCache:
+    """dict ساده با زمان انقضا برای هر کلید و سقف تعداد ورودی"""
+
+    def __init__(self, ttl: float, max_entries: int = 5000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.data = {}   # key -> (expires_at, version, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.data)
+
+    def get(self, key):
+        entry = self.data.get(key)
+        if entry and entry[0] > time.time():
+            self.hits += 1
+            return entry[2]
+        self.misses += 1
+        return None
+
+    def get_stale(self, key):
+        """مقدار حتی اگر منقضی شده باشد (برای وقتی منبع اصلی در دسترس نیست)"""
+        entry = self.data.get(key)
+        return entry[2] if entry else None
+
+    def expires_at(self, key):
+        entry = self.data.get(key)
+        return entry[0] if entry else None
+
+    def version(self, key):
+        entry = self.data.get(key)
+        return entry[1] if entry else None
+
+    def set(self, key, value, version=None, ttl: float = None, expires_at: float = None):
+        if len(self.data) >= self.max_entries and key not in self.data:
+            self._evict()
+        if expires_at is None:
+            expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self.data[key] = (expires_at, version, value)
+
+    def invalidate(self, key):
+        self.data.pop(key, None)
+
+    def clear(self):
+        self.data.clear()
+
+    def _evict(self):
+        now = time.time()
+        for k in [k for k, e in self.data.items() if e[0] <= now]:
+            del self.data[k]
+        if len(self.data) >= self.max_entries:
+            # قدیمی‌ترین ورودی (ترتیب درج dict)
+            self.data.pop(next(iter(self.data)))
+
+
+def expiry_from_cmc(last_updated: str, cadence: float, min_ttl: float = 5.0) -> float:
+    """
+    زمان انقضا بر اساس last_updated خود CMC: داده تا انتشار نسخه‌ی بعدی (last_updated + cadence) معتبر است.
+    اگر last_updated قابل خواندن نبود، همان cadence از الان.
+    """
+    now = time.time()
+    try:
+        ts = datetime.fromisoformat(last_updated.replace("Z", "+00:00"))
+        if ts.tzinfo is None:
+            ts = ts.replace(tzinfo=timezone.utc)
+        expires = ts.timestamp() + cadence
+    except (AttributeError, ValueError):
+        expires = now + cadence
+    return min(max(expires, now + min_ttl), now + cadence)
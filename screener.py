@@ -0,0 +1,166 @@
+# screener.py
+# اسکنر زیگزاگ کل بازار: کندل‌های همه‌ی جفت‌های USDT بایننس را با دریافت همزمان و
+# محدود به وزن API می‌گیرد، طبقه‌بندی روند analyze() را به‌صورت دسته‌ای در ProcessPool
+# اجرا می‌کند و جدول رتبه‌بندی‌شده‌ی چرخش‌های تازه را در حافظه نگه می‌دارد.
+import logging
+import os
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import technical_analysis
+import analysis_pool
+
+logger = logging.getLogger(__name__)
+
+SCREENER_INTERVAL = os.getenv("SCREENER_INTERVAL", "4h")
+SCREENER_CANDLES = technical_analysis.CACHED_CANDLES                        # همان پنجره‌ی analyze()
+SCREENER_FETCH_WORKERS = int(os.getenv("SCREENER_FETCH_WORKERS", "16"))
+SCREENER_WEIGHT_PER_MIN = int(os.getenv("SCREENER_WEIGHT_PER_MIN", "3000"))  # نصف سقف ۶۰۰۰ بایننس
+SCREENER_FRESH_BARS = int(os.getenv("SCREENER_FRESH_BARS", "6"))            # چرخش «تازه»: ۶ کندل اخیر
+SCREENER_BATCH_SIZE = 50                                                    # نماد در هر کار ProcessPool
+
+BULLISH = "صعودی قوی"
+BEARISH = "نزولی قوی"
+
+# آخرین جدول محاسبه‌شده؛ کوئری کاربران فقط از همین خوانده می‌شود
+RESULTS = {"updated_at": None, "duration": 0.0, "scanned": 0, "failed": 0, "rows": []}
+_scan_lock = asyncio.Lock()
+
+
+def klines_weight(limit: int) -> int:
+    """وزن درخواست /api/v3/klines طبق مستندات بایننس"""
+    if limit < 100:
+        return 1
+    if limit < 500:
+        return 2
+    if limit < 1000:
+        return 5
+    return 10
+
+
+class WeightLimiter:
+    """سطل وزن دقیقه‌ای (thread-safe) تا اسکن از سقف وزن بایننس رد نشود"""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.tokens = float(per_minute)
+        self.rate = per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, weight: int):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= weight:
+                    self.tokens -= weight
+                    return
+                wait = (weight - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+_limiter = WeightLimiter(SCREENER_WEIGHT_PER_MIN)
+
+
+def list_usdt_symbols() -> list:
+    """نمادهای پایه‌ی همه‌ی جفت‌های اسپات USDT که در حال معامله‌اند"""
+    _limiter.acquire(20)  # وزن exchangeInfo
+    info = technical_analysis.get_client().get_exchange_info()
+    return sorted(
+        s["baseAsset"] for s in info.get("symbols", [])
+        if s.get("quoteAsset") == "USDT" and s.get("status") == "TRADING" and s.get("isSpotTradingAllowed", True)
+    )
+
+
+def _fetch_one(symbol: str):
+    from klines import Klines
+    _limiter.acquire(klines_weight(SCREENER_CANDLES))
+    raw = technical_analysis.get_client().get_klines(
+        symbol=symbol + "USDT", interval=SCREENER_INTERVAL, limit=SCREENER_CANDLES
+    )
+    return symbol, Klines.from_raw(raw)
+
+
+def fetch_universe(symbols: list) -> tuple:
+    """دریافت همزمان کندل‌ها؛ خروجی (لیست (symbol, close, open_time)، تعداد خطا)"""
+    series, failed = [], 0
+    with ThreadPoolExecutor(max_workers=SCREENER_FETCH_WORKERS, thread_name_prefix="screener") as pool:
+        for future in [pool.submit(_fetch_one, s) for s in symbols]:
+            try:
+                symbol, kl = future.result()
+            except Exception as e:
+                logger.error("خطا در دریافت کندل‌های اسکنر: %s", e, extra={"event": "screener.fetch_error"})
+                failed += 1
+                continue
+            # فقط کندل‌های بسته‌شده، دقیقاً همان پنجره‌ای که analyze() طبقه‌بندی می‌کند
+            window = technical_analysis.analysis_window(kl)
+            if len(window) >= technical_analysis.ANALYSIS_WINDOW:
+                series.append((symbol, window.close, window.open_time))
+    return series, failed
+
+
+def classify_batch(batch: list) -> list:
+    """اجرا در ProcessPool: زیگزاگ و طبقه‌بندی روند برای یک دسته نماد"""
+    rows = []
+    for symbol, close, open_time in batch:
+        pivots = technical_analysis.zig_zag(close, depth=12, deviation=5, backstep=3)
+        if len(pivots) < 2:
+            continue
+        trend, suggestion = technical_analysis.classify_trend(pivots)
+        idx, pivot_price, ptype = pivots[-1]
+        price = float(close[-1])
+        rows.append({
+            "symbol": symbol,
+            "trend": trend,
+            "suggestion": suggestion,
+            "pivot_type": ptype,
+            "pivot_price": float(pivot_price),
+            "pivot_time": int(open_time[idx]),
+            "bars_since_pivot": len(close) - 1 - idx,
+            "move_pct": (price - pivot_price) / pivot_price * 100,
+            "price": price,
+        })
+    return rows
+
+
+def _rank(rows: list) -> list:
+    # تازه‌ترین چرخش‌ها اول؛ در هر سطح، حرکت بزرگ‌تر از نقطه‌ی چرخش بالاتر
+    return sorted(rows, key=lambda r: (r["bars_since_pivot"], -abs(r["move_pct"])))
+
+
+async def run_scan():
+    """یک اسکن کامل بازار — برای اجرای زمان‌بندی‌شده"""
+    if _scan_lock.locked():
+        return
+    async with _scan_lock:
+        loop = asyncio.get_running_loop()
+        started = time.monotonic()
+        try:
+            symbols = await loop.run_in_executor(None, list_usdt_symbols)
+            series, failed = await loop.run_in_executor(None, fetch_universe, symbols)
+            pool = analysis_pool.get_process_pool()
+            batches = [series[i:i + SCREENER_BATCH_SIZE] for i in range(0, len(series), SCREENER_BATCH_SIZE)]
+            chunks = await asyncio.gather(*[loop.run_in_executor(pool, classify_batch, b) for b in batches])
+        except Exception as e:
+            logger.error("خطا در اسکن بازار: %s", e, extra={"event": "screener.error"})
+            return
+
+        rows = [r for chunk in chunks for r in chunk]
+        RESULTS.update({
+            "updated_at": time.time(),
+            "duration": time.monotonic() - started,
+            "scanned": len(series),
+            "failed": failed,
+            "rows": _rank(rows),
+        })
+        logger.info("اسکن بازار: %s نماد در %.1f ثانیه", len(series), RESULTS["duration"],
+                    extra={"event": "screener.done", "symbols": len(series), "duration": RESULTS["duration"]})
+
+
+def fresh_reversals(trend: str = BULLISH, limit: int = 20, max_bars: int = SCREENER_FRESH_BARS) -> list:
+    """کوئری فوری روی جدول آماده: نمادهایی که تازه به روند داده‌شده چرخیده‌اند"""
+    return [r for r in RESULTS["rows"] if r["trend"] == trend and r["bars_since_pivot"] <= max_bars][:limit]
@@ -0,0 +1,87 @@
+# scripts/tron_stub.py
+# سرور محلی جایگزین TronGrid برای آزمایش tron_verifier بدون شبکهٔ واقعی.
+# همان سه endpoint مورد استفاده را پیاده می‌کند؛ ارتفاع بلاک هر ۳ ثانیه یکی بالا می‌رود
+# و تراکنش‌ها با POST /stub/tx اضافه می‌شوند.
+#
+# اجرا:   python scripts/tron_stub.py --port 8090
+#         TRON_API_URL=http://127.0.0.1:8090 python main.py
+# افزودن تراکنش:
+#   curl -X POST localhost:8090/stub/tx -d '{"tx_hash": "ab..", "to": "T...", "amount_trx": 5.0123, "confirmations": 20}'
+import os
+import sys
+import time
+import argparse
+
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from tron_verifier import address_to_hex
+
+BLOCK_SECONDS = 3
+GENESIS = time.time() - 1_000_000 * BLOCK_SECONDS
+TXS = {}   # tx_hash -> (transaction, info)
+
+
+def head_block() -> int:
+    return int((time.time() - GENESIS) / BLOCK_SECONDS)
+
+
+async def add_tx(request):
+    """
+    بدنه: tx_hash، to (base58 یا hex)، amount_trx، confirmations (پیش‌فرض ۲۰)،
+    type (پیش‌فرض TransferContract)، ret (پیش‌فرض SUCCESS)، unconfirmed (هنوز در بلاک نیست)،
+    age_minutes (چند دقیقه پیش امضا شده، پیش‌فرض ۱)، owner (آدرس فرستنده)
+    """
+    body = await request.json()
+    tx_hash = body["tx_hash"]
+    signed_ms = int((time.time() - float(body.get("age_minutes", 1)) * 60) * 1000)
+    tx = {
+        "txID": tx_hash,
+        "ret": [{"contractRet": body.get("ret", "SUCCESS")}],
+        "raw_data": {"contract": [{
+            "type": body.get("type", "TransferContract"),
+            "parameter": {"value": {
+                "owner_address": address_to_hex(body["owner"]) if body.get("owner") else "41" + "00" * 20,
+                "to_address": address_to_hex(body["to"]),
+                "amount": round(float(body.get("amount_trx", 5)) * 1_000_000),
+            }},
+        }], "timestamp": signed_ms},
+    }
+    info = {} if body.get("unconfirmed") else {
+        "id": tx_hash, "blockNumber": head_block() - int(body.get("confirmations", 20)),
+        "blockTimeStamp": signed_ms + BLOCK_SECONDS * 1000,
+    }
+    TXS[tx_hash] = (tx, info)
+    return web.json_response({"ok": True, "head": head_block()})
+
+
+async def get_now_block(request):
+    return web.json_response({"block_header": {"raw_data": {"number": head_block()}}})
+
+
+async def get_transaction(request):
+    body = await request.json()
+    return web.json_response(TXS.get(body.get("value"), ({}, {}))[0])
+
+
+async def get_transaction_info(request):
+    body = await request.json()
+    return web.json_response(TXS.get(body.get("value"), ({}, {}))[1])
+
+
+def make_app() -> web.Application:
+    app = web.Application()
+    app.router.add_post("/stub/tx", add_tx)
+    app.router.add_post("/wallet/getnowblock", get_now_block)
+    app.router.add_post("/wallet/gettransactionbyid", get_transaction)
+    app.router.add_post("/wallet/gettransactioninfobyid", get_transaction_info)
+    return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="سرور جایگزین TronGrid")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    web.run_app(make_app(), host=args.host, port=args.port)
@@ -0,0 +1,101 @@
+# shamsi.py
+# قالب‌بندی تاریخ شمسی برای همهٔ ماژول‌ها.
+# تبدیل میلادی→شمسی فقط یک بار برای هر روز انجام می‌شود و ساعت/دقیقه با حساب ساده اضافه می‌شود؛
+# زمان باز شدن کندل‌ها (میلی‌ثانیه) دسته‌ای تبدیل می‌شوند و نتیجه با کلید همان زمان به خاطر
+# سپرده می‌شود، چون کندل‌های ۴ ساعته در درخواست‌های پشت‌سرهم تکرار می‌شوند.
+import os
+import re
+from datetime import date, datetime
+
+FORMAT_TECH = "%Y/%m/%d - %H:%M"          # تحلیل تکنیکال
+FORMAT_USER = "%Y/%-m/%-d ساعت %H:%M"     # پیام‌های کاربر (اشتراک، بازار، ...)
+FALLBACK_FORMAT = "%Y-%m-%d %H:%M"
+
+SHAMSI_CACHE_SIZE = int(os.getenv("SHAMSI_CACHE_SIZE", "20000"))
+MS_PER_DAY = 86_400_000
+_EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+
+# دستورهای پشتیبانی‌شده در قالب سریع؛ بقیه با strftime خود jdatetime
+_DIRECTIVES = {
+    "%Y": "{0}", "%m": "{1:02d}", "%d": "{2:02d}", "%-m": "{1}", "%-d": "{2}",
+    "%H": "{3:02d}", "%M": "{4:02d}", "%S": "{5:02d}", "%%": "%",
+}
+_DIRECTIVE_RE = re.compile(r"%-?.")
+
+_templates = {}   # قالب strftime -> قالب str.format (یا None اگر پشتیبانی نمی‌شود)
+_days = {}        # ordinal میلادی -> (سال، ماه، روز) شمسی
+_memo = {}        # (قالب، میلی‌ثانیه) -> متن
+
+
+def _template(fmt: str):
+    if fmt not in _templates:
+        unsupported = False
+
+        def convert(m):
+            nonlocal unsupported
+            if m.group(0) not in _DIRECTIVES:
+                unsupported = True
+                return m.group(0)
+            return _DIRECTIVES[m.group(0)]
+
+        text = _DIRECTIVE_RE.sub(convert, fmt.replace("{", "{{").replace("}", "}}"))
+        _templates[fmt] = None if unsupported else text
+    return _templates[fmt]
+
+
+def _jalali(ordinal: int) -> tuple:
+    j = _days.get(ordinal)
+    if j is None:
+        import jdatetime  # ایمپورت تنبل برای استارت سریع‌تر
+        jd = jdatetime.date.fromgregorian(date=date.fromordinal(ordinal))
+        j = _days[ordinal] = (jd.year, jd.month, jd.day)
+    return j
+
+
+def format_datetime(dt: datetime, fmt: str = FORMAT_USER) -> str:
+    """یک datetime (با یا بدون tz؛ همان ساعت دیواری‌اش) به متن شمسی"""
+    try:
+        template = _template(fmt)
+        if template is None:
+            import jdatetime
+            return jdatetime.datetime.fromgregorian(datetime=dt).strftime(fmt)
+        y, m, d = _jalali(dt.toordinal())
+        return template.format(y, m, d, dt.hour, dt.minute, dt.second)
+    except Exception:
+        return dt.strftime(FALLBACK_FORMAT)
+
+
+def format_ms_many(values, fmt: str = FORMAT_TECH) -> list:
+    """
+    دنباله‌ای از timestamp میلی‌ثانیه (UTC، مثل open_time کندل‌ها) به لیست متن شمسی.
+    فقط زمان‌هایی که در کش نیستند قالب‌بندی می‌شوند.
+    """
+    template = _template(fmt)
+    out = []
+    for ms in values:
+        ms = int(ms)
+        key = (fmt, ms)
+        text = _memo.get(key)
+        if text is None:
+            day, r = divmod(ms, MS_PER_DAY)
+            seconds = r // 1000
+            if template is None:
+                text = format_datetime(datetime.fromordinal(_EPOCH_ORDINAL + day).replace(
+                    hour=seconds // 3600, minute=seconds // 60 % 60, second=seconds % 60), fmt)
+            else:
+                y, m, d = _jalali(_EPOCH_ORDINAL + day)
+                text = template.format(y, m, d, seconds // 3600, seconds // 60 % 60, seconds % 60)
+            if len(_memo) >= SHAMSI_CACHE_SIZE:
+                _memo.pop(next(iter(_memo)))   # قدیمی‌ترین ورودی
+            _memo[key] = text
+        out.append(text)
+    return out
+
+
+def format_ms(value: int, fmt: str = FORMAT_TECH) -> str:
+    return format_ms_many([value], fmt)[0]
+
+
+def clear():
+    _days.clear()
+    _memo.clear()
@@ -1,23 +1,40 @@
 # technical_analysis.py - نسخه نهایی: دقیقاً مثل Display reversal price تریدینگ‌ویو
+import logging
 import time
-import pandas as pd
-from binance.client import Client
+import threading
 from datetime import datetime
-import jdatetime
 
+import resilience
+import shamsi
+
+logger = logging.getLogger(__name__)
+
+# کلاینت بایننس و numpy سنگین‌اند (کلاینت در سازنده به بایننس وصل می‌شود)؛
+# برای بالا آمدن سریع ربات، در اولین استفاده ساخته/ایمپورت می‌شوند.
 CACHE = {}
 CACHE_TTL = 300  # 5 دقیقه کش
-client = Client()
+# زیگزاگ متن تحلیل و نمودار هر دو روی همین تعداد کندل بسته‌شدهٔ آخر حساب می‌شوند
+ANALYSIS_WINDOW = 300
+CACHED_CANDLES = ANALYSIS_WINDOW + 1   # + کندل در حال تشکیل
+_client = None
+_client_lock = threading.Lock()
+
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from binance.client import Client
+                _client = Client()
+    return _client
 
 def to_shamsi(dt):
-    try:
-        return jdatetime.datetime.fromgregorian(datetime=dt).strftime("%Y/%m/%d - %H:%M")
-    except:
-        return dt.strftime("%Y-%m-%d %H:%M")
+    return shamsi.format_datetime(dt, shamsi.FORMAT_TECH)
 
 
-def zig_zag(df, depth=12, deviation=5, backstep=3):
-    close = df['close'].values
+def zig_zag(klines, depth=12, deviation=5, backstep=3):
+    # هم Klines و هم آرایه‌ی خام قیمت‌های کلوز قابل قبول است
+    close = getattr(klines, "close", klines)
     pivots = []
     last_pivot_idx = 0
     last_pivot_price = close[0]
@@ -25,7 +42,7 @@ def zig_zag(df, depth=12, deviation=5, backstep=3):
 
     deviation /= 100.0
 
-    for i in range(1, len(df)):
+    for i in range(1, len(close)):
         current_price = close[i]
 
         if direction >= 0:  # منتظر پیک صعودی
@@ -59,74 +76,110 @@ def zig_zag(df, depth=12, deviation=5, backstep=3):
 
 def get_klines(symbol: str, interval: str = "4h", limit: int = 1000):
     try:
-        klines = client.get_klines(symbol=symbol + "USDT", interval=interval, limit=limit)
-        df = pd.DataFrame(klines, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume',
-            'close_time', 'quote_volume', 'trades', 'tb_base', 'tb_quote', 'ignore'
-        ])
-        df['close'] = pd.to_numeric(df['close'])
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        return df[['timestamp', 'close']]
+        from klines import Klines
+        raw = resilience.BINANCE.call_sync(get_client().get_klines, symbol=symbol + "USDT", interval=interval, limit=limit)
+        return Klines.from_raw(raw)
     except Exception as e:
-        print(f"خطا در دریافت دیتا از بایننس: {e}")
+        logger.error("خطا در دریافت دیتا از بایننس: %s", e, extra={"event": "binance.klines_error"})
         return None
 
 
-def analyze(symbol: str, interval: str = "4h") -> dict:
-    cache_key = f"{symbol.upper()}_{interval}"
-    now = time.time()
+def classify_trend(pivots) -> tuple:
+    """روند و پیشنهاد بر اساس دو نقطه‌ی آخر زیگزاگ (بدون احتساب نقطه‌ی شروع)"""
+    points = pivots[1:]
+    if len(points) < 2:
+        return "نامشخص", "صبر کن"
+    last_is_up = points[-1][2] == 'high'
+    prev_is_up = points[-2][2] == 'high'
+    if last_is_up and not prev_is_up:
+        return "صعودی قوی", "لانگ یا هولد"
+    if not last_is_up and prev_is_up:
+        return "نزولی قوی", "شورت یا صبر"
+    return "رنج / ساید وی", "احتیاط"
+
+
+def analysis_window(klines, now_ms: int = None):
+    """ANALYSIS_WINDOW کندل بسته‌شدهٔ آخر — پنجرهٔ مشترک تحلیل متنی و نمودار"""
+    return klines.closed(now_ms).tail(ANALYSIS_WINDOW)
+
+
+def get_cached(symbol: str, interval: str = "4h"):
+    """نتیجه کش‌شده (اگر هنوز معتبر باشد)"""
+    entry = CACHE.get(f"{symbol.upper()}_{interval}")
+    if entry and time.time() - entry[2] < CACHE_TTL:
+        return entry[1]
+    return None
+
+
+def get_cached_klines(symbol: str, interval: str = "4h"):
+    """کندل‌های اخیر همان نتیجهٔ کش‌شده (برای نمودار)"""
+    entry = CACHE.get(f"{symbol.upper()}_{interval}")
+    return entry[0] if entry else None
 
-    if cache_key in CACHE and now - CACHE[cache_key][2] < CACHE_TTL:
-        return CACHE[cache_key][1]
 
-    df = get_klines(symbol.upper(), interval, limit=1000)
-    if df is None or len(df) < 300:
+def get_indicator_state(symbol: str, interval: str = "4h"):
+    """وضعیت اندیکاتورهای آخرین تحلیل (حتی اگر نتیجه منقضی شده باشد) برای به‌روزرسانی افزایشی"""
+    entry = CACHE.get(f"{symbol.upper()}_{interval}")
+    return entry[3] if entry else None
+
+
+def store_cached(symbol: str, interval: str, recent, result: dict, indicator_state=None):
+    CACHE[f"{symbol.upper()}_{interval}"] = (recent, result, time.time(), indicator_state)
+
+
+def compute_analysis(symbol: str, klines, indicator_state=None) -> dict:
+    """
+    بخش CPU-bound تحلیل (زیگزاگ + اندیکاتورها + قالب‌بندی) — بدون I/O تا در پروسس جدا قابل اجرا باشد.
+    وضعیت جدید اندیکاتورها در کلید indicator_state برمی‌گردد؛ صدازننده آن را جدا و کنار نتیجه کش می‌کند.
+    """
+    if klines is None or len(klines) < CACHED_CANDLES:
         return {"error": "دیتا کافی نیست"}
 
-    df_recent = df.iloc[-300:].reset_index(drop=True)
+    import indicators
+    values, indicator_state = indicators.compute(klines, indicator_state)
+
+    # همان پنجرهٔ کندل‌های بسته‌شده‌ای که نمودار رسم می‌کند، تا نقاط متن و نمودار یکی باشند
+    recent = analysis_window(klines)
 
     # نقطه شروع: کلوز کندل ۳۰۰ام قبل
-    start_price = df_recent.iloc[0]['close']
-    start_time = to_shamsi(df_recent.iloc[0]['timestamp'])
+    start_price = float(recent.close[0])
 
-    pivots = zig_zag(df_recent, depth=12, deviation=5, backstep=3)
+    pivots = zig_zag(recent, depth=12, deviation=5, backstep=3)
+
+    # زمان شروع و همهٔ نقاط چرخش یک‌جا (با کش بر اساس زمان کندل)
+    start_time, *pivot_times = shamsi.format_ms_many(
+        recent.open_time[[0] + [idx for idx, _, _ in pivots[1:]]], shamsi.FORMAT_TECH)
 
     # تمام نقاط زیگزاگ (فقط قیمت کلوز کندل چرخش)
     reversal_prices = []
-    for i, (idx, price, ptype) in enumerate(pivots[1:], start=1):  # از نقطه دوم
-        t = to_shamsi(df_recent.iloc[idx]['timestamp'])
+    for i, ((idx, price, ptype), t) in enumerate(zip(pivots[1:], pivot_times), start=1):  # از نقطه دوم
         arrow = "Up" if ptype == 'high' else "Down"
         reversal_prices.append(f"{arrow} نقطه #{i}: ${price:,.2f} — {t}")
 
-    # تشخیص روند
-    if len(reversal_prices) < 2:
-        trend = "نامشخص"
-        suggestion = "صبر کن"
-    else:
-        last_two = reversal_prices[-2:]
-        last_is_up = "Up" in last_two[-1]
-        prev_is_down = "Down" in last_two[-2] if len(last_two) > 1 else False
-        if last_is_up and prev_is_down:
-            trend = "صعودی قوی"
-            suggestion = "لانگ یا هولد"
-        elif not last_is_up and "Up" in last_two[-2]:
-            trend = "نزولی قوی"
-            suggestion = "شورت یا صبر"
-        else:
-            trend = "رنج / ساید وی"
-            suggestion = "احتیاط"
-
-    result = {
+    trend, suggestion = classify_trend(pivots)
+
+    return {
         "symbol": symbol.upper(),
-        "price": f"${df_recent['close'].iloc[-1]:,.2f}",
+        "price": f"${klines.close[-1]:,.2f}",   # قیمت لحظه‌ای از کندل در حال تشکیل
         "trend": trend,
         "suggestion": suggestion,
         "start_point": f"شروع زیگزاگ: ${start_price:,.2f} — {start_time}",
         "reversal_prices": reversal_prices[::-1],  # جدید → قدیم
         "total_points": len(reversal_prices),
+        "indicators": indicators.format_lines(values),
         "time": to_shamsi(datetime.now()),
+        "indicator_state": indicator_state,
     }
 
-    # خط درست شده
-    CACHE[cache_key] = (df_recent, result, now)
+
+def analyze(symbol: str, interval: str = "4h") -> dict:
+    cached = get_cached(symbol, interval)
+    if cached is not None:
+        return cached
+
+    klines = get_klines(symbol.upper(), interval, limit=1000)
+    result = compute_analysis(symbol, klines, get_indicator_state(symbol, interval))
+    if "error" not in result:
+        state = result.pop("indicator_state")
+        store_cached(symbol, interval, klines.tail(CACHED_CANDLES).copy(), result, state)
     return result
@@ -0,0 +1,6 @@
+# tests/conftest.py
+# ماژول‌های ربات در ریشهٔ مخزن هستند (بدون پکیج)؛ ریشه به sys.path اضافه می‌شود.
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,129 @@
+# tests/test_admin_reports.py
+import csv
+import os
+from datetime import date, datetime
+from types import SimpleNamespace
+
+import pytest
+
+import admin_reports
+
+
+class NamedCursor:
+    def __init__(self, rows, columns, fail_after=None):
+        self.rows = rows
+        self.description = [SimpleNamespace(name=c) for c in columns]
+        self.fetches = []
+        self.fail_after = fail_after
+        self.itersize = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, query):
+        self.query = query
+
+    def fetchmany(self, size):
+        if self.fail_after is not None and len(self.fetches) >= self.fail_after:
+            raise RuntimeError("connection lost")
+        start = sum(self.fetches)
+        chunk = self.rows[start:start + size]
+        self.fetches.append(len(chunk))
+        return chunk
+
+
+class Conn:
+    def __init__(self, cursor):
+        self.named = cursor
+        self.closed = False
+        self.cursor_args = None
+
+    def cursor(self, name=None, cursor_factory=None):
+        self.cursor_args = (name, cursor_factory)
+        return self.named
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(admin_reports, "EXPORT_CHUNK", 2)
+
+
+def test_export_streams_in_chunks_through_named_cursor(small_chunks, monkeypatch):
+    rows = [(i, 1000 + i, f"hash{i}", "approved", 5_000_000, None, datetime(2026, 1, i + 1), None) for i in range(5)]
+    columns = ["id", "telegram_id", "tx_hash", "status", "amount_sun", "note", "created_at", "processed_at"]
+    cursor = NamedCursor(rows, columns)
+    conn = Conn(cursor)
+    monkeypatch.setattr(admin_reports, "get_db_connection", lambda: conn)
+
+    path, count = admin_reports.export_csv("payments")
+    try:
+        assert count == 5
+        assert conn.cursor_args[0] == "export_payments"       # cursor سمت سرور
+        assert cursor.itersize == 2 and cursor.fetches == [2, 2, 1, 0]
+        assert conn.closed
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            table = list(csv.reader(f))
+        assert table[0] == columns
+        assert len(table) == 6 and table[3][2] == "hash2"
+    finally:
+        os.remove(path)
+
+
+def test_empty_export_still_has_header(small_chunks, monkeypatch):
+    conn = Conn(NamedCursor([], ["telegram_id", "registered_at"]))
+    monkeypatch.setattr(admin_reports, "get_db_connection", lambda: conn)
+    path, count = admin_reports.export_csv("users")
+    try:
+        with open(path, encoding="utf-8-sig") as f:
+            assert f.read().strip() == "telegram_id,registered_at"
+        assert count == 0
+    finally:
+        os.remove(path)
+
+
+def test_failed_export_removes_temp_file(small_chunks, monkeypatch, tmp_path):
+    monkeypatch.setattr(admin_reports.tempfile, "tempdir", str(tmp_path))
+    conn = Conn(NamedCursor([(1,), (2,), (3,)], ["id"], fail_after=1))
+    monkeypatch.setattr(admin_reports, "get_db_connection", lambda: conn)
+    with pytest.raises(RuntimeError):
+        admin_reports.export_csv("users")
+    assert list(tmp_path.iterdir()) == [] and conn.closed
+
+
+def test_stats_text_reads_views(monkeypatch):
+    results = iter([
+        [{"total_users": 1200, "new_users_30d": 80, "active_subscribers": 150, "expiring_7d": 12,
+          "refreshed_at": datetime(2026, 3, 1, 10, 30)}],
+        [{"month": date(2026, 2, 1), "revenue_trx": 750.0, "payments": 150, "payers": 140}],
+        [{"cohort": date(2026, 2, 1), "paid": 20, "registered": 80}, {"cohort": date(2026, 1, 1), "paid": 0, "registered": 0}],
+    ])
+
+    class Cursor:
+        def execute(self, sql, params=()):
+            self.result = next(results)
+
+        def fetchone(self):
+            return self.result[0]
+
+        def fetchall(self):
+            return self.result
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(admin_reports, "get_db_connection",
+                        lambda: SimpleNamespace(cursor=Cursor, close=lambda: None))
+    text = admin_reports.stats_text()
+    assert "مشترکین فعال: 150" in text
+    assert "2026-02: 750.0 TRX — 150 پرداخت، 140 پرداخت‌کننده" in text
+    assert "2026-02: 20/80 (25.0%)" in text
+    assert "2026-01" not in text            # کوهورت بدون ثبت‌نام تقسیم بر صفر نمی‌شود
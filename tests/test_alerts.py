@@ -0,0 +1,55 @@
+# tests/test_alerts.py
+from alerts import AlertIndex
+
+
+def build(*alerts):
+    index = AlertIndex()
+    for alert_id, symbol, direction, target in alerts:
+        index.add(alert_id, 100 + alert_id, symbol, direction, target)
+    return index
+
+
+def ids(matched):
+    return sorted(m[0] for m in matched)
+
+
+def test_above_triggers_at_or_over_target():
+    index = build((1, "BTC", "above", 70_000), (2, "BTC", "above", 71_000), (3, "BTC", "above", 72_000))
+    assert ids(index.match("BTC", 69_999)) == []
+    assert ids(index.match("BTC", 71_000)) == [1, 2]
+    assert ids(index.match("BTC", 71_500)) == []   # فعال‌شده‌ها دوباره برنمی‌گردند
+    assert ids(index.match("BTC", 80_000)) == [3]
+    assert len(index) == 0
+
+
+def test_below_triggers_at_or_under_target():
+    index = build((1, "ETH", "below", 3_000), (2, "ETH", "below", 2_500))
+    assert ids(index.match("ETH", 3_001)) == []
+    assert ids(index.match("ETH", 3_000)) == [1]
+    assert ids(index.match("ETH", 2_000)) == [2]
+
+
+def test_match_returns_alert_details_and_ignores_other_symbols():
+    index = build((1, "BTC", "above", 70_000), (2, "ETH", "above", 1))
+    assert index.match("BTC", 75_000) == [(1, 101, "BTC", "above", 70_000)]
+    assert index.match("SOL", 1_000) == []
+    assert index.symbols() == ["ETH"]
+
+
+def test_equal_targets_and_remove():
+    index = build((1, "BTC", "above", 70_000), (2, "BTC", "above", 70_000), (3, "BTC", "above", 70_000))
+    assert index.remove(2)
+    assert not index.remove(2)
+    assert ids(index.match("BTC", 70_000)) == [1, 3]
+
+
+def test_load_merges_with_existing_entries():
+    index = build((1, "BTC", "below", 60_000))
+    index.load([
+        {"id": 2, "telegram_id": 7, "symbol": "BTC", "direction": "below", "target_price": 65_000},
+        {"id": 3, "telegram_id": 7, "symbol": "BTC", "direction": "above", "target_price": 90_000},
+    ])
+    assert len(index) == 3
+    assert ids(index.match("BTC", 64_000)) == [2]
+    assert ids(index.match("BTC", 59_000)) == [1]
+    assert ids(index.match("BTC", 95_000)) == [3]
@@ -0,0 +1,71 @@
+# tests/test_backtest.py
+import numpy as np
+import pytest
+
+import backtest
+from klines import Klines
+
+HOUR_MS = 3_600_000
+
+
+@pytest.fixture(scope="module")
+def klines():
+    """۴۲۰ کندل ۴ساعته با قیمت random walk (seed ثابت)"""
+    rng = np.random.default_rng(7)
+    close = 30_000 * np.exp(np.cumsum(rng.normal(0, 0.02, 420)))
+    open_time = np.arange(420, dtype=np.int64) * 4 * HOUR_MS + 1_700_000_000_000
+    return Klines(open_time, close, close * 1.01, close * 0.99, close, np.ones(420), open_time + 4 * HOUR_MS - 1)
+
+
+def test_signals_do_not_look_ahead(klines):
+    close = klines.close.astype(float)
+    signals = backtest.generate_signals(close, window=100)
+    assert not signals[:99].any()
+
+    # عوض کردن آینده نباید سیگنال‌های گذشته را تغییر دهد
+    cut = 250
+    changed = close.copy()
+    changed[cut + 1:] = changed[cut + 1:][::-1]
+    assert np.array_equal(backtest.generate_signals(changed, window=100)[:cut + 1], signals[:cut + 1])
+
+
+def test_step_holds_signal_between_evaluations(klines):
+    close = klines.close.astype(float)
+    full = backtest.generate_signals(close, window=100)
+    stepped = backtest.generate_signals(close, window=100, step=5)
+    evaluated = np.arange(99, len(close), 5)
+    assert np.array_equal(stepped[evaluated], full[evaluated])
+    assert all(stepped[t] == stepped[evaluated[evaluated <= t][-1]] for t in range(99, len(close)))
+
+
+def test_evaluate_metrics():
+    close = np.array([100.0, 110.0, 121.0, 108.9, 119.79])
+    signals = np.array([1, 1, -1, 1, 0], dtype=np.int8)
+    m = backtest.evaluate(close, signals, horizon=1)
+    # بازده یک‌کندلی بعد از هر سیگنال در جهت سیگنال: +10٪، +10٪، +10٪، +10٪
+    assert m["hit_rate"] == 1.0
+    assert m["avg_fwd_return"] == pytest.approx(0.1)
+    assert m["total_return"] == pytest.approx(1.1 ** 4 - 1)
+    assert m["max_drawdown"] == pytest.approx(0.0)
+    assert (m["signal_bars"], m["long_bars"], m["short_bars"], m["flips"]) == (4, 3, 1, 3)
+    assert m["buy_hold"] == pytest.approx(0.1979)
+
+
+def test_drawdown_of_wrong_side():
+    close = np.array([100.0, 90.0, 99.0])
+    m = backtest.evaluate(close, np.array([1, 1, 0], dtype=np.int8), horizon=1)
+    assert m["total_return"] == pytest.approx(0.9 * 1.1 - 1)
+    assert m["max_drawdown"] == pytest.approx(-0.1)
+
+
+def test_history_roundtrip_and_run_one(klines, tmp_path, monkeypatch):
+    monkeypatch.setattr(backtest, "CANDLE_DIR", str(tmp_path))
+    assert backtest.load_history("BTC", "4h") is None
+    backtest.save_history("BTC", "4h", klines)
+    loaded = backtest.load_history("BTC", "4h")
+    assert backtest.stored_symbols("4h") == ["BTC"]
+    assert np.array_equal(loaded.close, klines.close) and np.array_equal(loaded.open_time, klines.open_time)
+
+    row = backtest.run_one(("BTC", "4h", 12, 5, 3, 6, 10))
+    assert "error" not in row and row["bars"] == len(klines)
+    assert backtest.run_one(("ETH", "4h", 12, 5, 3, 6, 10))["error"]
@@ -0,0 +1,46 @@
+# tests/test_bot_logging.py
+import asyncio
+import json
+import logging
+import threading
+
+import bot_logging
+
+
+def test_executor_carries_update_context():
+    async def handler():
+        bot_logging.current_user.set(42)
+        bot_logging.current_handler.set("tech")
+        loop = asyncio.get_running_loop()
+        loop.set_default_executor(bot_logging.ContextThreadPoolExecutor(max_workers=2))
+        read = lambda: (bot_logging.current_user.get(), bot_logging.current_handler.get(),
+                        threading.current_thread() is threading.main_thread())
+        return await loop.run_in_executor(None, read)
+
+    assert asyncio.run(handler()) == (42, "tech", False)
+
+
+def test_executor_does_not_leak_context_between_tasks():
+    pool = bot_logging.ContextThreadPoolExecutor(max_workers=1)
+    try:
+        token = bot_logging.current_user.set(1)
+        pool.submit(bot_logging.current_user.set, 99).result()
+        assert pool.submit(bot_logging.current_user.get).result() == 1
+        bot_logging.current_user.reset(token)
+        assert pool.submit(bot_logging.current_user.get).result() is None
+    finally:
+        pool.shutdown()
+
+
+def test_json_record_has_context_and_extra_fields():
+    record = logging.LogRecord("t", logging.WARNING, __file__, 1, "مدار %s باز شد", ("cmc",), None)
+    record.event = "circuit.open"
+    token = bot_logging.current_user.set(7)
+    try:
+        bot_logging.ContextFilter().filter(record)
+    finally:
+        bot_logging.current_user.reset(token)
+    data = json.loads(bot_logging.JsonFormatter().format(record))
+    assert data["msg"] == "مدار cmc باز شد"
+    assert data["event"] == "circuit.open" and data["user_id"] == 7
+    assert "args" not in data and "handler" not in data
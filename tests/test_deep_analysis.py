@@ -0,0 +1,54 @@
+# tests/test_deep_analysis.py
+import pytest
+
+import deep_analysis
+from deep_analysis import compute_ttl_minutes, CACHE_MIN_MINUTES, CACHE_MAX_MINUTES
+
+
+def coin(rank=1, change=0.0, volume=10_000_000_000):
+    return {"rank": rank, "change_24h": change, "volume_24h": volume}
+
+
+def test_calm_top_coin_gets_max_ttl():
+    assert compute_ttl_minutes(coin()) == CACHE_MAX_MINUTES
+
+
+def test_ttl_stays_within_bounds():
+    for data in (coin(rank=0, change=500, volume=0), {}, coin(rank=5000, change=-80)):
+        assert CACHE_MIN_MINUTES <= compute_ttl_minutes(data) <= CACHE_MAX_MINUTES
+
+
+@pytest.mark.parametrize("calmer, busier", [
+    (coin(change=1), coin(change=10)),
+    (coin(change=-1), coin(change=-10)),      # جهت تغییر مهم نیست، فقط اندازه‌اش
+    (coin(rank=10), coin(rank=50)),
+    (coin(rank=50), coin(rank=300)),
+    (coin(rank=300), coin(rank=None)),
+    (coin(volume=5_000_000), coin(volume=10_000)),
+])
+def test_ttl_shrinks_with_risk(calmer, busier):
+    assert compute_ttl_minutes(calmer) > compute_ttl_minutes(busier)
+
+
+def test_five_percent_move_halves_the_range(monkeypatch):
+    monkeypatch.setattr(deep_analysis, "CACHE_MIN_MINUTES", 0)
+    monkeypatch.setattr(deep_analysis, "CACHE_MAX_MINUTES", 600)
+    assert compute_ttl_minutes(coin(change=5)) == 300
+
+
+def test_average_ttl_ignores_failed_generations(monkeypatch):
+    monkeypatch.setattr(deep_analysis, "STATS", dict.fromkeys(deep_analysis.STATS, 0))
+    monkeypatch.setattr(deep_analysis, "_lookup_cached", lambda symbol: None)
+    monkeypatch.setattr(deep_analysis, "save_analysis_to_cache", lambda *args: None)
+    monkeypatch.setattr(deep_analysis.LOCAL_CACHE, "get_stale", lambda key: None)
+    replies = iter(["تحلیل " * 50, "موقتی در دسترس نیست. بعداً امتحان کن.", "کوتاه"])
+    monkeypatch.setattr(deep_analysis, "call_openai_analysis", lambda data: next(replies))
+
+    data = {"symbol": "BTC", "name": "Bitcoin", **coin()}
+    for _ in range(3):
+        deep_analysis.get_deep_analysis(data)
+
+    stats = deep_analysis.STATS
+    assert (stats["misses"], stats["stored"]) == (3, 1)
+    assert stats["ttl_minutes_total"] == compute_ttl_minutes(data)
+    assert f"میانگین TTL تطبیقی: {compute_ttl_minutes(data)} دقیقه روی 1 ذخیره" in deep_analysis.cache_report()
@@ -0,0 +1,58 @@
+# tests/test_diagnostics.py
+import asyncio
+import threading
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import diagnostics
+
+
+@pytest.fixture(autouse=True)
+def token(monkeypatch):
+    monkeypatch.setattr(diagnostics, "DIAG_TOKEN", "secret")
+    # بدون کش‌های داخلی ربات (ایمپورت همهٔ ماژول‌ها)
+    monkeypatch.setattr(diagnostics, "CACHES", {"technical_analysis.CACHE": lambda: (0, 0)})
+    yield
+    diagnostics.stop_tracing()
+
+
+def request(path, headers=None):
+    async def run():
+        app = web.Application(middlewares=[diagnostics._auth])
+        app.router.add_get("/diag/mem", diagnostics._mem)
+        async with TestClient(TestServer(app)) as client:
+            resp = await client.get(path, headers=headers or {})
+            return resp.status, (await resp.json() if resp.status == 200 else None)
+    return asyncio.run(run())
+
+
+def test_rejects_missing_or_wrong_token():
+    assert request("/diag/mem")[0] == 401
+    assert request("/diag/mem", {"X-Diag-Token": "nope"})[0] == 401
+
+
+def test_rejects_non_integer_top():
+    assert request("/diag/mem?token=secret&top=x")[0] == 400
+
+
+def test_baseline_snapshot_runs_off_the_loop(monkeypatch):
+    threads = []
+    start = diagnostics.start_tracing
+    monkeypatch.setattr(diagnostics, "start_tracing",
+                        lambda: (threads.append(threading.current_thread()), start()))
+    status, report = request("/diag/mem?baseline=1&top=3", {"X-Diag-Token": "secret"})
+    assert status == 200
+    assert threads and threads[0] is not threading.main_thread()
+    assert report["allocations"]["tracing"]
+    assert len(report["allocations"]["top"]) <= 3
+    assert report["process"]["asyncio_tasks"] >= 1
+
+
+def test_cache_sizes_read_callable_containers(monkeypatch):
+    holder = {"names": ["a"]}
+    diagnostics.register_cache("names", lambda: holder["names"])
+    holder["names"] = ["a", "b", "c"]
+    entry = next(c for c in diagnostics.cache_sizes() if c["name"] == "names")
+    assert entry["entries"] == 3
@@ -0,0 +1,92 @@
+# tests/test_indicators.py
+import json
+import os
+
+import pandas as pd
+import pytest
+
+import indicators
+from klines import Klines
+
+FIXTURE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "benchmarks", "fixtures", "klines_btcusdt_4h.json")
+FAR_FUTURE = 2 ** 62
+
+
+@pytest.fixture(scope="module")
+def raw():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def assert_same(a: dict, b: dict):
+    assert a.keys() == b.keys()
+    for key in a:
+        if isinstance(a[key], dict):
+            assert_same(a[key], b[key])
+        elif a[key] is None:
+            assert b[key] is None, key
+        else:
+            assert b[key] == pytest.approx(a[key], rel=1e-9), key
+
+
+def test_incremental_matches_cold(raw):
+    cold, _ = indicators.compute(Klines.from_raw(raw[:700]), now_ms=FAR_FUTURE)
+
+    _, state = indicators.compute(Klines.from_raw(raw[:500]), now_ms=FAR_FUTURE)
+    for prev, stop in ((500, 520), (520, 600), (600, 700)):
+        # پنجرهٔ کش لغزان است؛ فقط کندل‌های جدید روی وضعیت قبلی اعمال می‌شوند
+        window = Klines.from_raw(raw[stop - 300:stop])
+        state, processed = indicators.update_state(state, window, FAR_FUTURE)
+        assert processed == stop - prev
+    assert_same(cold, indicators.snapshot(state, window))
+
+
+def test_gap_in_window_recomputes_from_scratch(raw):
+    _, state = indicators.compute(Klines.from_raw(raw[:300]), now_ms=FAR_FUTURE)
+    window = Klines.from_raw(raw[400:700])
+    _, processed = indicators.update_state(state, window, FAR_FUTURE)
+    assert processed == 300
+
+
+def test_forming_candle_is_not_committed(raw):
+    klines = Klines.from_raw(raw[:300])
+    now_ms = int(klines.close_time[-1]) - 1     # آخرین کندل هنوز بسته نشده
+    ind, state = indicators.compute(klines, now_ms=now_ms)
+    assert state.count == 299
+    assert state.last_open_time == int(klines.open_time[-2])
+    cold, _ = indicators.compute(klines, now_ms=FAR_FUTURE)
+    assert_same(cold, ind)
+
+
+def test_vectorised_advance_matches_single_steps(raw):
+    klines = Klines.from_raw(raw[:300])
+    stepped = indicators.IndicatorState()
+    for i in range(len(klines)):
+        indicators._step(stepped, float(klines.high[i]), float(klines.low[i]), float(klines.close[i]))
+    advanced = indicators._advance(indicators.IndicatorState(), klines, 0, len(klines))
+    assert advanced.count == stepped.count
+    for key, value in stepped.values.items():
+        assert advanced.values[key] == pytest.approx(value, rel=1e-9), key
+
+
+def test_matches_pandas_ewm(raw):
+    klines = Klines.from_raw(raw[:300])
+    ind, _ = indicators.compute(klines, now_ms=FAR_FUTURE)
+    close = pd.Series(klines.close)
+
+    ema = lambda span: close.ewm(span=span, adjust=False).mean()
+    macd = ema(indicators.MACD_FAST) - ema(indicators.MACD_SLOW)
+    assert ind["ema"][20] == pytest.approx(ema(20).iloc[-1], rel=1e-9)
+    assert ind["macd"] == pytest.approx(macd.iloc[-1], rel=1e-9)
+    assert ind["macd_signal"] == pytest.approx(
+        macd.ewm(span=indicators.MACD_SIGNAL, adjust=False).mean().iloc[-1], rel=1e-9)
+
+    change = close.diff().iloc[1:]
+    alpha = 1 / indicators.RSI_PERIOD
+    gain = change.clip(lower=0).ewm(alpha=alpha, adjust=False).mean().iloc[-1]
+    loss = (-change).clip(lower=0).ewm(alpha=alpha, adjust=False).mean().iloc[-1]
+    assert ind["rsi"] == pytest.approx(100 - 100 / (1 + gain / loss), rel=1e-9)
+
+    window = close.iloc[-indicators.BB_PERIOD:]
+    assert ind["bollinger"][1] == pytest.approx(window.mean(), rel=1e-9)
@@ -0,0 +1,75 @@
+# tests/test_invalidation.py
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+import invalidation
+
+
+@pytest.fixture
+def handlers(monkeypatch):
+    monkeypatch.setattr(invalidation, "_handlers", {})
+    calls = []
+    invalidation.register("sub", lambda key: calls.append(("sub", key)))
+    invalidation.register("deep", lambda key: calls.append(("deep", key)))
+    return calls
+
+
+class Cursor:
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params=()):
+        self.executed.append((sql, params))
+
+
+def test_dispatch_routes_by_prefix(handlers):
+    invalidation._dispatch("sub:42")
+    invalidation._dispatch("deep:BTC")
+    invalidation._dispatch("other:1")
+    assert handlers == [("sub", "42"), ("deep", "BTC")]
+
+
+def test_failing_handler_does_not_stop_others(handlers):
+    invalidation.register("sub", lambda key: 1 / 0)
+    invalidation.register("sub", lambda key: handlers.append(("second", key)))
+    invalidation._dispatch("sub:7")
+    assert handlers == [("sub", "7"), ("second", "7")]
+
+
+def test_publish_in_transaction_waits_for_notify(handlers):
+    cur = Cursor()
+    invalidation.publish("sub:42", cur)
+    # تا commit و رسیدن NOTIFY، کش محلی دست نمی‌خورد
+    assert handlers == []
+    assert cur.executed == [("SELECT pg_notify(%s, %s)", (invalidation.CHANNEL, "sub:42"))]
+
+
+def test_notification_from_listener_evicts(handlers, monkeypatch):
+    conn = SimpleNamespace(poll=lambda: None,
+                           notifies=[SimpleNamespace(payload="sub:42"), SimpleNamespace(payload="deep:ETH")])
+    monkeypatch.setattr(invalidation, "_listen_conn", conn)
+    invalidation._on_readable()
+    assert handlers == [("sub", "42"), ("deep", "ETH")]
+    assert conn.notifies == []
+
+
+def test_reconnect_flushes_everything(handlers, monkeypatch):
+    monkeypatch.setattr(invalidation, "_listen_conn", None)
+    started = []
+    monkeypatch.setattr(invalidation, "start_listener", lambda: started.append(True))
+    asyncio.run(invalidation.ensure_listener())
+    assert started == [True]
+    assert sorted(handlers) == [("deep", None), ("sub", None)]
+
+
+def test_failed_reconnect_keeps_caches(handlers, monkeypatch):
+    monkeypatch.setattr(invalidation, "_listen_conn", None)
+
+    def fail():
+        raise OSError("db down")
+
+    monkeypatch.setattr(invalidation, "start_listener", fail)
+    asyncio.run(invalidation.ensure_listener())
+    assert handlers == []
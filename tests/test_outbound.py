@@ -0,0 +1,105 @@
+# tests/test_outbound.py
+import asyncio
+
+import pytest
+
+import outbound
+from outbound import OutboundLimiter, INTERACTIVE, BULK
+
+
+@pytest.fixture(autouse=True)
+def fast_buckets(monkeypatch):
+    # هر چت یک پیام پشت‌سرهم، بعد ۲۰ در ثانیه؛ درخواست‌های بعدی کوتاه در صف می‌مانند
+    monkeypatch.setattr(outbound, "OUTBOUND_CHAT_BURST", 1)
+    monkeypatch.setattr(outbound, "OUTBOUND_PRIVATE_RATE", 20.0)
+
+
+def run(scenario):
+    async def main():
+        limiter = OutboundLimiter()
+        await limiter.initialize()
+        try:
+            return await scenario(limiter)
+        finally:
+            await limiter.shutdown()
+    return asyncio.run(main())
+
+
+def recorder():
+    calls = []
+
+    async def callback(text):
+        calls.append(text)
+        return text
+    return calls, callback
+
+
+def request(limiter, callback, text, endpoint, priority=INTERACTIVE, **data):
+    data.setdefault("chat_id", 1)
+    return limiter.process_request(callback, (text,), {}, endpoint, data, priority)
+
+
+def test_queued_edits_of_one_message_are_merged():
+    calls, cb = recorder()
+
+    async def scenario(limiter):
+        await request(limiter, cb, "msg", "sendMessage")
+        edits = [asyncio.create_task(request(limiter, cb, f"edit {i}", "editMessageText", message_id=5))
+                 for i in range(3)]
+        results = await asyncio.gather(*edits)
+        return results, limiter.stats["merged_edits"]
+
+    results, merged = run(scenario)
+    assert calls == ["msg", "edit 2"]
+    assert results == ["edit 2"] * 3
+    assert merged == 2
+
+
+def test_edits_of_different_messages_are_not_merged():
+    calls, cb = recorder()
+
+    async def scenario(limiter):
+        await request(limiter, cb, "msg", "sendMessage")
+        await asyncio.gather(request(limiter, cb, "a", "editMessageText", message_id=5),
+                             request(limiter, cb, "b", "editMessageText", message_id=6))
+
+    run(scenario)
+    assert sorted(calls) == ["a", "b", "msg"]
+
+
+def test_delete_drops_queued_edits():
+    calls, cb = recorder()
+
+    async def scenario(limiter):
+        await request(limiter, cb, "msg", "sendMessage")
+        edit = asyncio.create_task(request(limiter, cb, "edit", "editMessageText", message_id=5))
+        await asyncio.sleep(0)
+        await request(limiter, cb, "delete", "deleteMessage", message_id=5)
+        return await edit, limiter.stats["dropped_edits"]
+
+    result, dropped = run(scenario)
+    assert calls == ["msg", "delete"]
+    assert result is True and dropped == 1
+
+
+def test_interactive_sent_before_bulk():
+    calls, cb = recorder()
+
+    async def scenario(limiter):
+        await request(limiter, cb, "first", "sendMessage")
+        bulk = asyncio.create_task(request(limiter, cb, "bulk", "sendMessage", BULK))
+        await asyncio.sleep(0)
+        await asyncio.gather(bulk, request(limiter, cb, "reply", "sendMessage"))
+
+    run(scenario)
+    assert calls == ["first", "reply", "bulk"]
+
+
+def test_unqueued_endpoints_bypass_scheduler():
+    calls, cb = recorder()
+
+    async def scenario(limiter):
+        return await request(limiter, cb, "ok", "answerCallbackQuery")
+
+    assert run(scenario) == "ok"
+    assert calls == ["ok"]
@@ -0,0 +1,63 @@
+# tests/test_rate_limit.py
+import pytest
+
+import rate_limit
+from rate_limit import TokenBuckets
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(rate_limit.time, "monotonic", clock)
+    return clock
+
+
+def test_burst_then_limited(clock):
+    buckets = TokenBuckets(capacity=3, per_minute=60)
+    assert [buckets.take(1) for _ in range(4)] == [True, True, True, False]
+    assert buckets.take(2)     # هر کاربر سطل خودش را دارد
+
+
+def test_refills_at_rate_up_to_capacity(clock):
+    buckets = TokenBuckets(capacity=2, per_minute=30)   # هر ۲ ثانیه یک توکن
+    assert buckets.take(1) and buckets.take(1)
+    clock.now += 1
+    assert not buckets.take(1)
+    clock.now += 1
+    assert buckets.take(1)
+    clock.now += 3600
+    assert [buckets.take(1) for _ in range(3)] == [True, True, False]
+
+
+def test_cost_and_rejected_take_keeps_tokens(clock):
+    buckets = TokenBuckets(capacity=5, per_minute=60)
+    assert buckets.take(1, cost=4)
+    assert not buckets.take(1, cost=2)
+    assert buckets.take(1, cost=1)
+
+
+def test_prune_drops_only_refilled_buckets(clock):
+    buckets = TokenBuckets(capacity=2, per_minute=60)
+    buckets.take(1)
+    clock.now += 1.5
+    buckets.take(2)
+    buckets.prune()
+    assert set(buckets.buckets) == {1, 2}
+    clock.now += 1             # سطل ۱ حالا بیش از ۲ ثانیه بی‌کار بوده و دوباره پر است
+    buckets.prune()
+    assert set(buckets.buckets) == {2}
+
+
+def test_module_prune_forgets_stale_warnings(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "_last_warned", {1: clock.now - rate_limit.WARN_INTERVAL - 1, 2: clock.now})
+    monkeypatch.setattr(rate_limit, "BUCKETS", TokenBuckets(capacity=2, per_minute=60))
+    rate_limit.prune()
+    assert rate_limit._last_warned == {2: clock.now}
@@ -0,0 +1,126 @@
+# tests/test_resilience.py
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+import resilience
+from resilience import Upstream, CircuitOpen, BudgetExceeded, CLOSED, OPEN, HALF_OPEN
+
+
+@pytest.fixture(autouse=True)
+def breaker_settings(monkeypatch):
+    monkeypatch.setattr(resilience, "BREAKER_MIN_CALLS", 4)
+    monkeypatch.setattr(resilience, "BREAKER_ERROR_RATE", 0.5)
+    monkeypatch.setattr(resilience, "BREAKER_COOLDOWN", 0.1)
+    monkeypatch.setattr(resilience, "HEDGE_DEFAULT_DELAY", 0.1)
+
+
+def fail():
+    raise ConnectionError("down")
+
+
+def http_error(status):
+    resp = requests.Response()
+    resp.status_code = status
+
+    def raise_():
+        raise requests.HTTPError(response=resp)
+    return raise_
+
+
+def trip(up):
+    for _ in range(resilience.BREAKER_MIN_CALLS):
+        with pytest.raises(ConnectionError):
+            up.call_sync(fail)
+
+
+def test_breaker_opens_and_short_circuits():
+    up = Upstream("test", budget=1)
+    assert up.call_sync(lambda: 42) == 42
+    for _ in range(3):   # ۳ خطا از ۴ فراخوانی
+        with pytest.raises(ConnectionError):
+            up.call_sync(fail)
+    assert up.state == OPEN and up.stats["trips"] == 1
+    with pytest.raises(CircuitOpen):
+        up.call_sync(lambda: 42)
+    assert up.stats["short_circuited"] == 1
+
+
+def test_client_errors_do_not_open_breaker():
+    up = Upstream("test", budget=1)
+    for _ in range(10):
+        with pytest.raises(requests.HTTPError):
+            up.call_sync(http_error(404))
+    assert up.state == CLOSED
+    with pytest.raises(requests.HTTPError):
+        up.call_sync(http_error(503))
+    assert up.stats["errors"] == 1
+
+
+def test_half_open_allows_single_probe_then_closes():
+    up = Upstream("test", budget=1)
+    trip(up)
+    time.sleep(resilience.BREAKER_COOLDOWN + 0.02)
+
+    release = threading.Event()
+    probe = threading.Thread(target=up.call_sync, args=(release.wait,))
+    probe.start()
+    while up.state != HALF_OPEN:
+        time.sleep(0.005)
+    with pytest.raises(CircuitOpen):
+        up.call_sync(lambda: 1)    # درخواست دوم در half-open رد می‌شود
+    release.set()
+    probe.join()
+    assert up.state == CLOSED
+    assert up.call_sync(lambda: 1) == 1
+
+
+def test_failed_probe_reopens():
+    up = Upstream("test", budget=1)
+    trip(up)
+    time.sleep(resilience.BREAKER_COOLDOWN + 0.02)
+    with pytest.raises(ConnectionError):
+        up.call_sync(fail)
+    assert up.state == OPEN
+    with pytest.raises(CircuitOpen):
+        up.call_sync(lambda: 1)
+
+
+def test_budget_exceeded():
+    up = Upstream("test", budget=0.05)
+    with pytest.raises(BudgetExceeded):
+        up.call_sync(time.sleep, 0.3)
+    assert up.stats["timeouts"] == 1
+
+
+def test_hedge_wins_when_first_request_stalls():
+    up = Upstream("test", budget=1, hedge=True)
+    calls = []
+
+    def slow_then_fast():
+        calls.append(1)
+        time.sleep(0.8 if len(calls) == 1 else 0)
+        return len(calls)
+
+    assert up.call_sync(slow_then_fast) == 2
+    assert up.stats["hedged"] == 1 and up.stats["hedge_wins"] == 1
+
+
+def test_async_call_records_outcomes():
+    up = Upstream("test", budget=1)
+
+    async def run():
+        assert await up.call(lambda: "ok") == "ok"
+        with pytest.raises(ConnectionError):
+            await up.call(fail)
+
+    asyncio.run(run())
+    assert up.stats["ok"] == 1 and up.stats["errors"] == 1
+
+
+def test_paid_upstreams_are_not_hedged():
+    assert not resilience.CMC.hedge and not resilience.OPENAI.hedge
+    assert resilience.BINANCE.hedge
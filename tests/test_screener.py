@@ -0,0 +1,78 @@
+# tests/test_screener.py
+import time
+
+import numpy as np
+
+import screener
+import technical_analysis
+
+
+def zigzag_series(legs, start=100.0, bars=15):
+    """قیمت‌های کلوز با حرکت‌های خطی؛ هر عضو legs درصد تغییر یک موج است"""
+    prices, price = [start], start
+    for pct in legs:
+        target = price * (1 + pct / 100)
+        prices.extend(np.linspace(price, target, bars + 1)[1:])
+        price = target
+    return np.array(prices)
+
+
+def row_for(close):
+    open_time = np.arange(len(close), dtype=np.int64) * 14_400_000
+    rows = screener.classify_batch([("TEST", close, open_time)])
+    return rows[0] if rows else None
+
+
+def test_classify_batch_reports_last_pivot():
+    close = zigzag_series([20, -20, 25, -10])
+    row = row_for(close)
+    pivots = technical_analysis.zig_zag(close, depth=12, deviation=5, backstep=3)
+    idx, pivot_price, ptype = pivots[-1]
+    assert row["trend"] == technical_analysis.classify_trend(pivots)[0]
+    assert (row["pivot_type"], row["pivot_price"]) == (ptype, pivot_price)
+    assert row["bars_since_pivot"] == len(close) - 1 - idx
+    assert row["price"] == close[-1]
+    assert row["move_pct"] == (close[-1] - pivot_price) / pivot_price * 100
+
+
+def test_flat_series_is_skipped():
+    assert row_for(np.full(300, 50.0)) is None
+
+
+def test_rank_and_fresh_reversals(monkeypatch):
+    rows = [
+        {"symbol": "OLD", "trend": screener.BULLISH, "bars_since_pivot": 9, "move_pct": 30.0},
+        {"symbol": "SMALL", "trend": screener.BULLISH, "bars_since_pivot": 1, "move_pct": 2.0},
+        {"symbol": "BIG", "trend": screener.BULLISH, "bars_since_pivot": 1, "move_pct": -8.0},
+        {"symbol": "DOWN", "trend": screener.BEARISH, "bars_since_pivot": 0, "move_pct": -3.0},
+    ]
+    ranked = screener._rank(rows)
+    assert [r["symbol"] for r in ranked] == ["DOWN", "BIG", "SMALL", "OLD"]
+
+    monkeypatch.setitem(screener.RESULTS, "rows", ranked)
+    assert [r["symbol"] for r in screener.fresh_reversals(screener.BULLISH, max_bars=6)] == ["BIG", "SMALL"]
+    assert [r["symbol"] for r in screener.fresh_reversals(screener.BULLISH, limit=1, max_bars=20)] == ["BIG"]
+    assert [r["symbol"] for r in screener.fresh_reversals(screener.BEARISH)] == ["DOWN"]
+
+
+def test_klines_weight():
+    assert [screener.klines_weight(n) for n in (50, 300, 500, 1000)] == [1, 2, 5, 10]
+
+
+def test_fetch_universe_uses_closed_analysis_window(monkeypatch):
+    close = zigzag_series([20, -20, 25, -10, 15] * 4)[-technical_analysis.CACHED_CANDLES:]
+    step = 14_400_000
+    start = int(time.time() * 1000) - (len(close) - 1) * step - 3_600_000
+    raw = [[start + i * step, str(c), str(c), str(c), str(c), "1", start + (i + 1) * step - 1]
+           for i, c in enumerate(close)]                  # کندل آخر هنوز در حال تشکیل است
+
+    class Client:
+        def get_klines(self, symbol, interval, limit):
+            assert limit == technical_analysis.CACHED_CANDLES
+            return raw
+
+    monkeypatch.setattr(technical_analysis, "get_client", lambda: Client())
+    (symbol, close, open_time), = screener.fetch_universe(["BTC"])[0]
+    window = technical_analysis.analysis_window(screener._fetch_one("BTC")[1])
+    assert symbol == "BTC" and len(close) == technical_analysis.ANALYSIS_WINDOW
+    assert close[-1] == float(raw[-2][4]) and list(close) == list(window.close)
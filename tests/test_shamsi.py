@@ -0,0 +1,52 @@
+# tests/test_shamsi.py
+import random
+from datetime import datetime, timezone
+
+import jdatetime
+import pytest
+
+import shamsi
+
+FORMATS = [shamsi.FORMAT_TECH, shamsi.FORMAT_USER, "%Y-%m-%d %H:%M:%S", "%d %% %m", "%A %Y/%m/%d"]
+
+
+@pytest.fixture(autouse=True)
+def fresh_cache():
+    shamsi.clear()
+    yield
+    shamsi.clear()
+
+
+def expected(ms: int, fmt: str) -> str:
+    dt = datetime.fromtimestamp(ms / 1000, tz=timezone.utc).replace(tzinfo=None)
+    return jdatetime.datetime.fromgregorian(datetime=dt).strftime(fmt)
+
+
+def sample_ms():
+    rng = random.Random(7)
+    start = int(datetime(2017, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    end = int(datetime(2030, 1, 1, tzinfo=timezone.utc).timestamp() * 1000)
+    # نوروزها و مرز سال‌های کبیسه هم جزو نمونه‌ها هستند
+    edges = [int(datetime(y, 3, d, h, tzinfo=timezone.utc).timestamp() * 1000)
+             for y in range(2020, 2027) for d in (19, 20, 21, 22) for h in (0, 23)]
+    return edges + [rng.randrange(start, end) for _ in range(500)]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_format_ms_many_matches_jdatetime(fmt):
+    values = sample_ms()
+    assert shamsi.format_ms_many(values, fmt) == [expected(ms, fmt) for ms in values]
+    # دور دوم از کش
+    assert shamsi.format_ms_many(values, fmt) == [expected(ms, fmt) for ms in values]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_format_datetime_matches_jdatetime(fmt):
+    dt = datetime(2025, 3, 20, 9, 5, 7)
+    assert shamsi.format_datetime(dt, fmt) == jdatetime.datetime.fromgregorian(datetime=dt).strftime(fmt)
+
+
+def test_memo_is_bounded(monkeypatch):
+    monkeypatch.setattr(shamsi, "SHAMSI_CACHE_SIZE", 10)
+    shamsi.format_ms_many(range(0, 50 * 3_600_000, 3_600_000))
+    assert len(shamsi._memo) == 10
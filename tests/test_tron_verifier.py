@@ -0,0 +1,214 @@
+# tests/test_tron_verifier.py
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import tron_verifier as tv
+from tron_verifier import OK, WAIT, FLAG
+
+RECIPIENT = "41" + "ab" * 20
+OTHER = "41" + "cd" * 20
+HEAD = 1_000
+SUBMITTED = datetime(2026, 1, 1, 12, 0, tzinfo=timezone.utc)
+TEHRAN = timezone(timedelta(hours=3, minutes=30))
+EXPECTED = tv.SUBSCRIPTION_PRICE_SUN + 4_200
+
+
+def make_tx(amount=EXPECTED, to=RECIPIENT, signed=SUBMITTED - timedelta(minutes=3),
+            kind="TransferContract", ret="SUCCESS"):
+    raw = {"contract": [{"type": kind, "parameter": {"value": {"to_address": to, "amount": amount}}}]}
+    if signed is not None:
+        raw["timestamp"] = int(signed.timestamp() * 1000)
+    return {"txID": "ab" * 32, "ret": [{"contractRet": ret}], "raw_data": raw}
+
+
+def check(tx, info=None, expected=EXPECTED, submitted=SUBMITTED):
+    info = {"blockNumber": HEAD - 30} if info is None else info
+    return tv.check_transfer(tx, info, HEAD, RECIPIENT, expected, submitted)
+
+
+def test_exact_amount_confirmed_is_approved():
+    status, amount, _ = check(make_tx())
+    assert (status, amount) == (OK, EXPECTED)
+
+
+def test_missing_tx_waits():
+    assert check({}, {})[0] == WAIT
+
+
+def test_unconfirmed_waits():
+    assert check(make_tx(), {"blockNumber": HEAD - 2})[0] == WAIT
+    assert check(make_tx(), {})[0] == WAIT
+
+
+@pytest.mark.parametrize("tx", [
+    make_tx(to=OTHER),
+    make_tx(amount=tv.SUBSCRIPTION_PRICE_SUN - 1),
+    make_tx(kind="TriggerSmartContract"),
+    make_tx(ret="REVERT"),
+])
+def test_invalid_transfer_is_flagged(tx):
+    assert check(tx)[0] == FLAG
+
+
+def test_other_users_amount_is_flagged():
+    # هش پرداخت کاربر دیگری (با مبلغ یکتای خودش) به نام این کاربر ثبت شده
+    status, amount, reason = check(make_tx(amount=EXPECTED + tv.QUOTE_STEP_SUN))
+    assert status == FLAG and amount == EXPECTED + tv.QUOTE_STEP_SUN
+    assert "نمی‌خواند" in reason
+
+
+def test_payment_without_quote_is_flagged():
+    assert check(make_tx(), expected=None)[0] == FLAG
+
+
+def test_old_transfer_is_flagged():
+    old = SUBMITTED - timedelta(hours=tv.TRON_TX_MAX_AGE_HOURS, minutes=1)
+    assert check(make_tx(signed=old))[0] == FLAG
+
+
+def test_transfer_after_submission_is_flagged():
+    later = SUBMITTED + timedelta(minutes=tv.TRON_CLOCK_SKEW_MINUTES + 1)
+    assert check(make_tx(signed=later))[0] == FLAG
+
+
+def test_block_time_used_without_raw_timestamp():
+    block_ms = int((SUBMITTED - timedelta(minutes=1)).timestamp() * 1000)
+    tx = make_tx(signed=None)
+    assert check(tx, {"blockNumber": HEAD - 30, "blockTimeStamp": block_ms})[0] == OK
+    assert check(tx, {"blockNumber": HEAD - 30})[0] == FLAG
+
+
+def test_format_trx():
+    assert tv.format_trx(5_000_000) == "5"
+    assert tv.format_trx(5_012_300) == "5.0123"
+
+
+def test_address_to_hex_roundtrip():
+    assert tv.address_to_hex("T9yD14Nj9j7xAB4dbGeiX9h8unkKHxuWwb") == "41" + "00" * 20
+    with pytest.raises(ValueError):
+        tv.address_to_hex("T9yD14Nj9j7xAB4dbGeiX9h8unkKHxuWwc")
+
+
+def test_submission_window_is_timezone_independent(monkeypatch):
+    # created_at از TIMESTAMPTZ در منطقهٔ زمانی نشست دیتابیس برمی‌گردد؛ ساعت میزبان هم فرق دارد
+    monkeypatch.setenv("TZ", "America/New_York")
+    time.tzset()
+    try:
+        submitted = SUBMITTED.astimezone(TEHRAN)
+        assert check(make_tx(), submitted=submitted)[0] == OK
+        late = make_tx(signed=SUBMITTED + timedelta(minutes=tv.TRON_CLOCK_SKEW_MINUTES + 1))
+        assert check(late, submitted=submitted)[0] == FLAG
+        assert tv._tx_time(make_tx(), {}) == SUBMITTED - timedelta(minutes=3)
+    finally:
+        monkeypatch.undo()
+        time.tzset()
+
+
+def test_window_edges_are_inclusive():
+    oldest = SUBMITTED - timedelta(hours=tv.TRON_TX_MAX_AGE_HOURS)
+    latest = SUBMITTED + timedelta(minutes=tv.TRON_CLOCK_SKEW_MINUTES)
+    assert check(make_tx(signed=oldest))[0] == OK
+    assert check(make_tx(signed=latest))[0] == OK
+
+
+def test_overpayment_is_flagged_not_approved():
+    status, _, reason = check(make_tx(amount=EXPECTED + 1))
+    assert status == FLAG and tv.format_trx(EXPECTED) in reason
+
+
+# -------------------------
+# apply_results روی یک اتصال ساختگی
+# -------------------------
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self.result = None
+
+    def execute(self, sql, params=()):
+        sql = " ".join(sql.split())
+        self.db.executed.append((sql, params))
+        if sql.startswith("SELECT status FROM payments"):
+            self.result = {"status": self.db.status}
+        elif sql.startswith("SELECT 1 FROM payments"):
+            self.result = (1,) if self.db.duplicate else None
+        else:
+            self.result = None
+
+    def fetchone(self):
+        return self.result
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, status="pending", duplicate=False):
+        self.status = status
+        self.duplicate = duplicate
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        pass
+
+    def statements(self, prefix):
+        return [params for sql, params in self.executed if sql.startswith(prefix)]
+
+
+def payment(note=None, age=timedelta(minutes=5)):
+    return {"id": 7, "telegram_id": 42, "tx_hash": "ab" * 32, "note": note,
+            "created_at": datetime.now(timezone.utc) - age, "expected_sun": EXPECTED}
+
+
+def apply(monkeypatch, db, *results):
+    monkeypatch.setattr(tv, "get_db_connection", lambda: db)
+    activated = []
+
+    def activate(telegram_id, days, cur):
+        activated.append((telegram_id, days))
+        return datetime(2026, 2, 1)
+
+    return tv.apply_results(list(results), activate), activated
+
+
+def test_apply_approves_and_consumes_quote(monkeypatch):
+    db = FakeDB()
+    p = payment()
+    events, activated = apply(monkeypatch, db, (p, OK, EXPECTED, "20 تأیید"))
+    assert events == [("approved", p, datetime(2026, 2, 1))]
+    assert activated == [(42, tv.SUBSCRIPTION_DAYS)]
+    assert db.statements("DELETE FROM payment_quotes") == [(42, EXPECTED)]
+
+
+def test_apply_rejects_reused_hash(monkeypatch):
+    db = FakeDB(duplicate=True)
+    events, activated = apply(monkeypatch, db, (payment(), OK, EXPECTED, "20 تأیید"))
+    assert [e[0] for e in events] == ["rejected"] and not activated
+
+
+def test_apply_flags_once_and_escalates_stale_waits(monkeypatch):
+    db = FakeDB()
+    mismatch = (payment(), FLAG, EXPECTED + 1, "مبلغ نمی‌خواند")
+    already = (payment(note="بررسی دستی: قبلی"), FLAG, EXPECTED + 1, "مبلغ نمی‌خواند")
+    fresh_wait = (payment(), WAIT, None, "تراکنش روی شبکه پیدا نشد")
+    stale_wait = (payment(age=timedelta(hours=tv.TRON_NOT_FOUND_HOURS + 1)), WAIT, None, "تراکنش روی شبکه پیدا نشد")
+    events, activated = apply(monkeypatch, db, mismatch, already, fresh_wait, stale_wait)
+    assert [(kind, p) for kind, p, _ in events] == [("flagged", mismatch[0]), ("flagged", stale_wait[0])]
+    assert not activated
+
+
+def test_apply_skips_payments_decided_by_admin(monkeypatch):
+    db = FakeDB(status="approved")
+    events, activated = apply(monkeypatch, db, (payment(), OK, EXPECTED, "20 تأیید"))
+    assert events == [] and not activated
@@ -0,0 +1,365 @@
+# tron_verifier.py
+# تأیید خودکار پرداخت‌های ترون: پرداخت‌های pending دوره‌ای و دسته‌ای از API نود ترون
+# (TronGrid یا سازگار با آن، TRON_API_URL) بررسی می‌شوند. اگر گیرنده TRON_ADDRESS باشد،
+# مبلغ کافی باشد و تراکنش به تعداد لازم تأیید شده باشد، اشتراک و وضعیت پرداخت در یک تراکنش
+# دیتابیس ثبت می‌شود. موارد مشکوک (گیرندهٔ اشتباه، مبلغ کم، تراکنش ناموفق، پیدا نشدن)
+# با یادداشت برای بررسی دستی ادمین باقی می‌مانند.
+# هر کاربر پیش از پرداخت یک مبلغ یکتا می‌گیرد (قیمت + چند sun، payment_quotes) و تراکنش فقط
+# وقتی خودکار تأیید می‌شود که دقیقاً همان مبلغ باشد و زمانش به زمان ثبت هش نزدیک باشد؛ تا کسی
+# نتواند هش پرداخت دیگری (یا یک انتقال قدیمی) را به نام خودش ثبت کند.
+import logging
+import os
+import asyncio
+import hashlib
+import secrets
+from datetime import datetime, timedelta, timezone
+
+import aiohttp
+import psycopg2
+from psycopg2.extras import DictCursor
+
+import outbound
+
+logger = logging.getLogger(__name__)
+
+DATABASE_URL = os.getenv("DATABASE_URL")
+TRON_ADDRESS = os.getenv("TRON_ADDRESS")
+INFO_CHANNEL = os.getenv("INFO_CHANNEL")
+TRON_API_URL = os.getenv("TRON_API_URL", "https://api.trongrid.io").rstrip("/")
+TRON_API_KEY = os.getenv("TRON_API_KEY")
+SUBSCRIPTION_PRICE_SUN = int(float(os.getenv("SUBSCRIPTION_PRICE_TRX", "5")) * 1_000_000)
+SUBSCRIPTION_DAYS = 30
+TRON_MIN_CONFIRMATIONS = int(os.getenv("TRON_MIN_CONFIRMATIONS", "19"))   # ~۱ دقیقه؛ بلاک قطعی
+TRON_VERIFY_BATCH = int(os.getenv("TRON_VERIFY_BATCH", "50"))
+TRON_VERIFY_CONCURRENCY = int(os.getenv("TRON_VERIFY_CONCURRENCY", "8"))
+TRON_NOT_FOUND_HOURS = int(os.getenv("TRON_NOT_FOUND_HOURS", "6"))       # بعد از این، تراکنش پیدانشده به ادمین سپرده می‌شود
+TRON_TX_MAX_AGE_HOURS = float(os.getenv("TRON_TX_MAX_AGE_HOURS", "24"))   # تراکنش قدیمی‌تر از این نسبت به ثبت هش → ادمین
+TRON_CLOCK_SKEW_MINUTES = float(os.getenv("TRON_CLOCK_SKEW_MINUTES", "5"))
+TRON_QUOTE_DAYS = int(os.getenv("TRON_QUOTE_DAYS", "7"))                  # اعتبار مبلغ یکتای هر کاربر
+QUOTE_STEP_SUN = 100          # مبلغ یکتا = قیمت + k * 0.0001 TRX
+QUOTE_SLOTS = 9999
+TRON_TIMEOUT = 10
+
+STATS = {"runs": 0, "checked": 0, "approved": 0, "rejected": 0, "flagged": 0, "errors": 0}
+
+_lock = asyncio.Lock()
+
+# وضعیت بررسی هر تراکنش
+OK, WAIT, FLAG, DUPLICATE = "ok", "wait", "flag", "duplicate"
+
+
+def get_db_connection():
+    return psycopg2.connect(DATABASE_URL, cursor_factory=DictCursor)
+
+def init_tron_table():
+    """ستون‌های لازم برای تأیید خودکار روی جدول payments"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS amount_sun BIGINT;")
+    cur.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS checked_at TIMESTAMP;")
+    cur.execute("ALTER TABLE payments ADD COLUMN IF NOT EXISTS expected_sun BIGINT;")
+    # زمان ثبت هش با زمان تراکنش (UTC) مقایسه می‌شود؛ بدون منطقهٔ زمانی به ساعت نشست دیتابیس وابسته بود
+    cur.execute("""
+        SELECT data_type FROM information_schema.columns
+        WHERE table_name = 'payments' AND column_name = 'created_at'
+    """)
+    row = cur.fetchone()
+    if row and row["data_type"] == "timestamp without time zone":
+        cur.execute("ALTER TABLE payments ALTER COLUMN created_at TYPE TIMESTAMPTZ;")
+    # مبلغ یکتای هر کاربر تا پرداخت بعدی؛ یکتایی مبلغ شناسهٔ پرداخت است
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS payment_quotes (
+            telegram_id BIGINT PRIMARY KEY,
+            amount_sun BIGINT NOT NULL UNIQUE,
+            created_at TIMESTAMPTZ DEFAULT NOW()
+        );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS payments_pending_idx ON payments (created_at) WHERE status = 'pending';")
+    # یک هش فقط یک بار می‌تواند اشتراک بدهد (چه با تأیید ادمین چه خودکار)
+    cur.execute("""
+        CREATE UNIQUE INDEX IF NOT EXISTS payments_tx_approved_idx
+        ON payments (tx_hash) WHERE status = 'approved';
+    """)
+    conn.commit()
+    cur.close()
+    conn.close()
+    logger.info("ستون‌های تأیید خودکار پرداخت آماده است.")
+
+
+# -------------------------
+# آدرس ترون (base58check ↔ hex)
+# -------------------------
+_B58 = "123456789ABCDEFGHJKLMNPQRSTUVWXYZabcdefghijkmnopqrstuvwxyz"
+
+def address_to_hex(address: str) -> str:
+    """T... (base58check) → 41... (hex، همان قالب to_address در API)"""
+    if address.startswith("41") and len(address) == 42:
+        return address.lower()
+    num = 0
+    for ch in address:
+        num = num * 58 + _B58.index(ch)
+    raw = num.to_bytes(25, "big")
+    payload, checksum = raw[:-4], raw[-4:]
+    if hashlib.sha256(hashlib.sha256(payload).digest()).digest()[:4] != checksum:
+        raise ValueError("checksum آدرس ترون نامعتبر است")
+    return payload.hex()
+
+
+# -------------------------
+# مبلغ یکتای هر کاربر
+# -------------------------
+def payment_quote(telegram_id: int) -> int:
+    """مبلغ (sun) که این کاربر باید دقیقاً همان را واریز کند؛ اگر نداشت یا منقضی شده، مبلغ تازه"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        cur.execute("DELETE FROM payment_quotes WHERE created_at < NOW() - %s * INTERVAL '1 day'", (TRON_QUOTE_DAYS,))
+        cur.execute("SELECT amount_sun FROM payment_quotes WHERE telegram_id = %s", (telegram_id,))
+        row = cur.fetchone()
+        for _ in range(10):
+            if row:
+                break
+            amount = SUBSCRIPTION_PRICE_SUN + (secrets.randbelow(QUOTE_SLOTS) + 1) * QUOTE_STEP_SUN
+            cur.execute("""
+                INSERT INTO payment_quotes (telegram_id, amount_sun) VALUES (%s, %s)
+                ON CONFLICT DO NOTHING
+                RETURNING amount_sun
+            """, (telegram_id, amount))
+            row = cur.fetchone()
+        conn.commit()
+        if not row:
+            raise RuntimeError("مبلغ یکتای آزاد پیدا نشد")
+        return row["amount_sun"]
+    finally:
+        cur.close()
+        conn.close()
+
+
+def format_trx(sun: int) -> str:
+    return f"{sun / 1_000_000:.4f}".rstrip("0").rstrip(".")
+
+
+def _tx_time(tx: dict, info: dict):
+    """زمان امضای تراکنش (raw_data.timestamp) یا در نبودش زمان بلاک، به UTC"""
+    ms = tx.get("raw_data", {}).get("timestamp") or info.get("blockTimeStamp")
+    return datetime.fromtimestamp(int(ms) / 1000, tz=timezone.utc) if ms else None
+
+
+# -------------------------
+# API نود
+# -------------------------
+async def _post(session: aiohttp.ClientSession, path: str, payload: dict) -> dict:
+    async with session.post(f"{TRON_API_URL}{path}", json=payload) as resp:
+        resp.raise_for_status()
+        return await resp.json(content_type=None)
+
+
+async def fetch_transaction(session, tx_hash: str) -> tuple:
+    """(تراکنش، اطلاعات تراکنش) — اگر هنوز روی شبکه نیست، دیکشنری خالی"""
+    tx = await _post(session, "/wallet/gettransactionbyid", {"value": tx_hash})
+    info = await _post(session, "/wallet/gettransactioninfobyid", {"value": tx_hash}) if tx else {}
+    return tx or {}, info or {}
+
+
+def check_transfer(tx: dict, info: dict, head_block: int, recipient_hex: str,
+                   expected_sun: int = None, submitted_at: datetime = None) -> tuple:
+    """
+    (وضعیت، مبلغ به sun، توضیح). expected_sun مبلغ یکتای کاربر و submitted_at زمان ثبت هش است
+    (با منطقهٔ زمانی، همان created_at از ستون TIMESTAMPTZ)؛ تراکنشی که با این دو نخواند هرگز خودکار تأیید نمی‌شود و به ادمین می‌رود.
+    """
+    if not tx:
+        return WAIT, None, "تراکنش روی شبکه پیدا نشد"
+    contracts = tx.get("raw_data", {}).get("contract") or []
+    if not contracts or contracts[0].get("type") != "TransferContract":
+        return FLAG, None, "تراکنش انتقال TRX نیست"
+    value = contracts[0].get("parameter", {}).get("value", {})
+    amount = int(value.get("amount", 0))
+    if (tx.get("ret") or [{}])[0].get("contractRet") not in (None, "SUCCESS"):
+        return FLAG, amount, "تراکنش ناموفق است"
+    if str(value.get("to_address", "")).lower() != recipient_hex:
+        return FLAG, amount, "گیرنده آدرس ربات نیست"
+    if amount < SUBSCRIPTION_PRICE_SUN:
+        return FLAG, amount, f"مبلغ کمتر از {SUBSCRIPTION_PRICE_SUN / 1_000_000:g} TRX است"
+    if expected_sun is None:
+        return FLAG, amount, "مبلغ یکتایی برای این کاربر صادر نشده بود"
+    if amount != expected_sun:
+        return FLAG, amount, f"مبلغ {format_trx(amount)} TRX با مبلغ کاربر ({format_trx(expected_sun)} TRX) نمی‌خواند"
+    tx_time = _tx_time(tx, info)
+    if tx_time is None and not info.get("blockNumber"):
+        return WAIT, amount, "هنوز در بلاک ثبت نشده"
+    if tx_time is None or submitted_at is None:
+        return FLAG, amount, "زمان تراکنش معلوم نیست"
+    if tx_time < submitted_at - timedelta(hours=TRON_TX_MAX_AGE_HOURS):
+        return FLAG, amount, f"تراکنش بیش از {TRON_TX_MAX_AGE_HOURS:g} ساعت قبل از ثبت هش انجام شده"
+    if tx_time > submitted_at + timedelta(minutes=TRON_CLOCK_SKEW_MINUTES):
+        return FLAG, amount, "زمان تراکنش بعد از ثبت هش است"
+    block = info.get("blockNumber")
+    if not block:
+        return WAIT, amount, "هنوز در بلاک ثبت نشده"
+    confirmations = head_block - int(block)
+    if confirmations < TRON_MIN_CONFIRMATIONS:
+        return WAIT, amount, f"{confirmations}/{TRON_MIN_CONFIRMATIONS} تأیید"
+    return OK, amount, f"{confirmations} تأیید"
+
+
+# -------------------------
+# دیتابیس
+# -------------------------
+def pending_payments(limit: int) -> list:
+    """قدیمی‌ترین‌هایی که کمتر اخیراً بررسی شده‌اند اول"""
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT id, telegram_id, tx_hash, note, created_at, expected_sun
+        FROM payments
+        WHERE status = 'pending'
+        ORDER BY checked_at NULLS FIRST, created_at
+        LIMIT %s
+    """, (limit,))
+    rows = cur.fetchall()
+    cur.close()
+    conn.close()
+    return rows
+
+
+def apply_results(results: list, activate) -> list:
+    """
+    همهٔ نتایج یک دور در یک اتصال؛ هر پرداخت تأییدشده در یک تراکنش دیتابیس:
+    قفل ردیف، بررسی تکراری نبودن هش، تمدید اشتراک (activate با همان cur) و ثبت وضعیت.
+    خروجی: رویدادها برای اطلاع‌رسانی (نوع، ردیف پرداخت، جزئیات).
+    """
+    events = []
+    now = datetime.now()
+    conn = get_db_connection()
+    cur = conn.cursor()
+    try:
+        for payment, status, amount, reason in results:
+            try:
+                cur.execute("SELECT status FROM payments WHERE id = %s FOR UPDATE", (payment["id"],))
+                row = cur.fetchone()
+                if not row or row["status"] != "pending":
+                    conn.rollback()
+                    continue   # ادمین زودتر تصمیم گرفته
+
+                if status == OK:
+                    cur.execute("SELECT 1 FROM payments WHERE tx_hash = %s AND status = 'approved' AND id <> %s",
+                                (payment["tx_hash"], payment["id"]))
+                    if cur.fetchone():
+                        status, reason = DUPLICATE, "این هش قبلاً استفاده شده"
+
+                if status == OK:
+                    new_expiry = activate(payment["telegram_id"], SUBSCRIPTION_DAYS, cur=cur)
+                    cur.execute("""
+                        UPDATE payments SET status = 'approved', processed_at = %s, checked_at = %s,
+                            amount_sun = %s, note = %s
+                        WHERE id = %s
+                    """, (now, now, amount, f"تأیید خودکار: {reason}", payment["id"]))
+                    # مبلغ یکتا مصرف شد؛ پرداخت بعدی مبلغ تازه می‌گیرد
+                    cur.execute("DELETE FROM payment_quotes WHERE telegram_id = %s AND amount_sun = %s",
+                                (payment["telegram_id"], amount))
+                    events.append(("approved", payment, new_expiry))
+                elif status == DUPLICATE:
+                    cur.execute("""
+                        UPDATE payments SET status = 'rejected', processed_at = %s, checked_at = %s, note = %s
+                        WHERE id = %s
+                    """, (now, now, f"رد خودکار: {reason}", payment["id"]))
+                    events.append(("rejected", payment, reason))
+                else:
+                    expired = datetime.now(timezone.utc) - payment["created_at"] > timedelta(hours=TRON_NOT_FOUND_HOURS)
+                    if status == WAIT and expired:
+                        status = FLAG
+                    note = f"بررسی دستی: {reason}" if status == FLAG else None
+                    cur.execute("""
+                        UPDATE payments SET checked_at = %s, amount_sun = COALESCE(%s, amount_sun),
+                            note = COALESCE(%s, note)
+                        WHERE id = %s
+                    """, (now, amount, note, payment["id"]))
+                    # فقط اولین بار به ادمین خبر داده می‌شود
+                    if status == FLAG and not (payment["note"] or "").startswith("بررسی دستی"):
+                        events.append(("flagged", payment, reason))
+                conn.commit()
+            except psycopg2.IntegrityError:
+                # همزمان با ادمین همین هش برای پرداخت دیگری تأیید شد
+                conn.rollback()
+            except Exception as e:
+                conn.rollback()
+                STATS["errors"] += 1
+                logger.error("خطا در ثبت نتیجهٔ پرداخت #%s: %s", payment["id"], e, extra={"event": "tron.apply_error", "payment": payment["id"]})
+    finally:
+        cur.close()
+        conn.close()
+    return events
+
+
+# -------------------------
+# اجرای دوره‌ای
+# -------------------------
+async def _notify(bot, events: list, format_date):
+    for kind, payment, detail in events:
+        try:
+            if kind == "approved":
+                STATS["approved"] += 1
+                await bot.send_message(payment["telegram_id"],
+                                       f"پرداخت تأیید شد!\nاشتراک تا {format_date(detail)} فعال شد")
+                text = f"✅ پرداخت #{payment['id']} خودکار تأیید شد (کاربر <code>{payment['telegram_id']}</code>)"
+            elif kind == "rejected":
+                STATS["rejected"] += 1
+                await bot.send_message(payment["telegram_id"], "پرداخت معتبر نبود. با ادمین تماس بگیر.")
+                text = f"❌ پرداخت #{payment['id']} خودکار رد شد: {detail}"
+            else:
+                STATS["flagged"] += 1
+                text = (f"⚠️ پرداخت #{payment['id']} نیاز به بررسی دستی دارد: {detail}\n"
+                        f"هش: <code>{payment['tx_hash']}</code>")
+            if INFO_CHANNEL:
+                await bot.send_message(int(INFO_CHANNEL), text, parse_mode="HTML", rate_limit_args=outbound.BULK)
+        except Exception as e:
+            logger.error("خطا در اطلاع‌رسانی پرداخت #%s: %s", payment["id"], e, extra={"event": "tron.notify_error", "payment": payment["id"]})
+
+
+async def verify_pending(bot, activate, format_date=str):
+    """
+    یک دور: خواندن دسته‌ای pendingها، یک بار ارتفاع بلاک، بررسی همزمان (با سقف) همهٔ هش‌ها
+    روی یک نشست HTTP، سپس ثبت نتایج. activate همان activate_user_subscription(telegram_id, days, cur)
+    و format_date قالب تاریخ پیام کاربر است (main.to_shamsi).
+    """
+    if not TRON_ADDRESS or _lock.locked():
+        return
+    async with _lock:
+        STATS["runs"] += 1
+        loop = asyncio.get_running_loop()
+        try:
+            payments = await loop.run_in_executor(None, pending_payments, TRON_VERIFY_BATCH)
+            if not payments:
+                return
+            recipient = address_to_hex(TRON_ADDRESS)
+            headers = {"TRON-PRO-API-KEY": TRON_API_KEY} if TRON_API_KEY else {}
+            semaphore = asyncio.Semaphore(TRON_VERIFY_CONCURRENCY)
+            async with aiohttp.ClientSession(headers=headers, timeout=aiohttp.ClientTimeout(total=TRON_TIMEOUT)) as session:
+                head = await _post(session, "/wallet/getnowblock", {})
+                head_block = int(head["block_header"]["raw_data"]["number"])
+
+                async def check(payment):
+                    async with semaphore:
+                        try:
+                            tx, info = await fetch_transaction(session, payment["tx_hash"])
+                        except Exception as e:
+                            STATS["errors"] += 1
+                            logger.warning("خطا در استعلام تراکنش %s: %s", payment["tx_hash"], e, extra={"event": "tron.fetch_error", "payment": payment["id"]})
+                            return None
+                    return (payment, *check_transfer(tx, info, head_block, recipient,
+                                                     payment["expected_sun"], payment["created_at"]))
+
+                results = [r for r in await asyncio.gather(*(check(p) for p in payments)) if r]
+            STATS["checked"] += len(results)
+            events = await loop.run_in_executor(None, apply_results, results, activate)
+            await _notify(bot, events, format_date)
+        except Exception as e:
+            STATS["errors"] += 1
+            logger.error("خطا در تأیید خودکار پرداخت‌ها: %s", e, extra={"event": "tron.verify_error"})
+
+
+def stats_text() -> str:
+    return (
+        f"تأیید خودکار ترون: {STATS['runs']} دور، {STATS['checked']} بررسی\n"
+        f"تأیید: {STATS['approved']} | رد: {STATS['rejected']} | ارجاع به ادمین: {STATS['flagged']} | خطا: {STATS['errors']}"
+    )